@@ -0,0 +1,145 @@
+'''
+Per-run setup cost of the node agents and of provider connections, before and after
+sharing them: agents built by every node instance against one registry per
+orchestrator, and a fresh or short keep-alive HTTP client against the pooled one
+
+    uv run python benchmarks/agent_setup.py --runs 50 --retries 1 --requests 5 --idle 0
+'''
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+
+import httpx
+from pydantic_ai import Agent,ModelSettings
+from pydantic_ai.models.test import TestModel
+
+from propercode.agents.nodes import CONTEXT_SYSTEM_PROMPT,PLAN_SYSTEM_PROMPT,CODE_SYSTEM_PROMPT,EVAL_SYSTEM_PROMPT
+from propercode.models.agents.node_outputs import ContextNodeOutput,PlanNodeOutput,CodeNodeOutput,EvaluationNodeOutput
+from propercode.agents.registry import AgentRegistry
+from propercode.agents.tools.file import read_file,read_files,file_tree_structure
+from propercode.agents.tools.memory import search_memory
+from propercode.agents.tools.search import search_code
+from propercode.agents.tools.imports import related_files
+from propercode.agents.tools.summaries import file_summaries
+from propercode.agents.tools.symbols import find_symbol,get_symbol_source
+from propercode.agents.providers.openrouter import OpenRouterProvider
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body leave in one write, otherwise delayed acks add 40ms per response
+    wbufsize = 64 * 1024
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _Handler.lock:
+            _Handler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length",0)))
+        body = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,*args):
+        pass
+
+def _node_agent(node:str) -> Agent:
+    '''
+    The agent a node instance built for itself before the registry existed
+    '''
+    settings = {
+        "context":dict(system_prompt=CONTEXT_SYSTEM_PROMPT,output_type=ContextNodeOutput,retries=2,model_settings=ModelSettings(temperature=0.0),
+                       tools=[search_memory,related_files,file_summaries,file_tree_structure,find_symbol,get_symbol_source,search_code,read_files,read_file]),
+        "plan":dict(system_prompt=PLAN_SYSTEM_PROMPT,output_type=PlanNodeOutput,retries=3,model_settings=ModelSettings(temperature=0.3),tools=[search_memory]),
+        "code":dict(system_prompt=CODE_SYSTEM_PROMPT,output_type=CodeNodeOutput,retries=3,model_settings=ModelSettings(temperature=0.3)),
+        "evaluation":dict(system_prompt=EVAL_SYSTEM_PROMPT,output_type=EvaluationNodeOutput,retries=3,model_settings=ModelSettings(temperature=0.2)),
+    }[node]
+    return Agent(model=None,**settings)
+
+def bench_agents(runs:int,retries:int):
+    model = TestModel()
+    # before, every node instance built its agent and each retry built a new code and evaluation node
+    nodes = ["context","plan"] + ["code","evaluation"] * (1 + retries)
+    start = time.perf_counter()
+    for _ in range(runs):
+        for node in nodes:
+            agent = _node_agent(node)
+            agent.model = model
+    before = (time.perf_counter() - start) / runs
+    # after, one registry per orchestrator serves every run
+    start = time.perf_counter()
+    registry = AgentRegistry.build(model)
+    for _ in range(runs):
+        for node in nodes:
+            getattr(registry,node)
+    after = (time.perf_counter() - start) / runs
+    print(f"agents       before {before * 1000:8.2f} ms/run   after {after * 1000:8.3f} ms/run ({runs} runs, {retries} retries each)")
+
+async def bench_connections(url:str,runs:int,requests:int,idle:float):
+    payload = {"model":"benchmark","messages":[{"role":"user","content":"hi"}]}
+
+    async def run(client:httpx.AsyncClient) -> list[float]:
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.post(url,json=payload)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    # the provider's models must send their requests through its pooled client
+    provider = OpenRouterProvider(api_key="benchmark")
+    model = provider.get_chat_model("benchmark")
+    assert model.client._client is provider.http_client,"the chat model does not use the provider's pooled client"
+    assert provider.get_chat_model("benchmark") is model
+
+    modes = {
+        "fresh client":None,
+        # what pydantic-ai shares by default, its idle connections expire after 5s
+        "default pool":lambda: httpx.AsyncClient(timeout=OpenRouterProvider.TIMEOUT),
+        "provider pool":lambda: provider.http_client,
+    }
+    for label,factory in modes.items():
+        _Handler.connections = 0
+        latencies = []
+        shared = factory() if factory else None
+        for i in range(runs):
+            if i and idle:
+                await asyncio.sleep(idle)
+            if shared is None:
+                async with httpx.AsyncClient(timeout=OpenRouterProvider.TIMEOUT) as client:
+                    latencies += await run(client)
+            else:
+                latencies += await run(shared)
+        if shared is not None and shared is not provider.http_client:
+            await shared.aclose()
+        print(f"{label:<13}{_Handler.connections:5} connections for {len(latencies)} requests, mean {statistics.mean(latencies):.2f} ms, p99 {statistics.quantiles(latencies,n=100)[98]:.2f} ms")
+    await provider.aclose()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs",type=int,default=50)
+    parser.add_argument("--retries",type=int,default=1,help="code/evaluation retries per run")
+    parser.add_argument("--requests",type=int,default=5,help="provider requests per run")
+    parser.add_argument("--idle",type=float,default=0.0,help="seconds between runs, above 5 the default pool reconnects")
+    args = parser.parse_args()
+
+    bench_agents(args.runs,args.retries)
+    server = ThreadingHTTPServer(("127.0.0.1",0),_Handler)
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    try:
+        asyncio.run(bench_connections(f"http://127.0.0.1:{server.server_port}/v1/chat/completions",args.runs,args.requests,args.idle))
+    finally:
+        server.shutdown()
+    print("loopback has no TLS or network round trips, each connection saved costs more against the real API")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+'''
+Stress test of N writer and M reader processes sharing one .propercode/memory.db
+
+    uv run python benchmarks/memory_concurrency.py --writers 4 --readers 4 --seconds 10
+'''
+import argparse
+import multiprocessing as mp
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from propercode.agents.memory.store import MemoryStore
+
+PROMPTS = ["add a login page","fix the flask route","write a sorting helper","refactor the cli","document the memory store"]
+
+def _worker(role:str,worker_id:int,root:str,seconds:float,pool_size:int,results):
+    store = MemoryStore(root=Path(root),pool_size=pool_size)
+    session_id = f"{role}-{worker_id}"
+    if role == "writer":
+        store.save_conversation(session_id,"benchmark","[]")
+
+    ops = errors = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        prompt = PROMPTS[ops % len(PROMPTS)]
+        start = time.perf_counter()
+        try:
+            if role == "writer":
+                store.insert_memory(session_id,f"Summary: user asked to {prompt} #{ops}","summary")
+            else:
+                store.search_memories(prompt,limit=3,memory_type="summary")
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    store.close_conn()
+    results.put((role,ops,errors,latencies))
+
+def _percentile(values:list[float],pct:float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1,int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers",type=int,default=4)
+    parser.add_argument("--readers",type=int,default=4)
+    parser.add_argument("--seconds",type=float,default=5.0)
+    parser.add_argument("--pool-size",type=int,default=4)
+    parser.add_argument("--root",type=str,default=None,help="Directory holding .propercode, a temp dir by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root or tmp
+        MemoryStore(root=Path(root)).close_conn()
+
+        results = mp.Queue()
+        procs = [mp.Process(target=_worker,args=("writer",i,root,args.seconds,args.pool_size,results)) for i in range(args.writers)]
+        procs += [mp.Process(target=_worker,args=("reader",i,root,args.seconds,args.pool_size,results)) for i in range(args.readers)]
+        for proc in procs:
+            proc.start()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    for role in ("writer","reader"):
+        rows = [r for r in collected if r[0] == role]
+        if not rows:
+            continue
+        ops = sum(r[1] for r in rows)
+        errors = sum(r[2] for r in rows)
+        latencies = [lat for r in rows for lat in r[3]]
+        print(
+            f"{role}s={len(rows)} ops={ops} ops/s={ops / args.seconds:,.0f} errors={errors} "
+            f"p50={_percentile(latencies,50) * 1000:.2f}ms p99={_percentile(latencies,99) * 1000:.2f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
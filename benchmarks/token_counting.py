@@ -0,0 +1,54 @@
+'''
+Throughput of the offline BPE token counter over synthetic conversation histories,
+cold and with the content hash cache warm
+
+    uv run python benchmarks/token_counting.py --histories 5000
+'''
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from propercode.agents.tokenizer import BPETokenizer
+
+def _histories(count:int,seed:int=0) -> list[str]:
+    '''
+    Builds histories out of this package's own source, similar sessions share most of their content
+    '''
+    rng = random.Random(seed)
+    sources = [path.read_text() for path in sorted(Path(__file__).parents[1].glob("src/propercode/**/*.py"))]
+    histories = []
+    for i in range(count):
+        messages = []
+        for _ in range(rng.randint(2,6)):
+            source = rng.choice(sources)
+            start = rng.randrange(max(1,len(source) - 2000))
+            messages.append({"role":rng.choice(["user","assistant"]),"content":source[start:start + rng.randint(200,2000)]})
+        histories.append(json.dumps({"session":i,"messages":messages}))
+    return histories
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--histories",type=int,default=5000)
+    parser.add_argument("--batch",type=int,default=200)
+    args = parser.parse_args()
+
+    histories = _histories(args.histories)
+    total_chars = sum(len(history) for history in histories)
+
+    start = time.perf_counter()
+    tokenizer = BPETokenizer.from_file(cache_size=args.histories)
+    print(f"load   {len(tokenizer.merges):,} merges in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for label in ("cold","warm"):
+        start = time.perf_counter()
+        tokens = 0
+        for i in range(0,len(histories),args.batch):
+            tokens += sum(tokenizer.count_tokens(histories[i:i + args.batch]))
+        elapsed = time.perf_counter() - start
+        print(f"{label}   {len(histories):,} histories, {total_chars / 1e6:.1f}M chars -> {tokens:,} tokens in {elapsed:.2f}s ({total_chars / elapsed / 1e6:.1f}M chars/s)")
+    print(f"chars per token {total_chars / tokens:.2f}, the chars/4 estimate would give {total_chars // 4:,}")
+
+if __name__ == "__main__":
+    main()
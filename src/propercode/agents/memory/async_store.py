@@ -0,0 +1,146 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Queue,Empty
+from typing import Any,Callable
+
+from propercode.agents.memory.store import MemoryStore
+
+class AsyncMemoryStore:
+    '''
+    Non-blocking facade over MemoryStore for code running on the event loop.
+    Reads run on a small thread pool. Writes are queued to one writer thread
+    which commits everything queued together in a single transaction
+    '''
+    def __init__(self,store:MemoryStore,read_workers:int=2,max_batch:int=64):
+        self.store = store
+        self.read_workers = read_workers
+        self.max_batch = max_batch
+        self._readers:ThreadPoolExecutor|None = None
+        self._queue:Queue = Queue()
+        self._writer:threading.Thread|None = None
+        self._lock = threading.Lock()
+
+    async def read(self,fn:Callable[...,Any],*args,**kwargs) -> Any:
+        '''
+        Runs a blocking read on the reader pool
+        '''
+        if self._readers is None:
+            self._readers = ThreadPoolExecutor(max_workers=self.read_workers,thread_name_prefix="memory-reader")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers,partial(fn,*args,**kwargs))
+
+    def write(self,fn:Callable[...,Any],*args,**kwargs) -> asyncio.Future:
+        '''
+        Queues a write and returns a future resolved once it is committed.
+        fn must accept a conn keyword to join the writer's transaction.
+        Writes are applied in the order they were queued
+        '''
+        future = asyncio.get_running_loop().create_future()
+        self._ensure_writer()
+        self._queue.put((future,partial(fn,*args,**kwargs)))
+        return future
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop,name="memory-writer",daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self,batch:list):
+        '''
+        Applies the batch in one transaction, each write under its own savepoint
+        so a failing write doesn't roll back the others. Errors outside the writes
+        fail the whole batch but never the writer loop
+        '''
+        outcomes = []
+        try:
+            with self.store.transaction() as conn:
+                for _,op in batch:
+                    conn.execute("SAVEPOINT memory_write")
+                    try:
+                        outcomes.append((True,op(conn=conn)))
+                        conn.execute("RELEASE memory_write")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO memory_write")
+                        conn.execute("RELEASE memory_write")
+                        outcomes.append((False,e))
+        except Exception as e:
+            # the whole transaction rolled back, fail every write of the batch and keep the writer alive
+            outcomes = [(False,e)] * len(batch)
+
+        for (future,_),(ok,value) in zip(batch,outcomes):
+            try:
+                future.get_loop().call_soon_threadsafe(_resolve,future,ok,value)
+            except RuntimeError:
+                # the caller's loop is already closed, nobody is waiting for this write
+                pass
+
+    async def search_memories(self,query:str,limit:int=3,memory_type:str|None=None) -> list[sqlite3.Row]:
+        return await self.read(self.store.search_memories,query,limit,memory_type)
+
+    async def search_similar(self,query:str,limit:int=3,memory_type:str|None=None) -> list[sqlite3.Row]:
+        return await self.read(self.store.search_similar,query,limit,memory_type)
+
+    def insert_memory(self,session_id:str,content:str,memory_type:str,metadata_json:str|None=None) -> asyncio.Future:
+        return self.write(self.store.insert_memory,session_id,content,memory_type,metadata_json)
+
+    async def save_conversation(self,session_id:str,user_prompt:str,history_json:str,model_name:str|None=None):
+        '''
+        Compresses the history and counts its tokens on the reader pool, so the writer
+        only runs SQL while it holds the database write lock
+        '''
+        encoded = await self.read(self.store.encode_conversation,user_prompt,history_json)
+        return await self.write(self.store.save_conversation,session_id,user_prompt,history_json,model_name,encoded)
+
+    def append_turn(self,session_id:str,node_type:str,content_json:str,retry:int=0) -> asyncio.Future:
+        return self.write(self.store.append_turn,session_id,node_type,content_json,retry)
+
+    def record_usage(self,session_id:str,node:str,model_name:str|None,retry:int,input_tokens:int,output_tokens:int,requests:int,wall_ms:float) -> asyncio.Future:
+        return self.write(self.store.record_usage,session_id,node,model_name,retry,input_tokens,output_tokens,requests,wall_ms)
+
+    def record_latency(self,histograms:dict[tuple[str,str,str],dict[int,int]]) -> asyncio.Future:
+        return self.write(self.store.record_latency,histograms)
+
+    async def aclose(self):
+        '''
+        Waits for queued writes to commit, then stops the writer thread and the reader pool
+        '''
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            await asyncio.to_thread(writer.join)
+        self._writer = None
+        if self._readers is not None:
+            self._readers.shutdown(wait=False)
+            self._readers = None
+
+def _resolve(future:asyncio.Future,ok:bool,value:Any):
+    if future.cancelled():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
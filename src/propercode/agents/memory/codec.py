@@ -0,0 +1,73 @@
+import zlib
+from typing import Iterable
+
+try:
+    from compression import zstd
+except ImportError: # zstd joined the standard library in python 3.14
+    zstd = None
+
+# values of conversations.history_format
+FORMAT_PLAIN = 0
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+FORMAT_ZSTD_DICT = 3
+
+FORMAT_NAMES = {FORMAT_PLAIN:"plain",FORMAT_ZLIB:"zlib",FORMAT_ZSTD:"zstd",FORMAT_ZSTD_DICT:"zstd+dict"}
+
+# histories shorter than this are stored as is, framing would outweigh the savings
+MIN_COMPRESS_BYTES = 128
+
+class HistoryCodec:
+    '''
+    Compresses conversation histories with zstd, optionally primed with a
+    dictionary trained on earlier histories, falling back to zlib
+    '''
+    def __init__(self,level:int|None=None,dictionary:bytes|None=None,dict_id:int|None=None):
+        self.level = level
+        self.dict_id = dict_id if dictionary else None
+        self._dictionaries:dict[int,object] = {}
+        if zstd is not None and dictionary:
+            self._dictionaries[dict_id] = zstd.ZstdDict(dictionary)
+
+    def add_dictionary(self,dict_id:int,dictionary:bytes):
+        '''
+        Registers a dictionary needed to decode older rows
+        '''
+        if zstd is not None:
+            self._dictionaries[dict_id] = zstd.ZstdDict(dictionary)
+
+    def encode(self,text:str) -> tuple[int,bytes|str,int|None]:
+        '''
+        Returns (format, payload, dictionary id) for the history text
+        '''
+        raw = text.encode("utf-8")
+        if len(raw) < MIN_COMPRESS_BYTES:
+            return FORMAT_PLAIN,text,None
+        if zstd is None:
+            return FORMAT_ZLIB,zlib.compress(raw,6 if self.level is None else self.level),None
+        if self.dict_id is not None:
+            return FORMAT_ZSTD_DICT,zstd.compress(raw,level=self.level,zstd_dict=self._dictionaries[self.dict_id]),self.dict_id
+        return FORMAT_ZSTD,zstd.compress(raw,level=self.level),None
+
+    def decode(self,fmt:int,payload:bytes|str,dict_id:int|None=None) -> str:
+        if fmt == FORMAT_PLAIN:
+            return payload if isinstance(payload,str) else payload.decode("utf-8")
+        if fmt == FORMAT_ZLIB:
+            return zlib.decompress(payload).decode("utf-8")
+        if zstd is None:
+            raise RuntimeError("This history is zstd compressed, python 3.14+ is needed to read it")
+        if fmt == FORMAT_ZSTD:
+            return zstd.decompress(payload).decode("utf-8")
+        if fmt == FORMAT_ZSTD_DICT:
+            if dict_id not in self._dictionaries:
+                raise KeyError(f"Compression dictionary {dict_id} is missing")
+            return zstd.decompress(payload,zstd_dict=self._dictionaries[dict_id]).decode("utf-8")
+        raise ValueError(f"Unknown history format {fmt}")
+
+def train_dictionary(samples:Iterable[str],dict_size:int=64 * 1024) -> bytes:
+    '''
+    Trains a zstd dictionary from sample histories
+    '''
+    if zstd is None:
+        raise RuntimeError("Training a dictionary needs zstd from python 3.14+")
+    return zstd.train_dict([sample.encode("utf-8") for sample in samples],dict_size).dict_content
@@ -0,0 +1,91 @@
+import math
+import time
+import inspect
+import threading
+from collections import Counter
+from functools import wraps
+from typing import Any,Callable
+
+# log2 buckets split in 8, every bucket spans ~9% so percentiles are within that of the real value
+SUB_BUCKETS = 8
+# bucket 0 holds everything up to one microsecond
+MIN_MS = 0.001
+
+def bucket_of(ms:float) -> int:
+    if ms <= MIN_MS:
+        return 0
+    return int(math.log2(ms / MIN_MS) * SUB_BUCKETS)
+
+def bucket_value(bucket:int) -> float:
+    '''
+    Representative latency in ms of a bucket, the geometric middle of its bounds
+    '''
+    return MIN_MS * 2 ** ((bucket + 0.5) / SUB_BUCKETS)
+
+def percentiles(buckets:dict[int,int],quantiles:list[float]) -> list[float]:
+    '''
+    Latencies in ms at the given quantiles (0..1) of a bucket -> count histogram
+    '''
+    total = sum(buckets.values())
+    if total == 0:
+        return [0.0] * len(quantiles)
+    ordered = sorted(buckets.items())
+    values = []
+    for q in quantiles:
+        rank = max(1,math.ceil(q * total))
+        seen = 0
+        for bucket,count in ordered:
+            seen += count
+            if seen >= rank:
+                values.append(bucket_value(bucket))
+                break
+    return values
+
+class LatencyRecorder:
+    '''
+    In-process latency histograms keyed by (kind, name, model), drained into
+    the memory store in one write at the end of a run
+    '''
+    def __init__(self):
+        self._histograms:dict[tuple[str,str,str],Counter] = {}
+        self._lock = threading.Lock()
+
+    def record(self,kind:str,name:str,ms:float,model_name:str|None=None):
+        key = (kind,name,model_name or "")
+        with self._lock:
+            self._histograms.setdefault(key,Counter())[bucket_of(ms)] += 1
+
+    def drain(self) -> dict[tuple[str,str,str],Counter]:
+        with self._lock:
+            histograms,self._histograms = self._histograms,{}
+        return histograms
+
+    def timed(self,kind:str,name:str|None=None) -> Callable:
+        '''
+        Decorator timing every call of a sync or async function, keeps the
+        signature intact so pydantic-ai can still build the tool schema
+        '''
+        def decorator(fn:Callable) -> Callable:
+            label = name or fn.__name__
+            if inspect.iscoroutinefunction(fn):
+                @wraps(fn)
+                async def async_wrapper(*args,**kwargs) -> Any:
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args,**kwargs)
+                    finally:
+                        self.record(kind,label,(time.perf_counter() - start) * 1000)
+                return async_wrapper
+
+            @wraps(fn)
+            def wrapper(*args,**kwargs) -> Any:
+                start = time.perf_counter()
+                try:
+                    return fn(*args,**kwargs)
+                finally:
+                    self.record(kind,label,(time.perf_counter() - start) * 1000)
+            return wrapper
+        return decorator
+
+# shared by the nodes and tools of every run in this process
+RECORDER = LatencyRecorder()
@@ -1,15 +1,26 @@
 import json
+import time
+import random
+import asyncio
+from datetime import datetime,timedelta
 
-from propercode.agents.memory.store import MemoryStore
+from propercode.agents.memory.async_store import AsyncMemoryStore
 from propercode.agents.memory.state import AgentState
 from propercode.agents.tools.memory import SearchMemoryTool,WriteMemoryTool
-from propercode.models.agents.memory_models import SearchMemoryToolInput,WriteMemoryToolInput
+from propercode.models.agents.memory_models import SearchMemoryToolInput,WriteMemoryToolInput,MaintenanceReport
 
 class MemoryManager:
     '''
     Manages the memory for the multi-agent
     '''
-    def __init__(self,store:MemoryStore,prune_prob:float=0.1):
+    # chunks of PRUNE_CHUNK_SIZE rows deleted per background prune
+    PRUNE_MAX_CHUNKS = 20
+    PRUNE_CHUNK_SIZE = 500
+    # free pages returned to the file system per background prune
+    VACUUM_PAGES = 1000
+    ANALYZE_INTERVAL = timedelta(days=7)
+
+    def __init__(self,store:AsyncMemoryStore,prune_prob:float=0.1):
         self.store = store
         self.prune_prob = prune_prob
         self.search_memory_tool = SearchMemoryTool(self.store)
@@ -35,12 +46,13 @@ class MemoryManager:
         Saves history and summary
         '''
         try:
-            history_json = json.dumps(state.conversation_history, indent=2, ensure_ascii=False)
-            self.store.save_conversation(
-                str(state.session_id), state.user_prompt, history_json
+            history_json = json.dumps(state.conversation_history, ensure_ascii=False)
+            # saved before the summary is queued, the summary references the conversation
+            await self.store.save_conversation(
+                str(state.session_id), state.user_prompt, history_json, getattr(state.chat_model,"model_name",None)
             )
 
-            verdict = (state.evaluation.verdict.value if state.evaluation else "UNKNOWN")
+            verdict = (state.evaluation_output.verdict.value if state.evaluation_output else "UNKNOWN")
             summary_text = f"Summary: user asked for {state.user_prompt}, code was generated and {verdict.lower()} evaluation."
 
             write_memory_input = WriteMemoryToolInput(session_id=str(state.session_id),content=summary_text,memory_type="summary")
@@ -51,11 +63,45 @@ class MemoryManager:
         except Exception as e:
             return state.add_error(f"Save failed: {e}")
     
-    def prune(self, days_to_keep: int = 30) -> None:
+    async def prune(self, days_to_keep: int = 30) -> MaintenanceReport | None:
         '''
-        Prunes old memories
+        Prunes old memories on a prune_prob share of calls, off the event loop
         '''
+        if random.random() >= self.prune_prob:
+            return None
         try:
-            self.store.prune_old_memories(days_to_keep=days_to_keep)
+            return await asyncio.to_thread(self.maintain,days_to_keep,self.PRUNE_MAX_CHUNKS)
         except Exception as e:
-            print(f"Prune failed: {e}")
\ No newline at end of file
+            print(f"Prune failed: {e}")
+            return None
+
+    def maintain(self, days_to_keep: int = 30, max_chunks: int | None = None, full_vacuum: bool = False, analyze: bool = False) -> MaintenanceReport:
+        '''
+        Prunes old memories, merges unsigned near-duplicates and counts tokens of older histories in bounded chunks, drops the stale rows of
+        the embedding matrix, returns free pages and refreshes
+        planner statistics once ANALYZE_INTERVAL has passed
+        '''
+        store = self.store.store
+        report = MaintenanceReport(before=store.db_stats())
+
+        start = time.perf_counter()
+        report.deleted_rows = store.prune_old_memories(days_to_keep=days_to_keep,chunk_size=self.PRUNE_CHUNK_SIZE,max_chunks=max_chunks)
+        report.merged_memories = store.consolidate_memories(max_batches=max_chunks)
+        report.counted_histories = store.count_history_tokens(max_batches=max_chunks)
+        report.compacted_vectors = store.compact_vectors()
+        report.prune_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.vacuum(max_pages=None if full_vacuum or max_chunks is None else self.VACUUM_PAGES,full=full_vacuum)
+        report.vacuum_seconds = time.perf_counter() - start
+
+        last_analyze = store.get_meta("last_analyze")
+        if analyze or last_analyze is None or datetime.now() - datetime.fromisoformat(last_analyze) > self.ANALYZE_INTERVAL:
+            start = time.perf_counter()
+            store.analyze()
+            store.set_meta("last_analyze",datetime.now().isoformat())
+            report.analyzed = True
+            report.analyze_seconds = time.perf_counter() - start
+
+        report.after = store.db_stats()
+        return report
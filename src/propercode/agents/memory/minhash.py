@@ -0,0 +1,60 @@
+import re
+import hashlib
+from array import array
+
+# Mersenne prime 2^61 - 1 keeps the universal hashes collision free on 32 bit shingle hashes
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+class MinHasher:
+    '''
+    MinHash signatures over word shingles, bucketed into LSH bands.
+    With 16 bands of 4 rows two texts share a band with high probability
+    once their Jaccard similarity passes ~0.5, the exact estimate is then
+    compared against the merge threshold
+    '''
+    def __init__(self,num_perm:int=64,bands:int=16,shingle_size:int=3,seed:int=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        digest = hashlib.blake2b(str(seed).encode(),digest_size=64).digest()
+        # derive deterministic (a,b) coefficients so signatures stay comparable across runs
+        self._coefficients = []
+        for i in range(num_perm):
+            block = hashlib.blake2b(digest + i.to_bytes(4,"little"),digest_size=16).digest()
+            a = int.from_bytes(block[:8],"little") % (_PRIME - 1) + 1
+            b = int.from_bytes(block[8:],"little") % _PRIME
+            self._coefficients.append((a,b))
+
+    def shingles(self,text:str) -> set[int]:
+        words = re.findall(r"\w+",text.lower())
+        if len(words) < self.shingle_size:
+            words = words + [""] * (self.shingle_size - len(words))
+        return {
+            int.from_bytes(hashlib.blake2b(" ".join(words[i:i+self.shingle_size]).encode(),digest_size=4).digest(),"little")
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self,text:str) -> array:
+        shingles = self.shingles(text)
+        return array('I',(min(((a * s + b) % _PRIME) & _MAX_HASH for s in shingles) for a,b in self._coefficients))
+
+    def band_keys(self,signature:array) -> list[int]:
+        '''
+        One bucket key per band, a 64 bit hash of that band's rows
+        '''
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            keys.append(int.from_bytes(hashlib.blake2b(rows,digest_size=8).digest(),"little",signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(first:array,second:array) -> float:
+        '''
+        Estimated Jaccard similarity of two signatures
+        '''
+        return sum(1 for x,y in zip(first,second) if x == y) / len(first)
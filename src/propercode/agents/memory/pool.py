@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from queue import LifoQueue,Empty
+from typing import Iterator
+
+class ConnectionPool:
+    '''
+    Bounded pool of SQLite connections sharing one WAL-mode database file
+    '''
+    PRAGMAS = (
+        "PRAGMA foreign_keys = ON",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    def __init__(self,db_path:Path,pool_size:int=4,busy_timeout:float=10.0,statement_cache_size:int=128,acquire_timeout:float=30.0):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.statement_cache_size = statement_cache_size
+        self.acquire_timeout = acquire_timeout
+        self._idle:LifoQueue[sqlite3.Connection] = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        '''
+        Opens a tuned connection, transactions are opened explicitly with BEGIN
+        '''
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        # only takes effect on a new file, older stores switch over on a full VACUUM
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            conn.execute("PRAGMA journal_mode = WAL")
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        '''
+        Takes an idle connection, opens a new one while under pool_size or waits for one to be released
+        '''
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except Empty:
+            raise sqlite3.OperationalError(f"No memory database connection was released within {self.acquire_timeout}s")
+
+    def release(self,conn:sqlite3.Connection):
+        '''
+        Returns a connection to the pool, rolling back anything left uncommitted
+        '''
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        '''
+        Runs the block in a write transaction, the write lock is taken up front so
+        concurrent writers wait on busy_timeout instead of failing on lock upgrade
+        '''
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        '''
+        Closes the idle connections, the pool reconnects lazily if it is used again
+        '''
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -1,8 +1,16 @@
+import time
+import asyncio
+import json
 from pydantic import BaseModel,Field
 from uuid import UUID,uuid4
 from typing import List, Any
+from dataclasses import dataclass,field
 
 from propercode.models.agents.node_outputs import ContextNodeOutput,PlanNodeOutput,CodeNodeOutput,EvaluationNodeOutput
+from propercode.agents.memory.async_store import AsyncMemoryStore
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.packer import DEFAULT_CONTEXT_TOKENS
+from propercode.agents.registry import AgentRegistry
 
 class AgentState(BaseModel):
     session_id:UUID = Field(default_factory=uuid4)
@@ -13,8 +21,10 @@ class AgentState(BaseModel):
     max_retries: int = Field(default=0,ge=1)
     chat_model : Any = Field(None,description="The LLM Client instance")
     config: dict = Field(default_factory=dict,description="The runtime flags")
+    context_token_budget: int = Field(default=DEFAULT_CONTEXT_TOKENS,ge=256,description="Tokens of packed context given to the plan, code and evaluation prompts")
 
     context_output:ContextNodeOutput|None = Field(None,description="output of the context node")
+    packed_context:str|None = Field(None,description="the most relevant chunks of the gathered context within the token budget")
     plan_output:PlanNodeOutput|None = Field(None,description="Plan node output")
     code_output:CodeNodeOutput|None = Field(None,description="Code node output")
     evaluation_output:EvaluationNodeOutput|None = Field(None,description="Evaluation node output")
@@ -31,4 +41,56 @@ class AgentState(BaseModel):
         retries = self.retries + 1
         if retries > self.max_retries:
             raise ValueError('Maximum retries attained')
-        return self.model_copy(update={'retries':retries})
\ No newline at end of file
+        return self.model_copy(update={'retries':retries})
+
+@dataclass
+class GraphDeps:
+    '''
+    Services shared by the graph nodes during a run
+    '''
+    memory: AsyncMemoryStore
+    agents: AgentRegistry
+    pending: List[asyncio.Future] = field(default_factory=list)
+
+    def record_turn(self,state:AgentState,node_type:str,output:BaseModel):
+        '''
+        Queues a node's output to the turns table without waiting for the commit
+        '''
+        self.pending.append(self.memory.append_turn(str(state.session_id),node_type,output.model_dump_json(),state.retries))
+
+    def record_history(self,state:AgentState,msg:str):
+        '''
+        Appends a history entry to the state and queues it to the turns table
+        '''
+        state.conversation_history.append(msg)
+        self.pending.append(self.memory.append_turn(str(state.session_id),"history",json.dumps(msg,ensure_ascii=False),state.retries))
+
+    async def run_agent(self,state:AgentState,node:str,agent:Any,prompt:str) -> Any:
+        '''
+        Runs a node's agent and queues the token usage it reported and its wall time,
+        the latency also goes into the node's histogram
+        '''
+        model_name = getattr(state.chat_model,"model_name",None)
+        start = time.perf_counter()
+        # the deps give tools like search_memory the run's memory store
+        result = await agent.run(prompt,deps=self)
+        wall_ms = (time.perf_counter() - start) * 1000
+        RECORDER.record("node",node,wall_ms,model_name)
+        usage = result.usage()
+        self.pending.append(self.memory.record_usage(
+            str(state.session_id),node,model_name,state.retries,
+            usage.input_tokens,usage.output_tokens,usage.requests,wall_ms
+        ))
+        return result
+
+    async def flush(self) -> List[str]:
+        '''
+        Queues the latency histograms recorded so far, waits for the queued writes
+        to commit and returns the errors of failed writes
+        '''
+        histograms = RECORDER.drain()
+        if histograms:
+            self.pending.append(self.memory.record_latency(histograms))
+        pending,self.pending = self.pending,[]
+        results = await asyncio.gather(*pending,return_exceptions=True)
+        return [f"Turn write failed: {result}" for result in results if isinstance(result,Exception)]
@@ -1,106 +1,902 @@
+import re
 import sqlite3
+from array import array
+from contextlib import contextmanager
+from functools import cached_property
 from pathlib import Path
-import threading
+from typing import Iterator
+
+from propercode.agents.memory.pool import ConnectionPool
+from propercode.agents.memory.codec import HistoryCodec,FORMAT_PLAIN,train_dictionary
+from propercode.agents.memory.vectors import HashingEmbedder,VectorIndex
+from propercode.agents.memory.minhash import MinHasher
+from propercode.agents.tokenizer import CHARS_PER_TOKEN,count_tokens
+
+# character count of a history, recorded at save time since compressed histories can't be measured in SQL
+HISTORY_CHARS_SQL = "COALESCE(history_chars, length(full_history_json))"
+# BPE token counts, rows saved before they were recorded fall back to chars/4
+PROMPT_TOKENS_SQL = f"COALESCE(prompt_tokens, length(user_prompt) / {CHARS_PER_TOKEN})"
+HISTORY_TOKENS_SQL = f"COALESCE(history_tokens, {HISTORY_CHARS_SQL} / {CHARS_PER_TOKEN})"
+
+class StoredConversation:
+    '''
+    A saved conversation whose history is only decompressed when first read
+    '''
+    def __init__(self,row:sqlite3.Row,codec:HistoryCodec):
+        self.session_id = row["session_id"]
+        self.timestamp = row["timestamp"]
+        self.user_prompt = row["user_prompt"]
+        self.history_chars = row["history_chars"]
+        self._row = row
+        self._codec = codec
+
+    @cached_property
+    def history_json(self) -> str:
+        return self._codec.decode(self._row["history_format"],self._row["full_history_json"],self._row["history_dict_id"])
 
 class MemoryStore:
     '''
     Handles all database operations for the agent memory
     '''
-    _thread_local = threading.local()
+    # memories older than this lose half of their BM25 score when ranking
+    RECENCY_HALF_LIFE_DAYS = 30.0
+    # how many FTS candidates are re-ranked per requested result
+    CANDIDATE_POOL_FACTOR = 20
+    # cosine similarity below which an embedding match is treated as unrelated
+    MIN_SIMILARITY = 0.25
+    # estimated Jaccard similarity above which a new memory is merged into an existing one
+    DUPLICATE_THRESHOLD = 0.8
+    # exportable tables, the column their date filters apply to and their (name, type) columns.
+    # history_json is decoded from the stored payload
+    EXPORT_TABLES = {
+        "conversations":("timestamp",[("session_id","text"),("timestamp","text"),("model_name","text"),("user_prompt","text"),("history_json","text"),
+                                      ("history_chars","int"),("prompt_tokens","int"),("history_tokens","int")]),
+        "derived_memories":("timestamp",[("id","int"),("session_id","text"),("memory_type","text"),("content","text"),("metadata_json","text"),
+                                         ("hit_count","int"),("timestamp","text")]),
+        "turns":("timestamp",[("id","int"),("session_id","text"),("seq","int"),("node_type","text"),("retry","int"),("content_json","text"),("timestamp","text")]),
+        "node_usage":("timestamp",[("id","int"),("session_id","text"),("node","text"),("model_name","text"),("retry","int"),("input_tokens","int"),
+                                   ("output_tokens","int"),("requests","int"),("wall_ms","real"),("timestamp","text")]),
+        "usage_daily":("day",[("day","text"),("session_id","text"),("model_name","text"),("conversations","int"),("characters","int"),("prompt_tokens","int"),
+                              ("history_tokens","int"),("runs","int"),("requests","int"),("input_tokens","int"),("output_tokens","int"),("wall_ms","real")]),
+        "latency_histogram":("day",[("kind","text"),("name","text"),("model_name","text"),("day","text"),("bucket","int"),("count","int")]),
+    }
+    STOP_WORDS = frozenset({"a","an","and","are","as","at","be","by","for","from","how","i","in","is","it","me","my","of","on","or","please","that","the","this","to","was","we","what","with","you"})
 
-    def __init__(self):
-        config_path = Path.cwd() / ".propercode"
+    def __init__(self,root:Path|None=None,pool_size:int=4):
+        config_path = (root or Path.cwd()) / ".propercode"
         self.db_path = config_path / "memory.db"
         self.db_path.parent.mkdir(exist_ok=True)
+        self.embedder = HashingEmbedder()
+        self.vectors = VectorIndex(config_path,self.embedder)
+        self.minhasher = MinHasher()
+        self._pool = ConnectionPool(self.db_path,pool_size=pool_size)
         self._initialize_db()
-    
-    def _get_conn(self) ->sqlite3.Connection:
+
+    def connection(self):
         '''
-        Gets a connection from thread-local storage or creates a new one
+        Borrows a pooled connection for reads
         '''
-        if not hasattr(self._thread_local,"connection"):
-            self._thread_local.connection = sqlite3.connect(self.db_path,check_same_thread=False)
-            self._thread_local.connection.row_factory = sqlite3.Row
-            cursor = self._thread_local.connection.cursor()
-            cursor.execute("PRAGMA foreign_keys = ON;")
-            self._thread_local.connection.commit()
-        return self._thread_local.connection
-    
+        return self._pool.connection()
+
+    def transaction(self):
+        '''
+        Borrows a pooled connection inside a write transaction
+        '''
+        return self._pool.transaction()
+
+    @contextmanager
+    def _writing(self,conn:sqlite3.Connection|None) -> Iterator[sqlite3.Connection]:
+        '''
+        Joins the caller's transaction when a connection is passed, otherwise opens one
+        '''
+        if conn is not None:
+            yield conn
+            return
+        with self.transaction() as conn:
+            yield conn
+
     def close_conn(self):
         '''
-        Closes the connection of the current thread
+        Closes the idle pooled connections
         '''
-        if hasattr(self._thread_local,"connection"):
-            self._thread_local.connection.close()
-            del self._thread_local.connection
-    
+        self._pool.close()
+
     def _initialize_db(self):
         '''
-        Creates the tables for short and long term if they doesn't exits
+        Creates the schema in one write transaction
         '''
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
+            with self.transaction() as conn:
+                self._create_schema(conn.cursor())
+                self.codec = self._load_codec(conn)
+        except sqlite3.Error as e:
+            raise e
+
+    def _ensure_column(self,cursor:sqlite3.Cursor,table:str,column:str,declaration:str):
+        '''
+        Adds a column to tables created by older versions
+        '''
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _load_codec(self,conn:sqlite3.Connection) -> HistoryCodec:
+        '''
+        Builds the history codec, new rows use the most recently trained dictionary
+        '''
+        rows = conn.execute("SELECT id, content FROM compression_dicts ORDER BY id").fetchall()
+        if not rows:
+            return HistoryCodec()
+        codec = HistoryCodec(dictionary=rows[-1]["content"],dict_id=rows[-1]["id"])
+        for row in rows[:-1]:
+            codec.add_dictionary(row["id"],row["content"])
+        return codec
+
+    def _create_schema(self,cursor:sqlite3.Cursor):
+        '''
+        Creates the tables for short and long term if they doesn't exits
+        '''
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            session_id TEXT PRIMARY KEY,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_prompt TEXT NOT NULL,
+            full_history_json TEXT NOT NULL
+        )
+        """)
+
+        # full_history_json holds text or a compressed BLOB depending on history_format
+        self._ensure_column(cursor,"conversations","history_format","INTEGER NOT NULL DEFAULT 0")
+        self._ensure_column(cursor,"conversations","history_dict_id","INTEGER")
+        self._ensure_column(cursor,"conversations","history_chars","INTEGER")
+        # BPE token counts taken at save time, NULL on rows saved before they were tracked
+        self._ensure_column(cursor,"conversations","prompt_tokens","INTEGER")
+        self._ensure_column(cursor,"conversations","history_tokens","INTEGER")
+        self._ensure_column(cursor,"conversations","model_name","TEXT")
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content BLOB NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS derived_memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            memory_type TEXT NOT NULL CHECK(memory_type IN ('summary','fact')),
+            content TEXT NOT NULL,
+            metadata_json TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES conversations (session_id) ON DELETE CASCADE
+        )
+        """)
+
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memory_type ON derived_memories (memory_type);            
+        """)
+        # near-duplicates are merged into one row which counts how often it was written
+        self._ensure_column(cursor,"derived_memories","hit_count","INTEGER NOT NULL DEFAULT 1")
+        self._ensure_column(cursor,"derived_memories","minhash","BLOB")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS memory_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            memory_id INTEGER NOT NULL,
+            PRIMARY KEY (band,bucket,memory_id),
+            FOREIGN KEY (memory_id) REFERENCES derived_memories (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_memory_lsh_memory ON memory_lsh (memory_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_memories_timestamp ON derived_memories (timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp)")
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            node_type TEXT NOT NULL CHECK(node_type IN ('context','plan','code','evaluation','history')),
+            retry INTEGER NOT NULL DEFAULT 0,
+            content_json TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (session_id,seq)
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_turns_node_type ON turns (node_type,timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_turns_timestamp ON turns (timestamp)")
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS node_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            node TEXT NOT NULL,
+            model_name TEXT,
+            retry INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            wall_ms REAL NOT NULL DEFAULT 0,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_node_usage_session ON node_usage (session_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_node_usage_timestamp ON node_usage (timestamp)")
+
+        # per day totals kept up to date by save_conversation and record_usage so stats never scan raw rows,
+        # they survive pruning and are only recomputed by rebuild_usage_daily. model_name is '' when unknown
+        existing = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='usage_daily'").fetchone()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            day TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            model_name TEXT NOT NULL DEFAULT '',
+            conversations INTEGER NOT NULL DEFAULT 0,
+            characters INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            history_tokens INTEGER NOT NULL DEFAULT 0,
+            runs INTEGER NOT NULL DEFAULT 0,
+            requests INTEGER NOT NULL DEFAULT 0,
+            input_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            wall_ms REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day,session_id,model_name)
+        ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_daily_session ON usage_daily (session_id)")
+        if existing is None:
+            self._fill_usage_daily(cursor)
 
+        # latency histograms in fixed log buckets (see latency.py), kind is 'node' or 'tool'
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS latency_histogram (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            model_name TEXT NOT NULL DEFAULT '',
+            day TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind,name,model_name,day,bucket)
+        ) WITHOUT ROWID
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """)
+
+        self.fts_enabled = self._initialize_fts(cursor)
+        self._initialize_vectors(cursor)
+    
+    def _initialize_fts(self,cursor:sqlite3.Cursor) -> bool:
+        '''
+        Creates the FTS5 index over derived_memories and the triggers keeping it in sync.
+        Returns False when the sqlite build has no FTS5 support
+        '''
+        existing = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='derived_memories_fts'").fetchone()
+        try:
             cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversations (
-                session_id TEXT PRIMARY KEY,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                user_prompt TEXT NOT NULL,
-                full_history_json TEXT NOT NULL
+            CREATE VIRTUAL TABLE IF NOT EXISTS derived_memories_fts USING fts5 (
+                content,
+                memory_type UNINDEXED,
+                content='derived_memories',
+                content_rowid='id',
+                tokenize='porter unicode61'
             )
             """)
+        except sqlite3.OperationalError:
+            return False
 
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS derived_memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                memory_type TEXT NOT NULL CHECK(memory_type IN ('summary','fact')),
-                content TEXT NOT NULL,
-                metadata_json TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (session_id) REFERENCES conversations (session_id) ON DELETE CASCADE
+        cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS derived_memories_fts_ai AFTER INSERT ON derived_memories BEGIN
+            INSERT INTO derived_memories_fts (rowid,content,memory_type) VALUES (new.id,new.content,new.memory_type);
+        END
+        """)
+        cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS derived_memories_fts_ad AFTER DELETE ON derived_memories BEGIN
+            INSERT INTO derived_memories_fts (derived_memories_fts,rowid,content,memory_type) VALUES ('delete',old.id,old.content,old.memory_type);
+        END
+        """)
+        cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS derived_memories_fts_au AFTER UPDATE OF content,memory_type ON derived_memories BEGIN
+            INSERT INTO derived_memories_fts (derived_memories_fts,rowid,content,memory_type) VALUES ('delete',old.id,old.content,old.memory_type);
+            INSERT INTO derived_memories_fts (rowid,content,memory_type) VALUES (new.id,new.content,new.memory_type);
+        END
+        """)
+
+        if existing is None:
+            # index rows written before the FTS table existed
+            cursor.execute("INSERT INTO derived_memories_fts (derived_memories_fts) VALUES ('rebuild')")
+        return True
+
+    def _initialize_vectors(self,cursor:sqlite3.Cursor):
+        '''
+        Creates the embedding table and embeds memories written before it existed
+        '''
+        existing = cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='memory_vectors'").fetchone()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS memory_vectors (
+            memory_id INTEGER PRIMARY KEY,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            FOREIGN KEY (memory_id) REFERENCES derived_memories (id) ON DELETE CASCADE
+        )
+        """)
+        if existing is None:
+            self.vectors.reset()
+            rows = cursor.execute("SELECT id, content FROM derived_memories").fetchall()
+            cursor.executemany(
+                "INSERT INTO memory_vectors (memory_id,dim,vector) VALUES (?,?,?)",
+                ((row[0],self.embedder.dim,self.embedder.pack(row[1])) for row in rows)
             )
-            """)
 
-            cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_memory_type ON derived_memories (memory_type);            
-            """)
+    @classmethod
+    def build_match_query(cls,text:str,max_terms:int=32) -> str:
+        '''
+        Turns free text into an FTS5 query that matches any of its meaningful terms
+        '''
+        terms = []
+        for token in re.findall(r"\w+",text.lower()):
+            if len(token) < 2 or token in cls.STOP_WORDS or token in terms:
+                continue
+            terms.append(token)
+            if len(terms) >= max_terms:
+                break
+        return " OR ".join(f'"{term}"' for term in terms)
 
-            conn.commit()
-        except sqlite3.Error as e:
-            raise e
-    
-    def save_conversation(self,session_id:str,user_prompt:str,history_json:str):
+    def search_memories(self,query:str,limit:int=3,memory_type:str|None=None) -> list[sqlite3.Row]:
         '''
-        Saves the full conversation history for a given session
+        Ranks memories by BM25 relevance to the query, boosted by recency
         '''
-        try:
-            conn = self._get_conn()
+        with self.connection() as conn:
+            return self._search_memories(conn.cursor(),query,limit,memory_type)
+
+    def _search_memories(self,cursor:sqlite3.Cursor,query:str,limit:int,memory_type:str|None) -> list[sqlite3.Row]:
+        if not self.fts_enabled:
+            query_sql = "SELECT id, content, timestamp, hit_count FROM derived_memories WHERE content LIKE ? "
+            query_params:list = [f"%{query}%"]
+            if memory_type:
+                query_sql += "AND memory_type = ? "
+                query_params.append(memory_type)
+            query_sql += "ORDER BY timestamp DESC LIMIT ?"
+            query_params.append(limit)
+            return cursor.execute(query_sql,tuple(query_params)).fetchall()
+
+        match_query = self.build_match_query(query)
+        if not match_query:
+            return []
+
+        type_filter = "AND memory_type = ?" if memory_type else ""
+        query_params = [self.RECENCY_HALF_LIFE_DAYS,match_query] + ([memory_type] if memory_type else []) + [limit * self.CANDIDATE_POOL_FACTOR,limit]
+
+        cursor.execute(f"""
+        SELECT m.id, m.content, m.timestamp, m.hit_count,
+               c.rank / (1.0 + max(julianday('now') - julianday(m.timestamp),0.0) / ?) AS score
+        FROM (
+            SELECT rowid, rank FROM derived_memories_fts
+            WHERE derived_memories_fts MATCH ? {type_filter}
+            ORDER BY rank LIMIT ?
+        ) AS c
+        JOIN derived_memories m ON m.id = c.rowid
+        ORDER BY score LIMIT ?
+        """,tuple(query_params))
+        return cursor.fetchall()
+
+    def insert_memory(self,session_id:str,content:str,memory_type:str,metadata_json:str|None=None,conn:sqlite3.Connection|None=None) -> int:
+        '''
+        Inserts a derived memory, or bumps the hit count of a near-duplicate of the
+        same type and moves it to this session instead. Returns the id of the row holding the memory.
+        The FTS index is updated by trigger
+        '''
+        signature = self.minhasher.signature(content)
+        band_keys = self.minhasher.band_keys(signature)
+        vector = self.embedder.pack(content)
+        with self._writing(conn) as conn:
+            duplicate_id = self._find_duplicate(conn,signature,band_keys,memory_type)
+            if duplicate_id is not None:
+                # memories cascade with their conversation, follow the newest one so a refreshed memory outlives the old session
+                conn.execute(
+                    "UPDATE derived_memories SET hit_count = hit_count + 1, timestamp = CURRENT_TIMESTAMP, session_id = ? WHERE id = ?",
+                    (session_id,duplicate_id)
+                )
+                return duplicate_id
+
             cursor = conn.cursor()
-            cursor.execute("""
-            INSERT OR REPLACE INTO conversations (session_id,user_prompt,full_history_json) VALUES (?,?,?)               
-            """,(session_id,user_prompt,history_json))
-            conn.commit()
+            cursor.execute(
+                """
+                INSERT INTO derived_memories (session_id,content,memory_type,metadata_json,minhash)
+                VALUES (?,?,?,?,?)
+                """, (session_id,content,memory_type,metadata_json,signature.tobytes())
+            )
+            memory_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO memory_vectors (memory_id,dim,vector) VALUES (?,?,?)",
+                (memory_id,self.embedder.dim,vector)
+            )
+            self._index_signature(conn,memory_id,band_keys)
+        return memory_id
+
+    def _index_signature(self,conn:sqlite3.Connection,memory_id:int,band_keys:list[int]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO memory_lsh (band,bucket,memory_id) VALUES (?,?,?)",
+            ((band,key,memory_id) for band,key in enumerate(band_keys))
+        )
+
+    def _find_duplicate(self,conn:sqlite3.Connection,signature:array,band_keys:list[int],memory_type:str,exclude_id:int|None=None) -> int|None:
+        '''
+        Looks up memories sharing an LSH bucket and returns the most similar one
+        above DUPLICATE_THRESHOLD
+        '''
+        buckets = " OR ".join("(l.band = ? AND l.bucket = ?)" for _ in band_keys)
+        params = [value for band,key in enumerate(band_keys) for value in (band,key)]
+        candidates = conn.execute(
+            f"""
+            SELECT DISTINCT m.id, m.minhash FROM memory_lsh l
+            JOIN derived_memories m ON m.id = l.memory_id
+            WHERE ({buckets}) AND m.memory_type = ?
+            """,
+            (*params,memory_type)
+        ).fetchall()
+
+        best_id,best_score = None,self.DUPLICATE_THRESHOLD
+        for row in candidates:
+            if row["id"] == exclude_id or row["minhash"] is None:
+                continue
+            score = self.minhasher.similarity(signature,array('I',row["minhash"]))
+            if score >= best_score:
+                best_id,best_score = row["id"],score
+        return best_id
+
+    def consolidate_memories(self,batch_size:int=500,max_batches:int|None=None) -> int:
+        '''
+        Signs memories written before consolidation existed, oldest first, folding
+        near-duplicates into the earliest copy. Returns the number of merged rows
+        '''
+        merged = batches = 0
+        while max_batches is None or batches < max_batches:
+            with self.transaction() as conn:
+                rows = conn.execute(
+                    "SELECT id, session_id, content, memory_type, hit_count, timestamp FROM derived_memories WHERE minhash IS NULL ORDER BY id LIMIT ?",
+                    (batch_size,)
+                ).fetchall()
+                for row in rows:
+                    signature = self.minhasher.signature(row["content"])
+                    band_keys = self.minhasher.band_keys(signature)
+                    duplicate_id = self._find_duplicate(conn,signature,band_keys,row["memory_type"],exclude_id=row["id"])
+                    if duplicate_id is not None:
+                        # the kept copy takes the newer timestamp and session so the cascade doesn't drop it with the older conversation
+                        conn.execute(
+                            """
+                            UPDATE derived_memories SET hit_count = hit_count + ?,
+                                session_id = CASE WHEN ? > timestamp THEN ? ELSE session_id END,
+                                timestamp = MAX(timestamp, ?)
+                            WHERE id = ?
+                            """,
+                            (row["hit_count"],row["timestamp"],row["session_id"],row["timestamp"],duplicate_id)
+                        )
+                        conn.execute("DELETE FROM derived_memories WHERE id = ?",(row["id"],))
+                        merged += 1
+                        continue
+                    conn.execute("UPDATE derived_memories SET minhash = ? WHERE id = ?",(signature.tobytes(),row["id"]))
+                    self._index_signature(conn,row["id"],band_keys)
+            batches += 1
+            if len(rows) < batch_size:
+                break
+        return merged
+
+    def search_similar(self,query:str,limit:int=3,memory_type:str|None=None,min_similarity:float|None=None) -> list[sqlite3.Row]:
+        '''
+        Ranks memories by cosine similarity between their embedding and the query's
+        '''
+        if min_similarity is None:
+            min_similarity = self.MIN_SIMILARITY
+        pool = limit * self.CANDIDATE_POOL_FACTOR if memory_type else limit * 2
+        with self.connection() as conn:
+            while True:
+                hits = self.vectors.search(conn,query,pool)
+                scores = {memory_id:score for memory_id,score in hits if score >= min_similarity}
+                if not scores:
+                    return []
+
+                placeholders = ",".join("?" * len(scores))
+                query_sql = f"SELECT id, content, timestamp, hit_count FROM derived_memories WHERE id IN ({placeholders})"
+                query_params:list = list(scores)
+                if memory_type:
+                    query_sql += " AND memory_type = ?"
+                    query_params.append(memory_type)
+                rows = conn.execute(query_sql,tuple(query_params)).fetchall()
+
+                # ids of deleted or other typed memories crowded out live ones, widen the pool
+                # unless the whole index was searched or the last hit is already too dissimilar
+                if len(rows) >= limit or len(hits) < pool or len(scores) < len(hits):
+                    break
+                pool *= 4
+        rows.sort(key=lambda row: scores[row["id"]],reverse=True)
+        return rows[:limit]
+
+    def compact_vectors(self) -> bool:
+        '''
+        Rebuilds the mirrored embedding matrix when pruned and merged memories left
+        too many stale rows in it, returns whether it was rebuilt
+        '''
+        with self.connection() as conn:
+            return self.vectors.compact(conn)
+
+    def encode_conversation(self,user_prompt:str,history_json:str) -> tuple[int,bytes|str,int|None,int,int]:
+        '''
+        (format, payload, dictionary id, prompt tokens, history tokens) of a conversation,
+        the CPU bound part of save_conversation, kept out of the write transaction
+        '''
+        fmt,payload,dict_id = self.codec.encode(history_json)
+        prompt_tokens,history_tokens = count_tokens([user_prompt,history_json])
+        return fmt,payload,dict_id,prompt_tokens,history_tokens
+
+    def save_conversation(self,session_id:str,user_prompt:str,history_json:str,model_name:str|None=None,
+                          encoded:tuple[int,bytes|str,int|None,int,int]|None=None,conn:sqlite3.Connection|None=None):
+        '''
+        Saves the full conversation history for a given session and adds it to the daily usage rollup.
+        encoded is what encode_conversation returned for it, computed here when missing
+        '''
+        fmt,payload,dict_id,prompt_tokens,history_tokens = encoded or self.encode_conversation(user_prompt,history_json)
+        characters = len(user_prompt) + len(history_json)
+        try:
+            with self._writing(conn) as conn:
+                # a session saved again replaces its row, take the old one out of the rollup first
+                previous = conn.execute(
+                    f"""
+                    SELECT date(timestamp) AS day, model_name, length(user_prompt) + {HISTORY_CHARS_SQL} AS characters,
+                           {PROMPT_TOKENS_SQL} AS prompt_tokens, {HISTORY_TOKENS_SQL} AS history_tokens
+                    FROM conversations WHERE session_id = ?
+                    """,(session_id,)
+                ).fetchone()
+                if previous:
+                    self._roll_up(conn,previous["day"],session_id,previous["model_name"],
+                                  conversations=-1,characters=-previous["characters"],
+                                  prompt_tokens=-previous["prompt_tokens"],history_tokens=-previous["history_tokens"])
+                conn.execute("""
+                INSERT OR REPLACE INTO conversations (session_id,user_prompt,full_history_json,history_format,history_dict_id,history_chars,prompt_tokens,history_tokens,model_name) VALUES (?,?,?,?,?,?,?,?,?)
+                """,(session_id,user_prompt,payload,fmt,dict_id,len(history_json),prompt_tokens,history_tokens,model_name))
+                self._roll_up(conn,None,session_id,model_name,conversations=1,characters=characters,
+                              prompt_tokens=prompt_tokens,history_tokens=history_tokens)
         except sqlite3.Error as e:
             raise e
+
+    def _roll_up(self,conn:sqlite3.Connection,day:str|None,session_id:str,model_name:str|None,**deltas:float):
+        '''
+        Adds deltas to one usage_daily row inside the caller's transaction, day defaults to today
+        '''
+        columns = list(deltas)
+        conn.execute(
+            f"""
+            INSERT INTO usage_daily (day,session_id,model_name,{",".join(columns)})
+            VALUES (COALESCE(?,date('now')),?,?,{",".join("?" * len(columns))})
+            ON CONFLICT (day,session_id,model_name) DO UPDATE SET {",".join(f"{c} = {c} + excluded.{c}" for c in columns)}
+            """,(day,session_id,model_name or "",*deltas.values())
+        )
+
+    def append_turn(self,session_id:str,node_type:str,content_json:str,retry:int=0,conn:sqlite3.Connection|None=None) -> int:
+        '''
+        Appends one node output or history entry to a session, returns its sequence number
+        '''
+        with self._writing(conn) as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq),0) + 1 FROM turns WHERE session_id = ?",(session_id,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO turns (session_id,seq,node_type,retry,content_json) VALUES (?,?,?,?,?)",
+                (session_id,seq,node_type,retry,content_json)
+            )
+        return seq
+
+    def record_usage(self,session_id:str,node:str,model_name:str|None,retry:int,input_tokens:int,output_tokens:int,requests:int,wall_ms:float,conn:sqlite3.Connection|None=None):
+        '''
+        Stores the token usage and wall time reported for one agent run of a node
+        '''
+        with self._writing(conn) as conn:
+            conn.execute(
+                """
+                INSERT INTO node_usage (session_id,node,model_name,retry,input_tokens,output_tokens,requests,wall_ms)
+                VALUES (?,?,?,?,?,?,?,?)
+                """,(session_id,node,model_name,retry,input_tokens,output_tokens,requests,wall_ms)
+            )
+            self._roll_up(conn,None,session_id,model_name,runs=1,requests=requests,
+                          input_tokens=input_tokens,output_tokens=output_tokens,wall_ms=wall_ms)
+
+    def record_latency(self,histograms:dict[tuple[str,str,str],dict[int,int]],conn:sqlite3.Connection|None=None):
+        '''
+        Adds (kind, name, model) -> {bucket: count} histograms to today's counts
+        '''
+        with self._writing(conn) as conn:
+            conn.executemany(
+                """
+                INSERT INTO latency_histogram (kind,name,model_name,day,bucket,count) VALUES (?,?,?,date('now'),?,?)
+                ON CONFLICT (kind,name,model_name,day,bucket) DO UPDATE SET count = count + excluded.count
+                """,
+                [(kind,name,model_name,bucket,count) for (kind,name,model_name),buckets in histograms.items() for bucket,count in buckets.items()]
+            )
+
+    def latency_histograms(self,days:int|None=None) -> dict[tuple[str,str,str],dict[int,int]]:
+        '''
+        Merged histograms per (kind, name, model), optionally of the last N days only
+        '''
+        where = "WHERE day >= date('now',?)" if days else ""
+        histograms:dict[tuple[str,str,str],dict[int,int]] = {}
+        with self.connection() as conn:
+            for row in conn.execute(
+                f"SELECT kind, name, model_name, bucket, SUM(count) AS count FROM latency_histogram {where} GROUP BY kind, name, model_name, bucket",
+                (f"-{days} days",) if days else ()
+            ):
+                histograms.setdefault((row["kind"],row["name"],row["model_name"]),{})[row["bucket"]] = row["count"]
+        return histograms
+
+    def get_turns(self,session_id:str,node_type:str|None=None) -> list[sqlite3.Row]:
+        '''
+        Returns the turns of a session in order, optionally only one node type
+        '''
+        query_sql = "SELECT seq, node_type, retry, content_json, timestamp FROM turns WHERE session_id = ?"
+        query_params:list = [session_id]
+        if node_type:
+            query_sql += " AND node_type = ?"
+            query_params.append(node_type)
+        with self.connection() as conn:
+            return conn.execute(query_sql + " ORDER BY seq",tuple(query_params)).fetchall()
+
+    def get_conversation(self,session_id:str) -> StoredConversation|None:
+        '''
+        Loads a conversation, its history is decompressed on first access
+        '''
+        with self.connection() as conn:
+            row = conn.execute("SELECT * FROM conversations WHERE session_id = ?",(session_id,)).fetchone()
+        return StoredConversation(row,self.codec) if row else None
+
+    def compress_histories(self,batch_size:int=200,recompress:bool=False) -> dict:
+        '''
+        Rewrites stored histories in place with the current codec, one batch per transaction.
+        Plain rows only unless recompress is set. Returns row and byte counts
+        '''
+        where = "" if recompress else f"AND history_format = {FORMAT_PLAIN}"
+        stats = {"rows":0,"before_bytes":0,"after_bytes":0}
+        last_rowid = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    f"SELECT rowid, full_history_json, history_format, history_dict_id FROM conversations WHERE rowid > ? {where} ORDER BY rowid LIMIT ?",
+                    (last_rowid,batch_size)
+                ).fetchall()
+            if not rows:
+                return stats
+
+            updates = []
+            for row in rows:
+                text = self.codec.decode(row["history_format"],row["full_history_json"],row["history_dict_id"])
+                fmt,payload,dict_id = self.codec.encode(text)
+                stats["rows"] += 1
+                stats["before_bytes"] += _payload_size(row["full_history_json"])
+                stats["after_bytes"] += _payload_size(payload)
+                updates.append((payload,fmt,dict_id,len(text),row["rowid"]))
+            with self.transaction() as conn:
+                conn.executemany(
+                    "UPDATE conversations SET full_history_json = ?, history_format = ?, history_dict_id = ?, history_chars = ? WHERE rowid = ?",
+                    updates
+                )
+            last_rowid = rows[-1]["rowid"]
+
+    def count_history_tokens(self,batch_size:int=200,max_batches:int|None=None) -> int:
+        '''
+        Fills in the token counts of conversations saved before they were tracked,
+        one batch per transaction, swapping the chars/4 estimate in the rollup for
+        the counted value. Returns the number of rows counted
+        '''
+        counted = batches = 0
+        while max_batches is None or batches < max_batches:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT rowid, date(timestamp) AS day, session_id, model_name, user_prompt, full_history_json,
+                           history_format, history_dict_id, {PROMPT_TOKENS_SQL} AS prompt_estimate, {HISTORY_TOKENS_SQL} AS history_estimate
+                    FROM conversations WHERE history_tokens IS NULL LIMIT ?
+                    """,
+                    (batch_size,)
+                ).fetchall()
+            if not rows:
+                break
+            histories = [self.codec.decode(row["history_format"],row["full_history_json"],row["history_dict_id"]) for row in rows]
+            prompts = count_tokens([row["user_prompt"] for row in rows])
+            tokens = count_tokens(histories)
+            with self.transaction() as conn:
+                for prompt,history,row in zip(prompts,tokens,rows):
+                    # skipped when the session was saved again since it was read
+                    updated = conn.execute(
+                        "UPDATE conversations SET prompt_tokens = ?, history_tokens = ? WHERE rowid = ? AND history_tokens IS NULL",
+                        (prompt,history,row["rowid"])
+                    ).rowcount
+                    if updated:
+                        self._roll_up(conn,row["day"],row["session_id"],row["model_name"],
+                                      prompt_tokens=prompt - row["prompt_estimate"],history_tokens=history - row["history_estimate"])
+            counted += len(rows)
+            batches += 1
+        return counted
+
+    def rebuild_usage_daily(self) -> int:
+        '''
+        Recomputes the daily usage rollup from the raw conversation and node_usage rows,
+        totals of pruned days are lost. Returns the number of rollup rows written
+        '''
+        self.count_history_tokens()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM usage_daily")
+            self._fill_usage_daily(cursor)
+            return cursor.execute("SELECT COUNT(*) FROM usage_daily").fetchone()[0]
+
+    def _fill_usage_daily(self,cursor:sqlite3.Cursor):
+        cursor.execute(f"""
+        INSERT INTO usage_daily (day,session_id,model_name,conversations,characters,prompt_tokens,history_tokens)
+        SELECT date(timestamp), session_id, COALESCE(model_name,''), COUNT(*),
+               SUM(length(user_prompt) + {HISTORY_CHARS_SQL}), SUM({PROMPT_TOKENS_SQL}), SUM({HISTORY_TOKENS_SQL})
+        FROM conversations
+        GROUP BY 1,2,3
+        """)
+        # WHERE true keeps the parser from reading ON CONFLICT as a join constraint
+        cursor.execute("""
+        INSERT INTO usage_daily (day,session_id,model_name,runs,requests,input_tokens,output_tokens,wall_ms)
+        SELECT date(timestamp), session_id, COALESCE(model_name,''), COUNT(*),
+               SUM(requests), SUM(input_tokens), SUM(output_tokens), SUM(wall_ms)
+        FROM node_usage
+        WHERE true
+        GROUP BY 1,2,3
+        ON CONFLICT (day,session_id,model_name) DO UPDATE SET
+            runs = excluded.runs, requests = excluded.requests, input_tokens = excluded.input_tokens,
+            output_tokens = excluded.output_tokens, wall_ms = excluded.wall_ms
+        """)
+
+    @classmethod
+    def has_sessions(cls,table:str) -> bool:
+        '''
+        Whether an exportable table has a session_id column to filter by
+        '''
+        return any(name == "session_id" for name,_ in cls.EXPORT_TABLES[table][1])
+
+    def export_rows(self,table:str,since:str|None=None,until:str|None=None,session_id:str|None=None,batch_size:int=1000) -> Iterator[list[tuple]]:
+        '''
+        Streams a table in batches of tuples ordered like EXPORT_TABLES, since and until are
+        inclusive YYYY-MM-DD dates. Only one batch is held in memory at a time.
+        A session filter is only accepted by tables with a session_id column
+        '''
+        if table not in self.EXPORT_TABLES:
+            raise ValueError(f"Unknown table {table}, expected one of {', '.join(self.EXPORT_TABLES)}")
+        if session_id and not self.has_sessions(table):
+            raise ValueError(f"Table {table} isn't kept per session and can't be filtered by one")
+        time_column,columns = self.EXPORT_TABLES[table]
+        names = [name for name,_ in columns]
+        decode = "history_json" in names
+        if decode:
+            at = names.index("history_json")
+            names[at:at + 1] = ["full_history_json","history_format","history_dict_id"]
+
+        conditions,params = [],[]
+        if since:
+            conditions.append(f"{time_column} >= ?")
+            params.append(since)
+        if until:
+            conditions.append(f"{time_column} < date(?,'+1 day')")
+            params.append(until)
+        if session_id:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.connection() as conn:
+            cursor = conn.execute(f"SELECT {', '.join(names)} FROM {table} {where} ORDER BY {time_column}",params)
+            while rows := cursor.fetchmany(batch_size):
+                if decode:
+                    rows = [tuple(row[:at]) + (self.codec.decode(row[at + 1],row[at],row[at + 2]),) + tuple(row[at + 3:]) for row in rows]
+                else:
+                    rows = [tuple(row) for row in rows]
+                yield rows
+
+    def train_history_dictionary(self,sample_limit:int=2000,dict_size:int=64 * 1024) -> int:
+        '''
+        Trains a zstd dictionary on the most recent histories and makes it the one new rows use
+        '''
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT full_history_json, history_format, history_dict_id FROM conversations ORDER BY timestamp DESC LIMIT ?",
+                (sample_limit,)
+            ).fetchall()
+        samples = [self.codec.decode(row["history_format"],row["full_history_json"],row["history_dict_id"]) for row in rows]
+        dictionary = train_dictionary(samples,dict_size)
+        with self.transaction() as conn:
+            dict_id = conn.execute("INSERT INTO compression_dicts (content) VALUES (?)",(dictionary,)).lastrowid
+            self.codec = self._load_codec(conn)
+        return dict_id
     
-    def prune_old_memories(self,days_to_keep:int=30):
+    def prune_old_memories(self,days_to_keep:int=30,chunk_size:int=500,max_chunks:int|None=None) -> int:
         '''
-        Deleted old memories
+        Deletes old memories in chunks through the timestamp indexes, each chunk in its
+        own short transaction. Stops after max_chunks so the rest is left for a later run.
+        Returns the number of deleted rows
         '''
         if days_to_keep <= 0:
             days_to_keep = 1
-        
+        cutoff = f"-{days_to_keep} days"
+        deleted = chunks = 0
+
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
+            for table in ("derived_memories","conversations","turns","node_usage"):
+                while max_chunks is None or chunks < max_chunks:
+                    with self.transaction() as conn:
+                        # conversations cascade to their memories, vectors and FTS rows
+                        count = conn.execute(
+                            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE timestamp < datetime('now',?) LIMIT ?)",
+                            (cutoff,chunk_size)
+                        ).rowcount
+                    deleted += count
+                    chunks += 1
+                    if count < chunk_size:
+                        break
+        except sqlite3.Error as _:
+            pass
+        return deleted
 
-            cutoff_date_str = f"{days_to_keep} days"
+    def get_meta(self,key:str) -> str|None:
+        with self.connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?",(key,)).fetchone()
+        return row["value"] if row else None
 
-            cursor.execute("DELETE FROM derived_memories WHERE timestamp < date('now','-' || ?)",(cutoff_date_str,))
-            cursor.execute("DELETE FROM conversations WHERE timestamp < date('now','-' || ?)",(cutoff_date_str,))
+    def set_meta(self,key:str,value:str,conn:sqlite3.Connection|None=None):
+        with self._writing(conn) as conn:
+            conn.execute("INSERT INTO meta (key,value) VALUES (?,?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",(key,value))
 
-            conn.commit()
-        except sqlite3.Error as _:
-            pass
\ No newline at end of file
+    def db_stats(self) -> dict:
+        '''
+        Reports the size of the database files and how fragmented the pages are
+        '''
+        with self.connection() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            conversations = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            memories = conn.execute("SELECT COUNT(*) FROM derived_memories").fetchone()[0]
+
+        wal_path = self.db_path.with_name(self.db_path.name + "-wal")
+        return {
+            "file_bytes": self.db_path.stat().st_size,
+            "wal_bytes": wal_path.stat().st_size if wal_path.exists() else 0,
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "fragmentation": freelist_count / page_count if page_count else 0.0,
+            "incremental_vacuum": auto_vacuum == 2,
+            "conversations": conversations,
+            "memories": memories,
+        }
+
+    def vacuum(self,max_pages:int|None=None,full:bool=False):
+        '''
+        Returns free pages to the file system. Incremental by default, a full VACUUM
+        is needed once to switch databases created before auto_vacuum was enabled
+        '''
+        with self.connection() as conn:
+            if full:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            else:
+                # executescript steps the pragma to completion, execute frees a single page
+                pages = "" if max_pages is None else f"({int(max_pages)})"
+                conn.executescript(f"PRAGMA incremental_vacuum{pages};")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def analyze(self):
+        '''
+        Refreshes the query planner statistics
+        '''
+        with self.connection() as conn:
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+
+def _payload_size(payload:bytes|str) -> int:
+    return len(payload.encode("utf-8")) if isinstance(payload,str) else len(payload)
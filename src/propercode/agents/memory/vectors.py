@@ -0,0 +1,177 @@
+import re
+import heapq
+import sqlite3
+import zlib
+from array import array
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError: # numpy is an optional extra, search falls back to pure python
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class HashingEmbedder:
+    '''
+    Offline text embedder built from hashed character n-grams and word unigrams
+    '''
+    def __init__(self,dim:int=512,ngram_sizes:tuple[int,...]=(3,4,5)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def _features(self,text:str):
+        normalized = " " + " ".join(re.findall(r"\w+",text.lower())) + " "
+        for n in self.ngram_sizes:
+            for i in range(len(normalized) - n + 1):
+                yield normalized[i:i+n]
+        for word in normalized.split():
+            yield "w:" + word
+
+    def embed(self,text:str) -> array:
+        '''
+        Returns an L2 normalised float32 vector for the text
+        '''
+        vector = array('f',bytes(4 * self.dim))
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # the top bit picks the sign so that collisions tend to cancel out
+            vector[h % self.dim] += -1.0 if h & 0x80000000 else 1.0
+        norm = sum(v * v for v in vector) ** 0.5
+        if norm > 0:
+            for i in range(self.dim):
+                vector[i] /= norm
+        return vector
+
+    def pack(self,text:str) -> bytes:
+        return self.embed(text).tobytes()
+
+class VectorIndex:
+    '''
+    Top-k cosine search over the packed vectors stored in memory_vectors.
+    The vectors are mirrored into an append-only float32 matrix next to the
+    database which is memory mapped on first search and only ever extended
+    with the rows written since the last sync
+    '''
+    def __init__(self,index_dir:Path,embedder:HashingEmbedder):
+        self.embedder = embedder
+        self.matrix_path = index_dir / "memory_vectors.f32"
+        self.ids_path = index_dir / "memory_vectors.ids"
+        self.lock_path = index_dir / "memory_vectors.lock"
+        # (matrix, ids) memory maps, swapped as one so a search never pairs a matrix with the ids of another
+        self._mapped = None
+
+    def _row_count(self) -> int:
+        if not self.ids_path.exists():
+            return 0
+        return self.ids_path.stat().st_size // 8
+
+    def _is_consistent(self) -> bool:
+        if not self.matrix_path.exists() or not self.ids_path.exists():
+            return not self.matrix_path.exists() and not self.ids_path.exists()
+        return self.matrix_path.stat().st_size == self._row_count() * 4 * self.embedder.dim
+
+    def _last_id(self) -> int:
+        if self._row_count() == 0:
+            return 0
+        with self.ids_path.open("rb") as f:
+            f.seek(-8,2)
+            return array('q',f.read(8))[0]
+
+    def reset(self):
+        '''
+        Drops the mirrored matrix, it is rebuilt from the database on the next search
+        '''
+        self._mapped = None
+        self.matrix_path.unlink(missing_ok=True)
+        self.ids_path.unlink(missing_ok=True)
+
+    def sync(self,conn:sqlite3.Connection):
+        '''
+        Appends vectors written since the last sync to the mirrored matrix
+        '''
+        with self.lock_path.open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+            if not self._is_consistent():
+                self.reset()
+
+            rows = conn.execute(
+                "SELECT memory_id, vector FROM memory_vectors WHERE memory_id > ? AND dim = ? ORDER BY memory_id",
+                (self._last_id(),self.embedder.dim)
+            )
+            appended = False
+            with self.matrix_path.open("ab") as matrix_file,self.ids_path.open("ab") as ids_file:
+                while batch := rows.fetchmany(1024):
+                    matrix_file.write(b"".join(row[1] for row in batch))
+                    ids_file.write(array('q',[row[0] for row in batch]).tobytes())
+                    appended = True
+            if appended or self._mapped is None:
+                self._load()
+
+    def _load(self):
+        count = self._row_count()
+        if np is None or count == 0:
+            self._mapped = None
+            return
+        self._mapped = (
+            np.memmap(self.matrix_path,dtype=np.float32,mode="r",shape=(count,self.embedder.dim)),
+            np.memmap(self.ids_path,dtype=np.int64,mode="r",shape=(count,)),
+        )
+
+    def _stale_fraction(self,conn:sqlite3.Connection) -> float:
+        count = self._row_count()
+        if count == 0:
+            return 0.0
+        live = conn.execute("SELECT COUNT(*) FROM memory_vectors WHERE dim = ?",(self.embedder.dim,)).fetchone()[0]
+        return 1.0 - live / count
+
+    def compact(self,conn:sqlite3.Connection,max_stale:float=0.25) -> bool:
+        '''
+        Rebuilds the mirrored matrix once deleted memories make up too much of it,
+        returns whether it was rebuilt
+        '''
+        with self.lock_path.open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+            if self._stale_fraction(conn) <= max_stale:
+                return False
+            # searches still holding the old maps keep reading them, unlinked files stay mapped
+            self.reset()
+        self.sync(conn)
+        return True
+
+    def search(self,conn:sqlite3.Connection,query:str,k:int) -> list[tuple[int,float]]:
+        '''
+        Returns up to k (memory_id, cosine similarity) pairs, best first.
+        Ids of deleted memories may be included and must be filtered by the caller
+        '''
+        query_vector = self.embedder.embed(query)
+        if np is None:
+            return self._search_python(conn,query_vector,k)
+
+        self.sync(conn)
+        mapped = self._mapped
+        if mapped is None:
+            return []
+        matrix,ids = mapped
+        scores = matrix @ np.frombuffer(query_vector,dtype=np.float32)
+        k = min(k,len(scores))
+        top = np.argpartition(-scores,k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]),float(scores[i])) for i in top]
+
+    def _search_python(self,conn:sqlite3.Connection,query_vector:array,k:int) -> list[tuple[int,float]]:
+        best = []
+        rows = conn.execute("SELECT memory_id, vector FROM memory_vectors WHERE dim = ?",(self.embedder.dim,))
+        while batch := rows.fetchmany(1024):
+            for memory_id,blob in batch:
+                vector = array('f',blob)
+                score = sum(a * b for a,b in zip(query_vector,vector))
+                heapq.heappush(best,(score,memory_id))
+                if len(best) > k:
+                    heapq.heappop(best)
+        return [(memory_id,score) for score,memory_id in sorted(best,reverse=True)]
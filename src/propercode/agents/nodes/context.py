@@ -1,42 +1,61 @@
+import asyncio
 from rich import print
-from typing import Any
-from pydantic_ai import Agent,ModelSettings
 from pydantic_graph import BaseNode, GraphRunContext
-from dataclasses import dataclass,field
+from dataclasses import dataclass
 
-from propercode.agents.nodes import CONTEXT_SYSTEM_PROMPT
-from propercode.agents.memory.state import AgentState
+from propercode.agents.memory.state import AgentState,GraphDeps
 from propercode.agents.nodes.plan import PlanNode
-from propercode.models.agents.node_outputs import ContextNodeOutput
-from propercode.agents.tools.file import read_file,file_tree_structure
+from propercode.agents.packer import pack_context
+from propercode.agents.tools.imports import default_import_graph
+from propercode.agents.tools.summaries import default_summary_cache
+
+# files suggested to the context agent from the import graph before it starts,
+# each with the first lines of its cached summary
+PRESELECTED_FILES = 8
+SUMMARY_PREVIEW_LINES = 20
 
 @dataclass
-class ContextNode(BaseNode[AgentState,None,str]): # base node tells we need only AgentState as memory and outputs str
+class ContextNode(BaseNode[AgentState,GraphDeps,str]): # AgentState as memory, GraphDeps as shared services and outputs str
     '''
     Gathers information about the current project and stores in context
     '''
-    context_agent : Agent[Any,ContextNodeOutput] = field(
-        default_factory= lambda: Agent(
-        model=None,
-        system_prompt=CONTEXT_SYSTEM_PROMPT,
-        output_type=ContextNodeOutput,
-        retries=2,
-        model_settings=ModelSettings(temperature=0.0),
-        tools = [file_tree_structure,read_file],
-        )
-    )
-
-    async def run(self,ctx:GraphRunContext[AgentState]) -> PlanNode:
+    async def run(self,ctx:GraphRunContext[AgentState,GraphDeps]) -> PlanNode:
         try:
             if ctx.state.conversation_history is not None:
-                ctx.state.conversation_history.append(f"User requested: {ctx.state.user_prompt}")
+                ctx.deps.record_history(ctx.state,f"User requested: {ctx.state.user_prompt}")
             
-            self.context_agent.model = ctx.state.chat_model
             prompt = f"""User Request: '{ctx.state.user_prompt}'\nBased on the user's request, search your memory and read the relevant files to gather the best context for this task."""
-            result = await self.context_agent.run(prompt)
+            prompt += await self._preselect(ctx.state.user_prompt)
+            result = await ctx.deps.run_agent(ctx.state,"context",ctx.deps.agents.context,prompt)
             ctx.state.context_output = result.output
+            ctx.deps.record_turn(ctx.state,"context",result.output)
+            # the later prompts get the chunks most relevant to the request instead of everything that was read
+            ctx.state.packed_context = await asyncio.to_thread(pack_context,ctx.state.user_prompt,result.output.files,result.output.context,ctx.state.context_token_budget)
             print("[bold]Context Agent :[/bold]")
             print(f"[dim]Thoughts:\n{result.output.thought}[/dim]")
             return PlanNode()
         except Exception as e:
-            raise e
\ No newline at end of file
+            raise e
+
+    async def _preselect(self,user_prompt:str) -> str:
+        '''
+        The files the import graph ranks highest with their summaries, so the agent
+        reads raw text only where the summary isn't enough
+        '''
+        try:
+            ranked = await asyncio.to_thread(default_import_graph().rank,user_prompt,PRESELECTED_FILES)
+            summaries = await asyncio.to_thread(default_summary_cache().summaries,[path for path,_,_ in ranked])
+        except Exception:
+            return ""
+        if not ranked:
+            return ""
+        sections = []
+        for path,_,reason in ranked:
+            section = f"- {path} ({reason})"
+            summary = summaries.get(path,"").splitlines()
+            if summary:
+                section += "\n" + "\n".join(f"    {line}" for line in summary[:SUMMARY_PREVIEW_LINES])
+                if len(summary) > SUMMARY_PREVIEW_LINES:
+                    section += "\n    ..."
+            sections.append(section)
+        return "\nFiles the import graph ranks as most related to the request, with summaries. Read the raw text only of what you need:\n" + "\n".join(sections)
\ No newline at end of file
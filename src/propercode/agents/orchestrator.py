@@ -1,3 +1,4 @@
+import asyncio
 from uuid import uuid4
 from typing import Tuple
 from pydantic_graph import Graph
@@ -5,45 +6,64 @@ from pydantic_graph import Graph
 from propercode.agents.nodes.plan import PlanNode
 from propercode.agents.nodes.context import ContextNode
 from propercode.agents.nodes.code_eval import CodeNode,EvaluationNode
-from propercode.agents.memory.state import AgentState
+from propercode.agents.memory.state import AgentState,GraphDeps
 from propercode.agents.memory.store import MemoryStore
+from propercode.agents.memory.async_store import AsyncMemoryStore
 from propercode.agents.memory.manager import MemoryManager
 from propercode.agents.providers.openrouter import OpenRouterProvider
+from propercode.agents.packer import DEFAULT_CONTEXT_TOKENS
+from propercode.agents.registry import AgentRegistry
 
 class CodeOrchestrator:
     '''
     Main agent
     '''
-    def __init__(self,model_name:str,prune_days:int=30,prune_prob:float=0.1):
+    def __init__(self,model_name:str,prune_days:int=30,prune_prob:float=0.1,memory_pool_size:int=4,context_token_budget:int=DEFAULT_CONTEXT_TOKENS):
         self.model_name=model_name
-        self.graph = Graph[AgentState,None,str](nodes=[ContextNode,PlanNode,CodeNode,EvaluationNode])
-        self.memory_store = MemoryStore()
-        self.memory_manager = MemoryManager(store=self.memory_store,prune_prob=prune_prob)
-        self.memory_manager.prune(prune_days)
+        self.graph = Graph[AgentState,GraphDeps,str](nodes=[ContextNode,PlanNode,CodeNode,EvaluationNode])
+        self.memory_store = MemoryStore(pool_size=memory_pool_size)
+        self.memory = AsyncMemoryStore(self.memory_store)
+        self.memory_manager = MemoryManager(store=self.memory,prune_prob=prune_prob)
+        self.prune_days = prune_days
+        self.context_token_budget = context_token_budget
+        self._background:set[asyncio.Task] = set()
+        self._provider:OpenRouterProvider|None = None
         self._chat_model = None
+        self._agents:AgentRegistry|None = None
 
     def _get_chat_model(self):
         if self._chat_model is None:
-            provider = OpenRouterProvider()
-            self._chat_model = provider.get_chat_model(self.model_name)
+            self._provider = OpenRouterProvider()
+            self._chat_model = self._provider.get_chat_model(self.model_name)
         return self._chat_model
 
+    def _get_agents(self) -> AgentRegistry:
+        '''
+        The node agents, built on first use and reused by every run after
+        '''
+        if self._agents is None:
+            self._agents = AgentRegistry.build(self._get_chat_model())
+        return self._agents
+
     async def run(self,state:AgentState) -> Tuple[str,AgentState]:
         '''
         Runs the agent
         '''
         state = state.model_copy(update={
-            "session_id": uuid4()
+            "session_id": uuid4(),
+            "context_token_budget": self.context_token_budget
         })
 
         state = state.model_copy(update={"chat_model":self._get_chat_model()})
 
-        await self.memory_manager.prime(state)
+        state = await self.memory_manager.prime(state)
 
+        deps = GraphDeps(memory=self.memory,agents=self._get_agents())
         try:
-            run_result = await self.graph.run(ContextNode(),state=state)
+            run_result = await self.graph.run(ContextNode(),state=state,deps=deps)
             final_output = run_result.output or "Completed"
-            final_state = state
+            final_state = run_result.state
+            final_state.errors.extend(await deps.flush())
 
             if not final_state.errors:
                 await self.memory_manager.summarize_and_save(final_state)
@@ -51,4 +71,19 @@ class CodeOrchestrator:
         except Exception as e:
             raise e
         finally:
-            self.memory_store.close_conn()
\ No newline at end of file
+            await deps.flush()
+            # pruning runs after the result is returned, aclose waits for it
+            task = asyncio.create_task(self.memory_manager.prune(self.prune_days))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def aclose(self):
+        '''
+        Waits for background maintenance and pending memory writes, then closes the store
+        '''
+        if self._background:
+            await asyncio.gather(*self._background,return_exceptions=True)
+        await self.memory.aclose()
+        self.memory_store.close_conn()
+        if self._provider is not None:
+            await self._provider.aclose()
\ No newline at end of file
@@ -0,0 +1,158 @@
+import os
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass
+
+from propercode.agents.tokenizer import count_tokens
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.tools.file import SNIFF_BYTES,sniff_encoding
+from propercode.agents.tools.file_index import default_index
+
+DEFAULT_CONTEXT_TOKENS = 6000
+# a chunk ends at the first blank line after CHUNK_LINES / 2 lines or at CHUNK_LINES
+CHUNK_LINES = 40
+MAX_LINE_CHARS = 400
+# files larger than this are only packed up to it
+MAX_PACK_FILE_BYTES = 512 * 1024
+# BM25 parameters, the usual defaults
+K1 = 1.5
+B = 0.75
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+STOPWORDS = frozenset("a an and are as at be by can do for from how i in is it me my of on or please should so that the this to we with you".split())
+
+@dataclass
+class Chunk:
+    source:str
+    start_line:int
+    end_line:int
+    text:str
+    order:int = 0
+    score:float = 0.0
+    tokens:int = 0
+
+    def render(self) -> str:
+        return f"### {self.source} (lines {self.start_line}-{self.end_line})\n{self.text}"
+
+def terms(text:str) -> list[str]:
+    '''
+    Lower case search terms, identifiers also yield their snake_case and camelCase parts
+    '''
+    result = []
+    for word in IDENTIFIER.findall(text):
+        lower = word.lower()
+        if lower in STOPWORDS or len(lower) < 2:
+            continue
+        result.append(lower)
+        parts = [part.lower() for piece in word.split("_") for part in CAMEL.findall(piece)]
+        if len(parts) > 1:
+            result.extend(part for part in parts if len(part) > 1 and part not in STOPWORDS)
+    return result
+
+def chunk_text(source:str,text:str) -> list[Chunk]:
+    '''
+    Splits text into chunks of whole lines, cut at blank lines where possible
+    '''
+    lines = text.splitlines()
+    chunks,start = [],0
+    for i,line in enumerate(lines):
+        size = i + 1 - start
+        if size >= CHUNK_LINES or (size >= CHUNK_LINES // 2 and not line.strip()):
+            chunks.append((start,i + 1))
+            start = i + 1
+    if start < len(lines):
+        chunks.append((start,len(lines)))
+    result = []
+    for begin,end in chunks:
+        while begin < end and not lines[begin].strip():
+            begin += 1
+        while end > begin and not lines[end - 1].strip():
+            end -= 1
+        if begin < end:
+            result.append(Chunk(source,begin + 1,end,"\n".join(line[:MAX_LINE_CHARS] for line in lines[begin:end])))
+    return result
+
+def bm25(query:list[str],documents:list[list[str]]) -> list[float]:
+    '''
+    Okapi BM25 score of every document against the query terms
+    '''
+    if not documents:
+        return []
+    frequencies = [Counter(document) for document in documents]
+    average = sum(len(document) for document in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for counts in frequencies for term in counts)
+    idf = {term:math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5)) for term in set(query)}
+    query_counts = Counter(query)
+    scores = []
+    for document,counts in zip(documents,frequencies):
+        norm = K1 * (1 - B + B * len(document) / average)
+        score = 0.0
+        for term,weight in query_counts.items():
+            tf = counts.get(term,0)
+            if tf:
+                score += weight * idf[term] * tf * (K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+def _load(path:str) -> str|None:
+    '''
+    Text of a project file, None when it is missing or binary
+    '''
+    index = default_index()
+    rel_path = index.relative(path)
+    meta = index.stat(rel_path) if rel_path else None
+    try:
+        if meta is not None and meta.size <= MAX_PACK_FILE_BYTES:
+            data = index.read_bytes(rel_path)
+        else:
+            with open(path,'rb') as f:
+                data = f.read(MAX_PACK_FILE_BYTES)
+    except OSError:
+        return None
+    if data is None:
+        return None
+    encoding = sniff_encoding(data[:SNIFF_BYTES])
+    if encoding is None:
+        return None
+    return data.decode(encoding,errors="replace")
+
+@RECORDER.timed("stage","pack_context")
+def pack_context(query:str,files:list[str],notes:str="",budget:int=DEFAULT_CONTEXT_TOKENS) -> str:
+    '''
+    Splits the files and the gathered notes into chunks, ranks them against the
+    query with BM25 and returns the best ones that fit in budget tokens, grouped
+    by source in their original order
+    '''
+    chunks = chunk_text("context notes",notes) if notes else []
+    index = default_index()
+    for path in dict.fromkeys(files):
+        text = _load(path)
+        if text is not None:
+            chunks.extend(chunk_text(index.relative(path) or os.path.abspath(path),text))
+    if not chunks:
+        return ""
+    for order,chunk in enumerate(chunks):
+        chunk.order = order
+    for chunk,score in zip(chunks,bm25(terms(query),[terms(chunk.text) for chunk in chunks])):
+        chunk.score = score
+    for chunk,tokens in zip(chunks,count_tokens([chunk.render() for chunk in chunks])):
+        chunk.tokens = tokens
+
+    # best first, equally scored chunks keep the order they were gathered in
+    selected,used = [],0
+    for chunk in sorted(chunks,key=lambda chunk: (-chunk.score,chunk.order)):
+        if used + chunk.tokens <= budget:
+            selected.append(chunk)
+            used += chunk.tokens
+
+    first_seen:dict[str,int] = {}
+    for chunk in sorted(selected,key=lambda chunk: (-chunk.score,chunk.order)):
+        first_seen.setdefault(chunk.source,len(first_seen))
+    selected.sort(key=lambda chunk: (first_seen[chunk.source],chunk.start_line))
+    packed = "\n\n".join(chunk.render() for chunk in selected)
+    dropped = len(chunks) - len(selected)
+    if dropped:
+        packed += f"\n\n[{dropped} less relevant chunks left out to stay within {budget} tokens]"
+    return packed
@@ -10,4 +10,10 @@ class BaseProvider(ABC):
         '''
         Returns the model instance from the provider
         '''
-        pass
\ No newline at end of file
+        pass
+
+    async def aclose(self):
+        '''
+        Releases the provider's connections
+        '''
+        pass
@@ -1,3 +1,4 @@
+import httpx
 from typing import Any
 from keyring import get_password
 
@@ -8,15 +9,32 @@ from propercode.agents.providers.base import BaseProvider
 
 class OpenRouterProvider(BaseProvider):
     '''
-    Open Router LLM Provider
+    Open Router LLM Provider. Every model it hands out sends its requests through
+    one pooled keep-alive HTTP client, so only the first request of a process
+    pays for the TCP and TLS handshakes
     '''
+    # the timeouts the OpenAI client uses, long generations stream for minutes
+    TIMEOUT = httpx.Timeout(600,connect=5)
+    LIMITS = httpx.Limits(max_connections=32,max_keepalive_connections=16,keepalive_expiry=120)
 
-    def __init__(self):
-        self._api_key = get_password("propercode","openrouter_api")
+    def __init__(self,http_client:httpx.AsyncClient|None=None,api_key:str|None=None):
+        self._api_key = api_key or get_password("propercode","openrouter_api")
         if not self._api_key:
             raise ValueError("API Key is not available")
-        
-        self.client = PydanticOpenRouterProvider(api_key=self._api_key)
-    
+
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or httpx.AsyncClient(timeout=self.TIMEOUT,limits=self.LIMITS)
+        self.client = PydanticOpenRouterProvider(api_key=self._api_key,http_client=self.http_client)
+        self._models:dict[str,Any] = {}
+
     def get_chat_model(self, model_name: str) -> Any:
-        return OpenAIChatModel(model_name=model_name,provider=self.client)
\ No newline at end of file
+        if model_name not in self._models:
+            self._models[model_name] = OpenAIChatModel(model_name=model_name,provider=self.client)
+        return self._models[model_name]
+
+    async def aclose(self):
+        '''
+        Closes the pooled connections when the client was created here
+        '''
+        if self._owns_http_client:
+            await self.http_client.aclose()
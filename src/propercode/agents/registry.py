@@ -0,0 +1,59 @@
+from typing import Any
+from dataclasses import dataclass
+from pydantic_ai import Agent,ModelSettings
+
+from propercode.agents.nodes import CONTEXT_SYSTEM_PROMPT,PLAN_SYSTEM_PROMPT,CODE_SYSTEM_PROMPT,EVAL_SYSTEM_PROMPT
+from propercode.models.agents.node_outputs import ContextNodeOutput,PlanNodeOutput,CodeNodeOutput,EvaluationNodeOutput
+from propercode.agents.tools.file import read_file,read_files,file_tree_structure
+from propercode.agents.tools.memory import search_memory
+from propercode.agents.tools.search import search_code
+from propercode.agents.tools.imports import related_files
+from propercode.agents.tools.summaries import file_summaries
+from propercode.agents.tools.symbols import find_symbol,get_symbol_source
+
+@dataclass(frozen=True)
+class AgentRegistry:
+    '''
+    The agents of every graph node, built once per orchestrator around its chat
+    model and shared by all nodes, retries and runs. Agents keep no state between
+    runs so sharing them is safe, concurrent runs included
+    '''
+    context:Agent[Any,ContextNodeOutput]
+    plan:Agent[Any,PlanNodeOutput]
+    code:Agent[Any,CodeNodeOutput]
+    evaluation:Agent[Any,EvaluationNodeOutput]
+
+    @classmethod
+    def build(cls,model:Any) -> "AgentRegistry":
+        return cls(
+            context=Agent(
+                model=model,
+                system_prompt=CONTEXT_SYSTEM_PROMPT,
+                output_type=ContextNodeOutput,
+                retries=2,
+                model_settings=ModelSettings(temperature=0.0),
+                tools=[search_memory,related_files,file_summaries,file_tree_structure,find_symbol,get_symbol_source,search_code,read_files,read_file],
+            ),
+            plan=Agent(
+                model=model,
+                system_prompt=PLAN_SYSTEM_PROMPT,
+                output_type=PlanNodeOutput,
+                retries=3,
+                model_settings=ModelSettings(temperature=0.3),
+                tools=[search_memory],
+            ),
+            code=Agent(
+                model=model,
+                system_prompt=CODE_SYSTEM_PROMPT,
+                output_type=CodeNodeOutput,
+                retries=3,
+                model_settings=ModelSettings(temperature=0.3),
+            ),
+            evaluation=Agent(
+                model=model,
+                system_prompt=EVAL_SYSTEM_PROMPT,
+                output_type=EvaluationNodeOutput,
+                retries=3,
+                model_settings=ModelSettings(temperature=0.2),
+            ),
+        )
@@ -0,0 +1,212 @@
+import re
+import heapq
+import hashlib
+import threading
+import warnings
+from collections import Counter,OrderedDict,defaultdict
+from functools import cache
+from importlib import resources
+from pathlib import Path
+from typing import Iterable
+
+# splits text into the chunks merges are applied within, close to the GPT-2 pattern
+# without the \p{..} classes the re module lacks
+PRETOKENIZE = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""")
+
+MERGES_FILE = "bpe_merges.txt"
+# rough characters per token, used when no BPE count is available
+CHARS_PER_TOKEN = 4
+
+class BPETokenizer:
+    '''
+    Offline byte-level BPE tokenizer for counting tokens without a provider.
+    The vendored merges were trained on python source and english prose so
+    counts track real tokenizers on code far better than chars/4.
+    Totals are cached per text under its content hash and per chunk so
+    counting thousands of similar histories stays fast
+    '''
+    def __init__(self,merges:list[tuple[bytes,bytes]],cache_size:int=4096,chunk_cache_size:int=200_000):
+        self.merges = merges
+        self.ranks = {pair:rank for rank,pair in enumerate(merges)}
+        self.cache_size = cache_size
+        self.chunk_cache_size = chunk_cache_size
+        self._cache:OrderedDict[bytes,int] = OrderedDict()
+        self._chunks:dict[str,int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls,path:Path|None=None,**kwargs) -> "BPETokenizer":
+        '''
+        Loads merges written by save, defaults to the vendored table
+        '''
+        text = path.read_text() if path else resources.files("propercode.agents").joinpath("data",MERGES_FILE).read_text()
+        merges = []
+        for line in text.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            first,second = line.split(" ")
+            merges.append((bytes.fromhex(first),bytes.fromhex(second)))
+        return cls(merges,**kwargs)
+
+    def save(self,path:Path):
+        lines = ["# byte-level BPE merges, one 'hex hex' pair per line in rank order"]
+        lines += [f"{first.hex()} {second.hex()}" for first,second in self.merges]
+        path.write_text("\n".join(lines) + "\n")
+
+    @classmethod
+    def train(cls,texts:Iterable[str],num_merges:int=8000) -> "BPETokenizer":
+        '''
+        Learns merges from sample texts, updating pair counts incrementally
+        '''
+        words = Counter(chunk for text in texts for chunk in PRETOKENIZE.findall(text))
+        symbols = [[bytes([b]) for b in word.encode("utf-8")] for word in words]
+        counts = list(words.values())
+        pairs:Counter = Counter()
+        where = defaultdict(set)
+        for i,word in enumerate(symbols):
+            for pair in zip(word,word[1:]):
+                pairs[pair] += counts[i]
+                where[pair].add(i)
+        # max-heap with stale entries skipped on pop, a pair is pushed again whenever its count grows
+        heap = [(-freq,pair) for pair,freq in pairs.items()]
+        heapq.heapify(heap)
+
+        merges = []
+        while len(merges) < num_merges and heap:
+            freq,best = heapq.heappop(heap)
+            if -freq != pairs.get(best):
+                continue
+            if -freq < 2:
+                break
+            merges.append(best)
+            merged = best[0] + best[1]
+            touched = set()
+            for i in where.pop(best,()):
+                word = symbols[i]
+                for pair in zip(word,word[1:]):
+                    pairs[pair] -= counts[i]
+                    touched.add(pair)
+                new,j = [],0
+                while j < len(word):
+                    if j < len(word) - 1 and word[j] == best[0] and word[j + 1] == best[1]:
+                        new.append(merged)
+                        j += 2
+                    else:
+                        new.append(word[j])
+                        j += 1
+                symbols[i] = new
+                for pair in zip(new,new[1:]):
+                    pairs[pair] += counts[i]
+                    where[pair].add(i)
+                    touched.add(pair)
+            del pairs[best]
+            for pair in touched:
+                if pairs.get(pair,0) > 0:
+                    heapq.heappush(heap,(-pairs[pair],pair))
+                elif pair in pairs:
+                    del pairs[pair]
+        return cls(merges)
+
+    def _bpe(self,chunk:str) -> list[bytes]:
+        parts = [bytes([b]) for b in chunk.encode("utf-8")]
+        ranks = self.ranks
+        while len(parts) > 1:
+            best,best_rank = -1,None
+            for i in range(len(parts) - 1):
+                rank = ranks.get((parts[i],parts[i + 1]))
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best,best_rank = i,rank
+            if best_rank is None:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+        return parts
+
+    def encode(self,text:str) -> list[bytes]:
+        return [token for chunk in PRETOKENIZE.findall(text) for token in self._bpe(chunk)]
+
+    def _count(self,text:str) -> int:
+        chunks = self._chunks
+        total = 0
+        for chunk in PRETOKENIZE.findall(text):
+            count = chunks.get(chunk)
+            if count is None:
+                count = _token_count(self._bpe(chunk))
+                if len(chunks) >= self.chunk_cache_size:
+                    chunks.clear()
+                chunks[chunk] = count
+            total += count
+        return total
+
+    def count_tokens(self,texts:list[str]) -> list[int]:
+        '''
+        Token counts for a batch of texts, served from the cache when the
+        same content was counted before
+        '''
+        keys = [hashlib.blake2b(text.encode("utf-8"),digest_size=16).digest() for text in texts]
+        results:list[int|None] = [None] * len(texts)
+        missing:dict[bytes,list[int]] = {}
+        with self._lock:
+            for i,key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[i] = self._cache[key]
+                else:
+                    missing.setdefault(key,[]).append(i)
+            for key,positions in missing.items():
+                count = self._count(texts[positions[0]])
+                for i in positions:
+                    results[i] = count
+                self._cache[key] = count
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    def cache_clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._chunks.clear()
+
+def _token_count(parts:list[bytes]) -> int:
+    '''
+    Tokens of a chunk's BPE parts. Runs of bytes that aren't whole characters, like
+    CJK text the merges never saw, count one per character instead of one per byte
+    as real tokenizers have merges or single tokens for most of those characters
+    '''
+    count = 0
+    pending = b""
+    for part in parts:
+        if not part.isascii():
+            try:
+                part.decode("utf-8")
+            except UnicodeDecodeError:
+                pending += part
+                continue
+        if pending:
+            count += max(1,len(pending.decode("utf-8",errors="replace")))
+            pending = b""
+        count += 1
+    if pending:
+        count += max(1,len(pending.decode("utf-8",errors="replace")))
+    return count
+
+class CharEstimator:
+    '''
+    Stand-in for the tokenizer when the merges table is missing from the install,
+    estimates CHARS_PER_TOKEN characters per token
+    '''
+    def count_tokens(self,texts:list[str]) -> list[int]:
+        return [-(-len(text) // CHARS_PER_TOKEN) for text in texts]
+
+@cache
+def default_tokenizer() -> BPETokenizer|CharEstimator:
+    try:
+        return BPETokenizer.from_file()
+    except (FileNotFoundError,ModuleNotFoundError) as e:
+        warnings.warn(f"The BPE merges table {MERGES_FILE} is missing from the propercode install ({e}), token counts are estimated at {CHARS_PER_TOKEN} characters per token",RuntimeWarning,stacklevel=2)
+        return CharEstimator()
+
+def count_tokens(texts:list[str]) -> list[int]:
+    '''
+    Token counts for a batch of texts with the vendored tokenizer
+    '''
+    return default_tokenizer().count_tokens(texts)
@@ -1,67 +1,246 @@
 import os
-import fnmatch
+import mmap
+import codecs
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-def read_file(path:str) -> str:
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.tools.walk import IgnoreRules,scan_dir
+from propercode.agents.tools.file_index import default_index
+
+# files listed per folder before the rest are summarized
+MAX_FILES_PER_DIR = 50
+# bytes returned by one read_file call unless the caller asks for another cap
+MAX_READ_BYTES = 64 * 1024
+# caps of one read_files bundle
+MAX_BUNDLE_FILES = 40
+MAX_BUNDLE_BYTES = 256 * 1024
+READ_WORKERS = 8
+# files larger than this are mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# bytes looked at to tell text from binary and guess the encoding
+SNIFF_BYTES = 8192
+# a byte offset is remembered every LINE_CHECKPOINT lines so paging through a big file doesn't rescan it
+LINE_CHECKPOINT = 1000
+
+BOMS = (
+    (codecs.BOM_UTF32_LE,"utf-32"),(codecs.BOM_UTF32_BE,"utf-32"),
+    (codecs.BOM_UTF8,"utf-8-sig"),
+    (codecs.BOM_UTF16_LE,"utf-16"),(codecs.BOM_UTF16_BE,"utf-16"),
+)
+
+_checkpoints:OrderedDict[tuple,list[int]] = OrderedDict()
+_checkpoints_lock = threading.Lock()
+
+def sniff_encoding(sample:bytes) -> str|None:
+    '''
+    Encoding of a file from its first bytes, None when it looks binary
+    '''
+    for bom,encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b"\0" in sample:
+        return None
+    control = sum(1 for byte in sample if byte < 8 or 13 < byte < 27 or 27 < byte < 32)
+    if sample and control / len(sample) > 0.3:
+        return None
+    try:
+        # the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample,final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+def _line_offset(buf,key:tuple,line:int) -> int|None:
     '''
-    Reads the content of the file and returns the content as string
+    Byte offset where a 1-based line starts, None past the end of the file
     '''
+    with _checkpoints_lock:
+        checkpoints = _checkpoints.setdefault(key,[0])
+        _checkpoints.move_to_end(key)
+        while len(_checkpoints) > 64:
+            _checkpoints.popitem(last=False)
+    at = min((line - 1) // LINE_CHECKPOINT,len(checkpoints) - 1)
+    pos,current = checkpoints[at],at * LINE_CHECKPOINT + 1
+    while current < line:
+        newline = buf.find(b"\n",pos)
+        if newline == -1:
+            return None
+        pos,current = newline + 1,current + 1
+        if (current - 1) % LINE_CHECKPOINT == 0:
+            # checked and appended under the lock, a concurrent reader of the same file may have got here first
+            with _checkpoints_lock:
+                if (current - 1) // LINE_CHECKPOINT == len(checkpoints):
+                    checkpoints.append(pos)
+    if pos >= len(buf) and line > 1:
+        return None
+    return pos
+
+def _read_range(buf,key:tuple,path:str,encoding:str,start_line:int|None,end_line:int|None,offset:int|None,length:int|None,max_bytes:int) -> str:
+    size = len(buf)
+    if start_line is not None or end_line is not None:
+        first = max(start_line or 1,1)
+        start = _line_offset(buf,key,first)
+        if start is None:
+            return f"{path} has fewer than {first} lines"
+        end = size if end_line is None else (_line_offset(buf,key,end_line + 1) or size)
+    else:
+        start = min(max(offset or 0,0),size)
+        end = size if length is None else min(start + max(length,0),size)
+
+    cut = min(end,start + max_bytes)
+    if cut < end:
+        # end on a whole line when one fits in the second half of the chunk
+        newline = buf.rfind(b"\n",start + max_bytes // 2,cut)
+        if newline != -1:
+            cut = newline + 1
+    text = bytes(buf[start:cut]).decode(encoding,errors="replace")
+    if cut < end:
+        text += ("" if text.endswith("\n") else "\n") + f"... [truncated at byte {cut} of {size}, call read_file with offset={cut} to continue]"
+    return text
+
+@RECORDER.timed("tool")
+def read_file(path:str,start_line:int|None=None,end_line:int|None=None,offset:int|None=None,length:int|None=None,max_bytes:int=MAX_READ_BYTES) -> str:
+    '''
+    Reads the content of the file and returns the content as string.
+    Pass start_line and end_line (1-based, inclusive) or offset and length in bytes
+    to read part of a big file. Output longer than max_bytes is cut with a marker
+    telling the offset to continue from. Binary files are not returned
+    '''
+    return _read(path,start_line,end_line,offset,length,max_bytes)
+
+def _read(path:str,start_line:int|None=None,end_line:int|None=None,offset:int|None=None,length:int|None=None,max_bytes:int=MAX_READ_BYTES) -> str:
     try:
-        with open(path,'r') as f:
-            return f.read()
+        if (start_line is not None or end_line is not None) and (offset is not None or length is not None):
+            return "Pass either start_line/end_line or offset/length, not both"
+        st = os.stat(path)
+        if os.path.isdir(path):
+            return f"{path} is a directory, use file_tree_structure to list it"
+        key = (os.path.abspath(path),st.st_size,st.st_mtime_ns)
+
+        if st.st_size <= MMAP_THRESHOLD:
+            index = default_index()
+            rel_path = index.relative(path)
+            data = index.read_bytes(rel_path) if rel_path is not None else None
+            if data is None:
+                with open(path,'rb') as f:
+                    data = f.read()
+            return _decode(data,key,path,start_line,end_line,offset,length,max_bytes)
+
+        with open(path,'rb') as f,mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as mapped:
+            return _decode(mapped,key,path,start_line,end_line,offset,length,max_bytes)
     except FileNotFoundError:
+        suggestions = default_index().find(os.path.basename(path))
+        if suggestions:
+            return f"File not found: {path}, did you mean {', '.join(suggestions)}?"
         return f"File not found: {path}"
     except Exception as e:
         return f"Error while reading the file {path}:{e}"
 
-def file_tree_structure(path: str = os.getcwd()) -> str:
+_read_pool:ThreadPoolExecutor|None = None
+_read_pool_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            _read_pool = ThreadPoolExecutor(max_workers=READ_WORKERS,thread_name_prefix="read-files")
+        return _read_pool
+
+@RECORDER.timed("tool")
+def read_files(paths:list[str],max_bytes_each:int=16 * 1024) -> str:
+    '''
+    Reads several files at once and returns them as one bundle, each file under a
+    '=== path ===' header and cut at max_bytes_each. Prefer this over calling
+    read_file once per file. Files past the bundle limit are listed as skipped
+    '''
+    unique = list(dict.fromkeys(paths))
+    selected,skipped = unique[:MAX_BUNDLE_FILES],unique[MAX_BUNDLE_FILES:]
+    contents = _pool().map(lambda path: _read(path,max_bytes=max_bytes_each),selected)
+
+    sections,total = [],0
+    for path,content in zip(selected,contents):
+        # the limit is in bytes, non-ASCII text takes up to 4 per character
+        size = len(content.encode("utf-8"))
+        if total + size > MAX_BUNDLE_BYTES:
+            skipped.append(path)
+            continue
+        sections.append(f"=== {path} ===\n{content}")
+        total += size
+    if skipped:
+        sections.append(f"=== skipped, bundle limit of {MAX_BUNDLE_BYTES:,} bytes or {MAX_BUNDLE_FILES} files reached ===\n" + "\n".join(skipped))
+    return "\n\n".join(sections)
+
+def _decode(buf,key:tuple,path:str,start_line:int|None,end_line:int|None,offset:int|None,length:int|None,max_bytes:int) -> str:
+    encoding = sniff_encoding(bytes(buf[:SNIFF_BYTES]))
+    if encoding is None:
+        return f"Binary file {path} ({len(buf):,} bytes), not shown"
+    if encoding in ("utf-16","utf-32"):
+        # newlines aren't single bytes in these, so ranges are taken on the decoded text
+        text = bytes(buf).decode(encoding,errors="replace")
+        return _read_range(text.encode("utf-8"),key + (encoding,),path,"utf-8",start_line,end_line,offset,length,max_bytes)
+    return _read_range(buf,key,path,encoding,start_line,end_line,offset,length,max_bytes)
+
+@RECORDER.timed("tool")
+def file_tree_structure(path:str = ".",max_depth:int = 8,max_entries:int = 400) -> str:
     '''
-    String representation of the directory tree structure of files and folders
+    String representation of the directory tree structure of files and folders.
+    Paths ignored by the .gitignore files are left out. Folders deeper than max_depth
+    are collapsed and the tree stops after max_entries lines
     '''
     if not os.path.exists(path):
         return f"Path doesn't exists"
-    
+
     root = os.path.abspath(path)
-    gitignore_path = os.path.join(root, '.gitignore')
-    ignore_patterns = ['.git']
-    
-    # getting the pattern
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and not line.startswith('!'):
-                        ignore_patterns.append(line)
-        except Exception as _:
-            pass
-    
-    def should_ignore(rel_path: str, is_dir: bool = False) -> bool:
-        if is_dir:
-            # removing the dir
-            for pattern in ignore_patterns:
-                if fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(rel_path + os.sep, pattern):
-                    return True
-        else:
-            # removing the files
-            for pattern in ignore_patterns:
-                if fnmatch.fnmatch(rel_path, pattern):
-                    return True
-        return False
-    
-    tree_lines = []
-    for root_dir, dirs, files in os.walk(root):
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.relpath(os.path.join(root_dir, d), root), is_dir=True)]
-        level = root_dir.replace(root, '').count(os.sep)
-        indent = '│   ' * (level - 1) + '├── ' if level > 0 else ''
-        dir_name = os.path.basename(root_dir)
-        if not dir_name:
-            dir_name = os.path.basename(os.path.normpath(root)) or 'root'
-        tree_lines.append(f"{indent}{dir_name}/")
-        
-        files = [f for f in files if not should_ignore(os.path.relpath(os.path.join(root_dir, f), root))]
-        files.sort()
-        for file in files:
-            file_indent = '│   ' * (level - 1) + '│   ' if level > 0 else '├── '
-            tree_lines.append(f"{file_indent}{file}")
-    
-    return '\n'.join(tree_lines)
\ No newline at end of file
+    index = default_index()
+    base = index.relative(root)
+    if base is not None:
+        # inside the project the tree comes from the persistent index
+        index.refresh()
+    if base is None or not index.is_indexed_dir(base):
+        rules = IgnoreRules(root)
+        base = ""
+        def list_dir(rel_path:str) -> tuple[list[str],list[str]]:
+            dirs,files = scan_dir(os.path.join(root,rel_path),rel_path,rules)
+            return [entry.name for entry in dirs],[entry.name for entry in files]
+    else:
+        list_dir = index.children
+
+    tree_lines = [f"{os.path.basename(os.path.normpath(root)) or 'root'}/"]
+    truncated = False
+
+    def render(dirs:list[str],files:list[str],rel_path:str,level:int):
+        nonlocal truncated
+        indent = '│   ' * level + '├── '
+        for name in files[:MAX_FILES_PER_DIR]:
+            if len(tree_lines) >= max_entries:
+                truncated = True
+                return
+            tree_lines.append(f"{indent}{name}")
+        if len(files) > MAX_FILES_PER_DIR:
+            tree_lines.append(f"{indent}... {len(files) - MAX_FILES_PER_DIR} more files")
+
+        for name in dirs:
+            if len(tree_lines) >= max_entries:
+                truncated = True
+                return
+            child_path = f"{rel_path}/{name}" if rel_path else name
+            if level + 1 >= max_depth:
+                tree_lines.append(f"{indent}{name}/ ...")
+                continue
+            child_dirs,child_files = list_dir(child_path)
+            # chains of folders holding a single folder are shown on one line
+            while not child_files and len(child_dirs) == 1:
+                name += f"/{child_dirs[0]}"
+                child_path += f"/{child_dirs[0]}"
+                child_dirs,child_files = list_dir(child_path)
+            tree_lines.append(f"{indent}{name}/")
+            render(child_dirs,child_files,child_path,level + 1)
+            if truncated:
+                return
+
+    render(*list_dir(base),base,0)
+    if truncated:
+        tree_lines.append(f"... stopped after {max_entries} entries, list a sub folder to see more")
+    return '\n'.join(tree_lines)
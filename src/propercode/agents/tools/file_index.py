@@ -0,0 +1,328 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from propercode.agents.memory.pool import ConnectionPool
+from propercode.agents.tools.walk import IgnoreRules,scan_dir
+
+@dataclass
+class FileMeta:
+    path:str
+    size:int
+    mtime_ns:int
+    hash:str|None
+
+# values bound per IN (...) query, well under SQLite's variable limit
+QUERY_CHUNK = 500
+
+def content_hash(data:bytes) -> str:
+    return hashlib.blake2b(data,digest_size=16).hexdigest()
+
+class FileIndex:
+    '''
+    Persistent index of the project's files in .propercode/file_index.db.
+    A refresh only lists directories whose mtime or .gitignore changed since the
+    last one, file sizes, mtimes and content hashes are checked lazily against
+    a stat when a file is asked for
+    '''
+    # bytes of file contents kept in memory for repeated reads
+    CONTENT_CACHE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self,root:Path|None=None,pool_size:int=2):
+        self.root = str((root or Path.cwd()).resolve())
+        self.db_path = Path(self.root) / ".propercode" / "file_index.db"
+        self.db_path.parent.mkdir(exist_ok=True)
+        self._pool = ConnectionPool(self.db_path,pool_size=pool_size)
+        self._lock = threading.RLock()
+        self._children:dict[str,tuple[list[str],list[str]]]|None = None
+        self._contents:OrderedDict[tuple[str,int,int],bytes] = OrderedDict()
+        self._content_bytes = 0
+        with self._pool.transaction() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime_ns INTEGER NOT NULL,
+                ignore_mtime_ns INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash)")
+
+    def close(self):
+        self._pool.close()
+
+    def relative(self,path:str) -> str|None:
+        '''
+        The '/' separated path relative to the root, None when path is outside of it
+        '''
+        rel_path = os.path.relpath(os.path.abspath(path),self.root)
+        if rel_path == ".":
+            return ""
+        if rel_path.startswith(".."):
+            return None
+        return rel_path.replace(os.sep,"/")
+
+    def _absolute(self,rel_path:str) -> str:
+        return os.path.join(self.root,*rel_path.split("/")) if rel_path else self.root
+
+    def _ignore_mtime(self,rel_dir:str) -> int:
+        '''
+        Latest mtime of the ignore files that apply from this directory, 0 when there are none
+        '''
+        sources = [os.path.join(self._absolute(rel_dir),".gitignore")]
+        if not rel_dir:
+            sources.append(os.path.join(self.root,".git","info","exclude"))
+        mtime = 0
+        for source in sources:
+            try:
+                mtime = max(mtime,os.stat(source).st_mtime_ns)
+            except OSError:
+                pass
+        return mtime
+
+    def refresh(self) -> dict:
+        '''
+        Brings the index up to date, returns how many directories were listed again
+        and how many files were added or removed
+        '''
+        stats = {"dirs_scanned":0,"files_added":0,"files_removed":0}
+        rules = IgnoreRules(self.root)
+        with self._lock,self._pool.transaction() as conn:
+            known,subdirs = {},{}
+            for row in conn.execute("SELECT path, parent, mtime_ns, ignore_mtime_ns FROM dirs"):
+                known[row["path"]] = (row["mtime_ns"],row["ignore_mtime_ns"])
+                subdirs.setdefault(row["parent"],[]).append(row["path"])
+            # (relative path, parent, rescan even when unchanged because an ignore file above it changed)
+            stack:list[tuple[str,str|None,bool]] = [("",None,False)]
+            while stack:
+                rel_dir,parent,force = stack.pop()
+                try:
+                    mtime = os.stat(self._absolute(rel_dir)).st_mtime_ns
+                except OSError:
+                    continue
+                ignore_mtime = self._ignore_mtime(rel_dir)
+                if not force and known.get(rel_dir) == (mtime,ignore_mtime):
+                    stack.extend((child,rel_dir,False) for child in subdirs.get(rel_dir,()))
+                    continue
+
+                force = force or (rel_dir in known and known[rel_dir][1] != ignore_mtime)
+                stats["dirs_scanned"] += 1
+                dirs,files = scan_dir(self._absolute(rel_dir),rel_dir,rules)
+                conn.execute(
+                    "INSERT INTO dirs (path,parent,mtime_ns,ignore_mtime_ns) VALUES (?,?,?,?) ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, ignore_mtime_ns = excluded.ignore_mtime_ns",
+                    (rel_dir,parent,mtime,ignore_mtime)
+                )
+
+                stored = {row["path"]:(row["size"],row["mtime_ns"]) for row in conn.execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?",(rel_dir,))}
+                current = set()
+                for entry in files:
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    current.add(rel_path)
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stored.get(rel_path) == (st.st_size,st.st_mtime_ns):
+                        continue
+                    stats["files_added"] += rel_path not in stored
+                    conn.execute(
+                        "INSERT INTO files (path,dir,size,mtime_ns,hash) VALUES (?,?,?,?,NULL) ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, hash = NULL",
+                        (rel_path,rel_dir,st.st_size,st.st_mtime_ns)
+                    )
+                removed = [(rel_path,) for rel_path in stored if rel_path not in current]
+                conn.executemany("DELETE FROM files WHERE path = ?",removed)
+                stats["files_removed"] += len(removed)
+
+                child_dirs = {f"{rel_dir}/{entry.name}" if rel_dir else entry.name for entry in dirs}
+                for child in subdirs.get(rel_dir,()):
+                    if child not in child_dirs:
+                        stats["files_removed"] += self._drop_subtree(conn,child)
+                for child in sorted(child_dirs,reverse=True):
+                    stack.append((child,rel_dir,force))
+
+        if any(stats.values()):
+            self._children = None
+        return stats
+
+    def _drop_subtree(self,conn:sqlite3.Connection,rel_dir:str) -> int:
+        # '/' sorts right before '0', so the range holds exactly the paths under rel_dir
+        bounds = (f"{rel_dir}/",f"{rel_dir}0")
+        conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",(rel_dir,*bounds))
+        return conn.execute("DELETE FROM files WHERE path >= ? AND path < ?",bounds).rowcount
+
+    def children(self,rel_dir:str) -> tuple[list[str],list[str]]:
+        '''
+        Names of the indexed folders and files directly inside a folder, sorted
+        '''
+        with self._lock:
+            if self._children is None:
+                children:dict[str,tuple[list[str],list[str]]] = {}
+                with self._pool.connection() as conn:
+                    for row in conn.execute("SELECT path, parent FROM dirs WHERE parent IS NOT NULL ORDER BY path"):
+                        children.setdefault(row["parent"],([],[]))[0].append(row["path"].rsplit("/",1)[-1])
+                    for row in conn.execute("SELECT path, dir FROM files ORDER BY path"):
+                        children.setdefault(row["dir"],([],[]))[1].append(row["path"].rsplit("/",1)[-1])
+                self._children = children
+            return self._children.get(rel_dir,([],[]))
+
+    def is_indexed_dir(self,rel_dir:str) -> bool:
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT 1 FROM dirs WHERE path = ?",(rel_dir,)).fetchone() is not None
+
+    def find(self,name:str,limit:int=5) -> list[str]:
+        '''
+        Indexed paths whose file name is name, used to suggest the right path
+        '''
+        with self._pool.connection() as conn:
+            rows = conn.execute("SELECT path FROM files WHERE path = ? OR path LIKE ? ESCAPE '\\' LIMIT ?",
+                                (name,"%/" + name.replace("\\","\\\\").replace("%","\\%").replace("_","\\_"),limit))
+            return [row["path"] for row in rows]
+
+    def stat(self,rel_path:str) -> FileMeta|None:
+        '''
+        Metadata of an indexed file checked against the file system, the stored
+        hash is dropped when the size or mtime moved on. None for unindexed paths
+        '''
+        with self._pool.connection() as conn:
+            row = conn.execute("SELECT path, size, mtime_ns, hash FROM files WHERE path = ?",(rel_path,)).fetchone()
+        if row is None:
+            return None
+        try:
+            st = os.stat(self._absolute(rel_path))
+        except OSError:
+            return None
+        meta = FileMeta(rel_path,st.st_size,st.st_mtime_ns,row["hash"])
+        if (row["size"],row["mtime_ns"]) != (st.st_size,st.st_mtime_ns):
+            meta.hash = None
+            with self._pool.transaction() as conn:
+                conn.execute("UPDATE files SET size = ?, mtime_ns = ?, hash = NULL WHERE path = ?",(st.st_size,st.st_mtime_ns,rel_path))
+        return meta
+
+    def hash_of(self,rel_path:str) -> str|None:
+        '''
+        Content hash of an indexed file, computed and stored when missing or stale
+        '''
+        meta = self.stat(rel_path)
+        if meta is None:
+            return None
+        if meta.hash is None:
+            with open(self._absolute(rel_path),'rb') as f:
+                meta.hash = content_hash(f.read())
+            self._store_hash(meta)
+        return meta.hash
+
+    def paths(self,suffixes:tuple[str,...]|None=None,max_size:int|None=None) -> list[str]:
+        '''
+        Every indexed path, optionally only those ending in one of suffixes or
+        no larger than max_size bytes when last seen
+        '''
+        with self._pool.connection() as conn:
+            if max_size is None:
+                rows = conn.execute("SELECT path FROM files ORDER BY path").fetchall()
+            else:
+                rows = conn.execute("SELECT path FROM files WHERE size <= ? ORDER BY path",(max_size,)).fetchall()
+        return [row["path"] for row in rows if suffixes is None or row["path"].endswith(suffixes)]
+
+    def hashes(self,rel_paths:list[str]) -> dict[str,str]:
+        '''
+        Content hashes of many indexed files at once, only files whose size or mtime
+        moved on are read again. Files that vanished are left out
+        '''
+        stored = {}
+        with self._pool.connection() as conn:
+            for i in range(0,len(rel_paths),QUERY_CHUNK):
+                chunk = rel_paths[i:i + QUERY_CHUNK]
+                stored.update((row["path"],row) for row in conn.execute(f"SELECT path, size, mtime_ns, hash FROM files WHERE path IN ({','.join('?' * len(chunk))})",chunk))
+        result,updates = {},[]
+        for rel_path in rel_paths:
+            row = stored.get(rel_path)
+            if row is None:
+                continue
+            try:
+                st = os.stat(self._absolute(rel_path))
+                if row["hash"] is not None and (row["size"],row["mtime_ns"]) == (st.st_size,st.st_mtime_ns):
+                    result[rel_path] = row["hash"]
+                    continue
+                with open(self._absolute(rel_path),'rb') as f:
+                    result[rel_path] = content_hash(f.read())
+            except OSError:
+                continue
+            updates.append((st.st_size,st.st_mtime_ns,result[rel_path],rel_path))
+        if updates:
+            with self._pool.transaction() as conn:
+                conn.executemany("UPDATE files SET size = ?, mtime_ns = ?, hash = ? WHERE path = ?",updates)
+        return result
+
+    def paths_by_hash(self,digests:list[str]) -> dict[str,list[str]]:
+        '''
+        Indexed paths of each content hash as last stored, check them with hashes()
+        before trusting them
+        '''
+        by_hash:dict[str,list[str]] = {}
+        with self._pool.connection() as conn:
+            for i in range(0,len(digests),QUERY_CHUNK):
+                chunk = digests[i:i + QUERY_CHUNK]
+                for row in conn.execute(f"SELECT path, hash FROM files WHERE hash IN ({','.join('?' * len(chunk))}) ORDER BY path",chunk):
+                    by_hash.setdefault(row["hash"],[]).append(row["path"])
+        return by_hash
+
+    def _store_hash(self,meta:FileMeta):
+        with self._pool.transaction() as conn:
+            conn.execute("UPDATE files SET hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?",(meta.hash,meta.path,meta.size,meta.mtime_ns))
+
+    def read_bytes(self,rel_path:str) -> bytes|None:
+        '''
+        Contents of an indexed file, served from memory while its size and mtime
+        are unchanged. None for unindexed paths
+        '''
+        meta = self.stat(rel_path)
+        if meta is None:
+            return None
+        key = (rel_path,meta.size,meta.mtime_ns)
+        with self._lock:
+            if key in self._contents:
+                self._contents.move_to_end(key)
+                return self._contents[key]
+        with open(self._absolute(rel_path),'rb') as f:
+            data = f.read()
+        if meta.hash is None:
+            meta.hash = content_hash(data)
+            self._store_hash(meta)
+        if len(data) <= self.CONTENT_CACHE_BYTES // 4:
+            with self._lock:
+                # two readers can miss on the same file, only the first one is counted
+                if key not in self._contents:
+                    self._contents[key] = data
+                    self._content_bytes += len(data)
+                while self._content_bytes > self.CONTENT_CACHE_BYTES and self._contents:
+                    _,evicted = self._contents.popitem(last=False)
+                    self._content_bytes -= len(evicted)
+        return data
+
+_indexes:dict[str,FileIndex] = {}
+_indexes_lock = threading.Lock()
+
+def default_index() -> FileIndex:
+    '''
+    The index of the current project, opened once per process
+    '''
+    root = str(Path.cwd().resolve())
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = FileIndex(Path(root))
+        return _indexes[root]
@@ -0,0 +1,346 @@
+import re
+import ast
+import math
+import hashlib
+import threading
+import posixpath
+from pathlib import Path
+
+from propercode.agents.memory.pool import ConnectionPool
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.packer import STOPWORDS
+from propercode.agents.tools.file_index import FileIndex,default_index
+from propercode.agents.tools.symbols import MAX_SOURCE_BYTES,default_symbol_index
+
+IMPORT_LANGUAGES = {
+    ".py":"python",".pyi":"python",
+    ".js":"javascript",".jsx":"javascript",".mjs":"javascript",".cjs":"javascript",".ts":"javascript",".tsx":"javascript",
+    ".go":"go",".rs":"rust",".java":"java",".kt":"java",
+    ".c":"c",".h":"c",".cc":"c",".cpp":"c",".hpp":"c",".cxx":"c",
+}
+JS_EXTENSIONS = (".ts",".tsx",".js",".jsx",".mjs",".cjs")
+# hops walked out from the seed files and the share of a file's score passed along each hop
+MAX_HOPS = 2
+DECAY = 0.5
+
+IMPORT_PATTERNS = {
+    "javascript":re.compile(r"""(?:^\s*import\s[^'"]*?from\s*|^\s*import\s*|^\s*export\s[^'"]*?from\s*|\brequire\s*\(\s*|\bimport\s*\(\s*)['"]([^'"]+)['"]""",re.MULTILINE),
+    "c":re.compile(r"""^\s*#\s*include\s*"([^"]+)\"""",re.MULTILINE),
+    "go":re.compile(r"""^\s*(?:import\s+)?(?:[\w.]+\s+)?"([^"]+)"\s*$""",re.MULTILINE),
+    "java":re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+?)(?:\.\*)?\s*;?\s*$",re.MULTILINE),
+    "rust":re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:mod\s+(\w+)\s*;|use\s+(crate|super|self)::([\w:]+))",re.MULTILINE),
+    "python":re.compile(r"^\s*(?:from\s+(\.*[\w.]*)\s+import\s+([\w, ]+)|import\s+([\w., ]+))",re.MULTILINE),
+}
+# words of a prompt that are looked up as symbol names, plain english words are skipped
+IDENTIFIER = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]{3,}\b")
+# seed weights of a file named by path, by stem and of a file defining a named symbol
+PATH_WEIGHT,STEM_WEIGHT,SYMBOL_WEIGHT = 1.0,0.5,0.25
+PATH_LIKE = re.compile(r"[\w\-./]+")
+
+def parse_imports(source:str,language:str) -> list[str]:
+    '''
+    Import specs of a file, unresolved. A spec may list fallbacks separated by '|',
+    python specs keep their leading dots and rust specs are prefixed with mod: or use:
+    '''
+    if language == "python":
+        try:
+            return _python_imports(ast.parse(source))
+        except (SyntaxError,ValueError):
+            specs = []
+            for match in IMPORT_PATTERNS["python"].finditer(source):
+                module,names,plain = match.groups()
+                if plain:
+                    specs.extend(name.split(" as ")[0].strip() for name in plain.split(",") if name.strip())
+                else:
+                    specs.extend(_from_specs(module,[name.split(" as ")[0].strip() for name in names.split(",") if name.strip()]))
+            return specs
+    if language == "rust":
+        specs = []
+        for module,root,path in IMPORT_PATTERNS["rust"].findall(source):
+            specs.append(f"mod:{module}" if module else f"use:{root}::{path}")
+        return specs
+    return [match.group(1) for match in IMPORT_PATTERNS[language].finditer(source)]
+
+def _from_specs(module:str,names:list[str]) -> list[str]:
+    base = module if module.endswith(".") or not module else module + "."
+    return [f"{base}{name}|{module}" for name in names if name != "*"] or [module]
+
+def _python_imports(tree:ast.Module) -> list[str]:
+    specs = []
+    for node in ast.walk(tree):
+        if isinstance(node,ast.Import):
+            specs.extend(alias.name for alias in node.names)
+        elif isinstance(node,ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            specs.extend(_from_specs(module,[alias.name for alias in node.names]))
+    return specs
+
+class Resolver:
+    '''
+    Maps import specs to project files using lookup tables built from the current file list
+    '''
+    def __init__(self,paths:list[str]):
+        self.paths = set(paths)
+        # shallowest file for every dotted python module suffix and every '/' path suffix.
+        # a bare module name only stands for files outside packages, so a package's
+        # logging.py doesn't shadow the standard library everywhere
+        self.packages = {posixpath.dirname(path) for path in paths if posixpath.basename(path) == "__init__.py"}
+        self.modules:dict[str,str] = {}
+        self.suffixes:dict[str,str] = {}
+        self.dirs:dict[str,list[str]] = {}
+        self.dir_suffixes:dict[str,str] = {}
+        for path in sorted(paths,key=lambda path: (path.count("/"),path)):
+            parts = path.split("/")
+            for i in range(len(parts)):
+                self.suffixes.setdefault("/".join(parts[i:]),path)
+            stem,suffix = posixpath.splitext(path)
+            if suffix in (".py",".pyi"):
+                module = stem.split("/")
+                if module[-1] == "__init__":
+                    module = module[:-1]
+                shortest = 1 if posixpath.dirname("/".join(module)) not in self.packages else 2
+                for i in range(len(module) - shortest + 1):
+                    self.modules.setdefault(".".join(module[i:]),path)
+            directory = posixpath.dirname(path)
+            if directory not in self.dirs:
+                parts = directory.split("/")
+                for i in range(len(parts)):
+                    self.dir_suffixes.setdefault("/".join(parts[i:]),directory)
+            self.dirs.setdefault(directory,[]).append(path)
+
+    def resolve(self,importer:str,spec:str,language:str) -> list[str]:
+        directory = posixpath.dirname(importer)
+        if language == "python":
+            for candidate in spec.split("|"):
+                found = self._python(directory,candidate)
+                if found:
+                    return [found]
+            return []
+        if language == "javascript":
+            if not spec.startswith((".","/")):
+                return []
+            base = posixpath.normpath(posixpath.join(directory,spec) if spec.startswith(".") else spec.lstrip("/"))
+            for candidate in [base] + [base + ext for ext in JS_EXTENSIONS] + [f"{base}/index{ext}" for ext in JS_EXTENSIONS]:
+                if candidate in self.paths:
+                    return [candidate]
+            return []
+        if language == "c":
+            local = posixpath.normpath(posixpath.join(directory,spec))
+            found = local if local in self.paths else self.suffixes.get(spec)
+            return [found] if found else []
+        if language == "java":
+            relative = spec.replace(".","/")
+            found = self.suffixes.get(relative + ".java") or self.suffixes.get(relative + ".kt")
+            return [found] if found else []
+        if language == "go":
+            # the module prefix of an import path isn't known, the longest matching directory suffix wins
+            parts = spec.split("/")
+            for i in range(len(parts)):
+                directory = self.dir_suffixes.get("/".join(parts[i:]))
+                if directory is not None:
+                    return [path for path in self.dirs[directory] if path.endswith(".go")]
+            return []
+        if language == "rust":
+            kind,_,rest = spec.partition(":")
+            if kind == "mod":
+                stem = posixpath.splitext(posixpath.basename(importer))[0]
+                owner = directory if stem in ("mod","lib","main") else posixpath.join(directory,stem)
+                for candidate in (posixpath.join(owner,f"{rest}.rs"),posixpath.join(owner,rest,"mod.rs")):
+                    if candidate in self.paths:
+                        return [candidate]
+                return []
+            parts = rest.split("::")[1:]
+            for i in range(len(parts),0,-1):
+                relative = "/".join(parts[:i])
+                found = self.suffixes.get(relative + ".rs") or self.suffixes.get(relative + "/mod.rs")
+                if found:
+                    return [found]
+        return []
+
+    def _python(self,directory:str,spec:str) -> str|None:
+        level = len(spec) - len(spec.lstrip("."))
+        module = spec[level:]
+        if level:
+            base = directory.split("/") if directory else []
+            base = base[:max(0,len(base) - (level - 1))]
+            relative = "/".join(base + module.split(".")) if module else "/".join(base)
+            for candidate in (relative + ".py",relative + "/__init__.py",relative + ".pyi"):
+                if candidate in self.paths:
+                    return candidate
+            return None
+        # scripts outside packages import their siblings by bare name
+        if directory not in self.packages:
+            sibling = posixpath.join(directory,module.replace(".","/"))
+            for candidate in (sibling + ".py",sibling + "/__init__.py"):
+                if candidate in self.paths:
+                    return candidate
+        return self.modules.get(module)
+
+class ImportGraph:
+    '''
+    Module dependency graph of the project. Imports are parsed once per content hash
+    into .propercode/imports.db, the resolved graph is rebuilt in memory only when
+    a source file was added, removed or changed
+    '''
+    def __init__(self,files:FileIndex):
+        self.files = files
+        self.db_path = Path(files.root) / ".propercode" / "imports.db"
+        self._pool = ConnectionPool(self.db_path,pool_size=2)
+        self._lock = threading.Lock()
+        self._key:str|None = None
+        self.imports:dict[str,set[str]] = {}
+        self.importers:dict[str,set[str]] = {}
+        with self._pool.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS parsed (hash TEXT PRIMARY KEY, language TEXT NOT NULL)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS imports (
+                hash TEXT NOT NULL,
+                spec TEXT NOT NULL,
+                FOREIGN KEY (hash) REFERENCES parsed (hash) ON DELETE CASCADE
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_imports_hash ON imports (hash)")
+
+    def close(self):
+        self._pool.close()
+
+    def update(self):
+        '''
+        Parses the imports of new contents and rebuilds the edges when any file changed
+        '''
+        with self._lock:
+            self.files.refresh()
+            paths = [path for path in self.files.paths(tuple(IMPORT_LANGUAGES)) if not path.endswith(".min.js")]
+            hashes = self.files.hashes(paths)
+            key = hashlib.blake2b("\n".join(f"{path}\0{digest}" for path,digest in sorted(hashes.items())).encode(),digest_size=16).hexdigest()
+            if key == self._key:
+                return
+
+            with self._pool.connection() as conn:
+                parsed = {row["hash"] for row in conn.execute("SELECT hash FROM parsed")}
+            rows,languages,seen = [],[],set()
+            for path,digest in hashes.items():
+                if digest in parsed or digest in seen:
+                    continue
+                seen.add(digest)
+                language = IMPORT_LANGUAGES[posixpath.splitext(path)[1]]
+                languages.append((digest,language))
+                absolute = Path(self.files.root) / path
+                try:
+                    if absolute.stat().st_size > MAX_SOURCE_BYTES:
+                        continue
+                    source = absolute.read_bytes().decode("utf-8",errors="replace")
+                except OSError:
+                    continue
+                rows.extend((digest,spec) for spec in dict.fromkeys(parse_imports(source,language)))
+            current = set(hashes.values())
+            stale = [(digest,) for digest in parsed if digest not in current]
+            if languages or stale:
+                with self._pool.transaction() as conn:
+                    conn.executemany("DELETE FROM parsed WHERE hash = ?",stale)
+                    conn.executemany("INSERT OR IGNORE INTO parsed (hash,language) VALUES (?,?)",languages)
+                    conn.executemany("INSERT INTO imports (hash,spec) VALUES (?,?)",rows)
+
+            specs:dict[str,list[str]] = {}
+            with self._pool.connection() as conn:
+                for row in conn.execute("SELECT hash, spec FROM imports"):
+                    specs.setdefault(row["hash"],[]).append(row["spec"])
+            resolver = Resolver(list(hashes))
+            imports:dict[str,set[str]] = {}
+            importers:dict[str,set[str]] = {}
+            for path,digest in hashes.items():
+                language = IMPORT_LANGUAGES[posixpath.splitext(path)[1]]
+                for spec in specs.get(digest,()):
+                    for target in resolver.resolve(path,spec,language):
+                        if target != path:
+                            imports.setdefault(path,set()).add(target)
+                            importers.setdefault(target,set()).add(path)
+            self.imports,self.importers,self._key = imports,importers,key
+
+    def seeds(self,query:str) -> dict[str,float]:
+        '''
+        Files a prompt points at, by path, file name or stem, or by a symbol they define
+        '''
+        paths = self.files.paths(tuple(IMPORT_LANGUAGES))
+        by_name:dict[str,list[str]] = {}
+        for path in paths:
+            name = posixpath.basename(path)
+            by_name.setdefault(name.lower(),[]).append(path)
+            by_name.setdefault(posixpath.splitext(name)[0].lower(),[]).append(path)
+        seeds:dict[str,float] = {}
+        named = set()
+        for token in PATH_LIKE.findall(query):
+            token = token.strip("./-")
+            if not token or token.lower() in STOPWORDS:
+                continue
+            if "/" in token:
+                matches,weight = [path for path in paths if path == token or path.endswith("/" + token)],PATH_WEIGHT
+            else:
+                weight = PATH_WEIGHT if posixpath.splitext(token)[1] else STEM_WEIGHT
+                matches = by_name.get(token.lower(),[])
+            if matches:
+                named.update(IDENTIFIER.findall(token))
+            for path in matches:
+                seeds[path] = max(seeds.get(path,0.0),weight / len(matches))
+        names = [name for name in dict.fromkeys(IDENTIFIER.findall(query)) if name not in named and ("_" in name or (name[1:] != name[1:].lower() and not name.isupper()))]
+        for name,defined_in in default_symbol_index().locate(names).items():
+            for path in defined_in:
+                seeds[path] = max(seeds.get(path,0.0),SYMBOL_WEIGHT / len(defined_in))
+        return seeds
+
+    def rank(self,query:str,limit:int=15) -> list[tuple[str,float,str]]:
+        '''
+        (path, score, reason) of the files most related to the prompt. Scores start at
+        the seed files and spread over import edges in both directions, each hop
+        passing on DECAY of a file's score split by the square root of its degree
+        so hub modules don't pull in half the project
+        '''
+        self.update()
+        seeds = self.seeds(query)
+        scores = dict(seeds)
+        reasons = {path:"matches the request" for path in seeds}
+        frontier = dict(seeds)
+        for _ in range(MAX_HOPS):
+            spread:dict[str,float] = {}
+            for path,score in frontier.items():
+                imports,importers = self.imports.get(path,set()),self.importers.get(path,set())
+                degree = len(imports) + len(importers)
+                if not degree:
+                    continue
+                share = score * DECAY / math.sqrt(degree)
+                for neighbour in imports:
+                    spread[neighbour] = spread.get(neighbour,0.0) + share
+                    reasons.setdefault(neighbour,f"imported by {path}")
+                for neighbour in importers:
+                    spread[neighbour] = spread.get(neighbour,0.0) + share
+                    reasons.setdefault(neighbour,f"imports {path}")
+            for path,score in spread.items():
+                scores[path] = scores.get(path,0.0) + score
+            frontier = spread
+        ranked = sorted(scores.items(),key=lambda item: (-item[1],item[0]))[:limit]
+        return [(path,score,reasons[path]) for path,score in ranked]
+
+_graphs:dict[str,ImportGraph] = {}
+_graphs_lock = threading.Lock()
+
+def default_import_graph() -> ImportGraph:
+    files = default_index()
+    with _graphs_lock:
+        if files.root not in _graphs:
+            _graphs[files.root] = ImportGraph(files)
+        return _graphs[files.root]
+
+@RECORDER.timed("tool")
+def related_files(query:str,limit:int=15) -> str:
+    '''
+    Ranks the project files most related to the query using the import graph. Start
+    from file names, paths or function and class names in the query, the files they
+    import and that import them follow. Use it to pick what to read
+    '''
+    try:
+        ranked = default_import_graph().rank(query,limit)
+    except Exception as e:
+        return f"Import graph failed: {e}"
+    if not ranked:
+        return f"No project files matched '{query}', name a file, module or symbol"
+    return "\n".join(f"{path} ({score:.2f}, {reason})" for path,score,reason in ranked)
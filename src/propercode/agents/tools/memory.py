@@ -1,53 +1,74 @@
 import sqlite3
 import json
+from typing import Any
+from pydantic_ai import RunContext
 
-from propercode.agents.memory.store import MemoryStore
+from propercode.agents.memory.async_store import AsyncMemoryStore
+from propercode.agents.memory.latency import RECORDER
 from propercode.models.agents.memory_models import SearchMemoryToolInput,WriteMemoryToolInput
 
+# damping constant of reciprocal rank fusion
+RRF_K = 60
+
 class SearchMemoryTool:
     '''
     A tool for searching the agent's memory
     '''
-    def __init__(self,memory_store:MemoryStore):
+    def __init__(self,memory_store:AsyncMemoryStore):
         self.memory_store = memory_store
 
     async def run(self,params:SearchMemoryToolInput) -> str:
         '''
-        Executes a seach query against the derived_memories table
+        Executes a ranked full-text and/or embedding search against the derived_memories table
         Returns a formatted string of results suitable for an LLM context
         '''
         try:
-            conn = self.memory_store._get_conn()
-            cursor = conn.cursor()
-
-            query_sql = "SELECT content, timestamp FROM derived_memories WHERE content LIKE ? "
-            query_params = [f"%{params.query}%"]
-
-            if params.memory_type:
-                query_sql += "AND memory_type = ? "
-                query_params.append(params.memory_type)
-            
-            query_sql += "ORDER BY timestamp DESC LIMIT ?"
-            query_params.append(str(params.limit))
-
-            cursor.execute(query_sql,tuple(query_params))
-            results = cursor.fetchall()
+            results = await self.search(params)
 
             if not results:
                 return "No relevant memories found."
             
             formatted_results = [
-                f"Memory from {row['timestamp']}:\n{row['content']}" for row in results
+                f"Memory from {row['timestamp']}{_seen(row['hit_count'])}:\n{row['content']}" for row in results
             ]
             return f"Found {len(results)} relevant memories:\n" + "\n".join(formatted_results)
         except sqlite3.Error as e:
             return f"Error: could not search memories to a database error: {e}"
+        except (OSError,ValueError) as e:
+            # the embedding mirror is a memmap next to the database, a truncated one fails here
+            return f"Error: could not search memories, the embedding index is unreadable: {e}"
+
+    async def search(self,params:SearchMemoryToolInput) -> list[sqlite3.Row]:
+        '''
+        Runs the requested search mode, hybrid results are merged with reciprocal rank fusion
+        '''
+        lexical = semantic = []
+        if params.mode in ("lexical","hybrid"):
+            lexical = await self.memory_store.search_memories(params.query,params.limit,params.memory_type)
+        if params.mode in ("semantic","hybrid"):
+            try:
+                semantic = await self.memory_store.search_similar(params.query,params.limit,params.memory_type)
+            except (sqlite3.Error,OSError,ValueError):
+                # hybrid searches keep their full-text results when the embedding side fails
+                if params.mode == "semantic":
+                    raise
+        if params.mode != "hybrid":
+            return lexical or semantic
+
+        fused:dict[int,float] = {}
+        rows:dict[int,sqlite3.Row] = {}
+        for ranking in (lexical,semantic):
+            for rank,row in enumerate(ranking):
+                fused[row["id"]] = fused.get(row["id"],0.0) + 1.0 / (RRF_K + rank)
+                rows[row["id"]] = row
+        best = sorted(fused,key=fused.__getitem__,reverse=True)[:params.limit]
+        return [rows[memory_id] for memory_id in best]
 
 class WriteMemoryTool:
     '''
     A tool for the writing new entires to the agent's memory
     '''
-    def __init__(self,memory_store: MemoryStore):
+    def __init__(self,memory_store: AsyncMemoryStore):
         self.memory_store = memory_store
 
     async def run(self,params:WriteMemoryToolInput) -> str:
@@ -55,18 +76,21 @@ class WriteMemoryTool:
         Inserts a new record into the derived_memories table
         '''
         try:
-            conn = self.memory_store._get_conn()
-            cursor = conn.cursor()
-
             metadata_str = json.dumps(params.metadata) if params.metadata else None
-
-            cursor.execute(
-                """
-                INSERT INTO derived_memories (session_id,content,memory_type,metadata_json)
-                VALUES (?,?,?,?)
-                """, (params.session_id,params.content,params.memory_type,metadata_str)
-            )
-            conn.commit()
+            await self.memory_store.insert_memory(params.session_id,params.content,params.memory_type,metadata_str)
             return 'Memory stored successfully'
         except sqlite3.Error as e:
-            return f"Error: Could not store memory due to a database error : {e}"
\ No newline at end of file
+            return f"Error: Could not store memory due to a database error : {e}"
+
+def _seen(hit_count:int) -> str:
+    return f" (seen {hit_count} times)" if hit_count > 1 else ""
+
+@RECORDER.timed("tool")
+async def search_memory(ctx:RunContext[Any],query:str,limit:int=3,memory_type:str|None=None) -> str:
+    '''
+    Searches memories of past tasks in this project, both by keywords and by meaning.
+    memory_type can be 'summary' or 'fact', leave it empty to search both
+    '''
+    # runs against the memory store of the orchestrator, handed over as GraphDeps
+    params = SearchMemoryToolInput(query=query,limit=limit,memory_type=memory_type)
+    return await SearchMemoryTool(ctx.deps.memory).run(params)
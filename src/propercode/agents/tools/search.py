@@ -0,0 +1,138 @@
+import os
+import re
+import threading
+from collections import deque
+
+from pathspec import PathSpec
+
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.tools.walk import walk_files
+from propercode.agents.tools.file import READ_WORKERS,SNIFF_BYTES,_pool,sniff_encoding
+from propercode.agents.tools.file_index import default_index
+
+# files scanned by one worker task, small enough that an early stop wastes little
+SEARCH_BATCH = 256
+# files larger than this are skipped, they are almost never hand written source
+MAX_SEARCH_BYTES = 2 * 1024 * 1024
+MAX_LINE_CHARS = 300
+
+def _search_file(path:str,regex:re.Pattern,limit:int) -> list[tuple[int,list[str]]]|None:
+    '''
+    (line number, lines of the file) of up to limit matching lines, None when nothing matches
+    '''
+    try:
+        with open(path,'rb') as f:
+            data = f.read(MAX_SEARCH_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_SEARCH_BYTES:
+        return None
+    # one pass of the compiled pattern over the whole file before anything is split
+    first = regex.search(data)
+    if first is None or sniff_encoding(data[:SNIFF_BYTES]) is None:
+        return None
+    # split on \n alone, as the line numbers below are counted, splitlines() also breaks on \f, \x1c and friends
+    lines = [line.removesuffix("\r") for line in data.decode("utf-8",errors="replace").split("\n")]
+    if data.endswith(b"\n"):
+        lines.pop()
+    numbers,line,position = [],1,0
+    for match in regex.finditer(data,first.start()):
+        line += data.count(b"\n",position,match.start())
+        position = match.start()
+        if not numbers or numbers[-1] != line:
+            numbers.append(line)
+            if len(numbers) >= limit:
+                break
+    return [(number,lines) for number in numbers]
+
+def _search_batch(paths:list[tuple[str,str]],regex:re.Pattern,limit:int,stop:threading.Event) -> list[tuple[str,list[tuple[int,list[str]]]]]:
+    results,found = [],0
+    for rel_path,path in paths:
+        if stop.is_set() or found >= limit:
+            break
+        hits = _search_file(path,regex,limit - found)
+        if hits:
+            results.append((rel_path,hits))
+            found += len(hits)
+    return results
+
+def _candidates(root:str,glob:str|None) -> list[tuple[str,str]]:
+    '''
+    (relative, absolute) paths of every file under root that isn't ignored and matches glob
+    '''
+    spec = PathSpec.from_lines("gitwildmatch",[glob]) if glob else None
+    index = default_index()
+    rel_root = index.relative(root)
+    if rel_root is not None:
+        index.refresh()
+        prefix = f"{rel_root}/" if rel_root else ""
+        paths = [(path[len(prefix):],os.path.join(index.root,path)) for path in index.paths(max_size=MAX_SEARCH_BYTES) if path.startswith(prefix)]
+    else:
+        paths = [(rel_path,entry.path) for rel_path,entry in walk_files(root)]
+    if spec is not None:
+        paths = [(rel_path,path) for rel_path,path in paths if spec.match_file(rel_path)]
+    return paths
+
+def _format(rel_path:str,hits:list[tuple[int,list[str]]],context_lines:int) -> list[str]:
+    '''
+    grep style blocks, 'path:line: text' for matches and 'path-line- text' around them
+    '''
+    lines = hits[0][1]
+    matched = {number for number,_ in hits}
+    blocks,block,last = [],[],0
+    for number,_ in hits:
+        start,end = max(1,number - context_lines),min(len(lines),number + context_lines)
+        if block and start > last + 1:
+            blocks.append("\n".join(block))
+            block = []
+        for i in range(max(start,last + 1),end + 1):
+            separator = ":" if i in matched else "-"
+            block.append(f"{rel_path}{separator}{i}{separator} {lines[i - 1][:MAX_LINE_CHARS]}")
+        last = max(last,end)
+    if block:
+        blocks.append("\n".join(block))
+    return blocks
+
+@RECORDER.timed("tool")
+def search_code(pattern:str,glob:str|None=None,max_results:int=50,context_lines:int=2,ignore_case:bool=False,path:str=".") -> str:
+    '''
+    Searches the project's files for a regular expression and returns the matching
+    lines with context_lines of context around each, like grep. glob narrows the
+    files searched, e.g. '*.py' or 'src/**/*.ts'. Ignored files are skipped and the
+    search stops after max_results matching lines
+    '''
+    try:
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        regex = re.compile(pattern.encode("utf-8"),flags)
+    except re.error as e:
+        return f"Invalid pattern '{pattern}': {e}"
+    root = os.path.abspath(path)
+    if not os.path.isdir(root):
+        return f"No directory found at {path}"
+
+    candidates = _candidates(root,glob)
+    batches = [candidates[i:i + SEARCH_BATCH] for i in range(0,len(candidates),SEARCH_BATCH)]
+    stop = threading.Event()
+    pending,results,found = deque(),[],0
+    # batches are submitted a few at a time and collected in order so the output
+    # is stable and nothing past the limit is queued
+    next_batch = 0
+    while (next_batch < len(batches) or pending) and found < max_results:
+        while next_batch < len(batches) and len(pending) < READ_WORKERS * 2:
+            pending.append(_pool().submit(_search_batch,batches[next_batch],regex,max_results,stop))
+            next_batch += 1
+        for rel_path,hits in pending.popleft().result():
+            hits = hits[:max_results - found]
+            if not hits:
+                break
+            results.append((rel_path,hits))
+            found += len(hits)
+    stop.set()
+    for future in pending:
+        future.cancel()
+
+    if not results:
+        return f"No matches for '{pattern}' in {len(candidates)} files"
+    blocks = [block for rel_path,hits in results for block in _format(rel_path,hits,context_lines)]
+    footer = f"\n[stopped at {max_results} matches, narrow the pattern or glob to see more]" if found >= max_results else ""
+    return "\n--\n".join(blocks) + footer
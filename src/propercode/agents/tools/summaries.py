@@ -0,0 +1,165 @@
+import ast
+import threading
+import posixpath
+from pathlib import Path
+
+from propercode.agents.memory.pool import ConnectionPool
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.tools.file import SNIFF_BYTES,sniff_encoding
+from propercode.agents.tools.file_index import FileIndex,default_index
+from propercode.agents.tools.symbols import LANGUAGES,MAX_SOURCE_BYTES,parse_source
+
+# summaries not served for this long are dropped when the cache is opened
+MAX_AGE_DAYS = 30
+# symbols listed per file and lines shown of files without any
+MAX_SUMMARY_SYMBOLS = 60
+HEAD_LINES = 12
+MAX_LINE_CHARS = 160
+COMMENT_PREFIXES = {"python":("#",),"ruby":("#",)}
+C_COMMENT_PREFIXES = ("//","/*","*")
+
+def _leading_comment(lines:list[str],prefixes:tuple[str,...]) -> str:
+    '''
+    The comment block a source file starts with, past a shebang or encoding line
+    '''
+    comment = []
+    for line in lines[:40]:
+        stripped = line.strip()
+        if not stripped:
+            if comment:
+                break
+            continue
+        if stripped.startswith(("#!","# -*-")) or not stripped.startswith(prefixes):
+            if comment or not stripped.startswith("#!"):
+                break
+            continue
+        text = stripped.lstrip("#/*-; ").rstrip("*/ ")
+        if text:
+            comment.append(text)
+    return " ".join(comment)[:400]
+
+def summarize(path:str,data:bytes) -> str:
+    '''
+    Extractive summary of a file: what it is about and the signatures and first
+    docstring lines of what it defines, or its first lines when it defines nothing
+    '''
+    encoding = sniff_encoding(data[:SNIFF_BYTES])
+    if encoding is None:
+        return f"binary file, {len(data):,} bytes"
+    text = data.decode(encoding,errors="replace")
+    lines = text.splitlines()
+    parts = [f"{len(lines):,} lines, {len(data):,} bytes"]
+    language = LANGUAGES.get(posixpath.splitext(path)[1])
+
+    about = ""
+    if language == "python":
+        try:
+            about = (ast.get_docstring(ast.parse(text)) or "").strip().split("\n\n")[0]
+        except (SyntaxError,ValueError):
+            pass
+    if not about and language:
+        about = _leading_comment(lines,COMMENT_PREFIXES.get(language,C_COMMENT_PREFIXES))
+    if about:
+        parts.append(" ".join(about.split())[:400])
+
+    symbols = parse_source(text,language) if language and len(data) <= MAX_SOURCE_BYTES else []
+    if symbols:
+        for symbol in symbols[:MAX_SUMMARY_SYMBOLS]:
+            indent = "  " * symbol.qualname.count(".")
+            line = f"{indent}L{symbol.start_line}-{symbol.end_line} {symbol.signature}"
+            if symbol.doc:
+                line += f"  # {symbol.doc}"
+            parts.append(line[:MAX_LINE_CHARS + len(indent)])
+        if len(symbols) > MAX_SUMMARY_SYMBOLS:
+            parts.append(f"... {len(symbols) - MAX_SUMMARY_SYMBOLS} more definitions")
+    else:
+        parts.extend(line[:MAX_LINE_CHARS] for line in lines[:HEAD_LINES])
+        if len(lines) > HEAD_LINES:
+            parts.append("...")
+    return "\n".join(parts)
+
+class SummaryCache:
+    '''
+    Summaries of project files in .propercode/summaries.db keyed by content hash,
+    so a changed file gets a new summary and an unchanged one is never summarized
+    twice, across runs and across branches that share files
+    '''
+    def __init__(self,files:FileIndex):
+        self.files = files
+        self.db_path = Path(files.root) / ".propercode" / "summaries.db"
+        self._pool = ConnectionPool(self.db_path,pool_size=2)
+        self._lock = threading.Lock()
+        with self._pool.transaction() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                hash TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used TEXT NOT NULL DEFAULT (datetime('now'))
+            ) WITHOUT ROWID
+            """)
+            conn.execute("DELETE FROM summaries WHERE last_used < datetime('now',?)",(f"-{MAX_AGE_DAYS} days",))
+
+    def close(self):
+        self._pool.close()
+
+    def summaries(self,rel_paths:list[str]) -> dict[str,str]:
+        '''
+        Summary of every indexed path, only files whose content hash has no summary yet are read
+        '''
+        hashes = self.files.hashes(rel_paths)
+        if len(hashes) < len(set(rel_paths)):
+            # files created since the last refresh aren't indexed yet
+            self.files.refresh()
+            hashes = self.files.hashes(rel_paths)
+        if not hashes:
+            return {}
+        digests = list(dict.fromkeys(hashes.values()))
+        with self._pool.connection() as conn:
+            cached = {row["hash"]:row["summary"] for row in conn.execute(
+                f"SELECT hash, summary FROM summaries WHERE hash IN ({','.join('?' * len(digests))})",digests
+            )}
+        created = {}
+        for rel_path,digest in hashes.items():
+            if digest in cached or digest in created:
+                continue
+            try:
+                data = self.files.read_bytes(rel_path)
+            except OSError:
+                continue
+            if data is not None:
+                created[digest] = summarize(rel_path,data)
+        with self._lock,self._pool.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO summaries (hash,summary) VALUES (?,?)",created.items())
+            # hits are touched at most daily so reading summaries rarely writes
+            conn.executemany("UPDATE summaries SET last_used = datetime('now') WHERE hash = ? AND last_used < datetime('now','-1 day')",[(digest,) for digest in cached])
+        cached.update(created)
+        return {rel_path:cached[digest] for rel_path,digest in hashes.items() if digest in cached}
+
+_caches:dict[str,SummaryCache] = {}
+_caches_lock = threading.Lock()
+
+def default_summary_cache() -> SummaryCache:
+    files = default_index()
+    with _caches_lock:
+        if files.root not in _caches:
+            _caches[files.root] = SummaryCache(files)
+        return _caches[files.root]
+
+@RECORDER.timed("tool")
+def file_summaries(paths:list[str]) -> str:
+    '''
+    Short summaries of several files: what each is about and the signatures and
+    docstrings of what it defines with their line ranges. Costs a fraction of
+    reading the files, read the raw text only of the parts you need
+    '''
+    index = default_index()
+    wanted = {path:index.relative(path) for path in dict.fromkeys(paths)}
+    try:
+        summaries = default_summary_cache().summaries([rel_path for rel_path in wanted.values() if rel_path])
+    except Exception as e:
+        return f"Summaries failed: {e}"
+    sections = []
+    for path,rel_path in wanted.items():
+        summary = summaries.get(rel_path) if rel_path else None
+        sections.append(f"=== {path} ===\n{summary}" if summary is not None else f"=== {path} ===\nNo summary, the file is missing or outside the project, use read_file")
+    return "\n\n".join(sections)
@@ -0,0 +1,395 @@
+import os
+import re
+import ast
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+from typing import Iterator
+
+from propercode.agents.memory.pool import ConnectionPool
+from propercode.agents.memory.latency import RECORDER
+from propercode.agents.tools.file import _read
+from propercode.agents.tools.file_index import FileIndex,default_index
+
+# files larger than this are not parsed
+MAX_SOURCE_BYTES = 1024 * 1024
+# lines a regex matched symbol may span when the next symbol doesn't end it earlier
+MAX_REGEX_SPAN = 200
+DOC_CHARS = 200
+# files parsed per worker task and per committed batch while the index is built
+PARSE_BATCH = 64
+# seconds a lookup waits for the files it found unparsed, a cold index keeps building in the background
+BUILD_WAIT_SECONDS = 1.0
+# seconds a full check of the project's files is reused by the lookups that follow it
+REFRESH_SECONDS = 2.0
+
+# (kind, pattern) per language, the name is the 'name' group
+REGEX_SYMBOLS = {
+    "javascript":[
+        ("class",r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(?P<name>[A-Za-z_$][\w$]*)"),
+        ("function",r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)\s*\("),
+        ("function",r"^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*=>"),
+        ("interface",r"^\s*(?:export\s+)?(?:interface|type|enum)\s+(?P<name>[A-Za-z_$][\w$]*)"),
+    ],
+    "go":[
+        ("function",r"^func\s+(?:\([^)]*\)\s*)?(?P<name>\w+)\s*[\[(]"),
+        ("type",r"^type\s+(?P<name>\w+)\s+"),
+    ],
+    "rust":[
+        ("function",r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+(?P<name>\w+)"),
+        ("type",r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type|union)\s+(?P<name>\w+)"),
+        ("impl",r"^\s*impl(?:<[^>]*>)?\s+(?:[\w:]+\s+for\s+)?(?P<name>\w+)"),
+    ],
+    "java":[
+        ("class",r"^\s*(?:(?:public|private|protected|static|final|abstract|sealed|partial|internal)\s+)*(?:class|interface|enum|record|struct)\s+(?P<name>\w+)"),
+        ("function",r"^\s*(?:(?:public|private|protected|static|final|abstract|synchronized|async|override|virtual|internal)\s+)+[\w<>\[\],.?\s]+?\s+(?P<name>\w+)\s*\([^;]*$"),
+    ],
+    "c":[
+        ("type",r"^\s*(?:typedef\s+)?(?:struct|enum|union|class)\s+(?P<name>\w+)\s*[{:]?\s*$"),
+        ("function",r"^(?:[\w*&:<>,]+\s+)+\**(?P<name>[A-Za-z_][\w:~]*)\s*\([^;]*$"),
+    ],
+    "ruby":[
+        ("class",r"^\s*(?:class|module)\s+(?P<name>[\w:]+)"),
+        ("function",r"^\s*def\s+(?:self\.)?(?P<name>[\w?!=]+)"),
+    ],
+    "python":[
+        ("class",r"^\s*class\s+(?P<name>\w+)"),
+        ("function",r"^\s*(?:async\s+)?def\s+(?P<name>\w+)"),
+    ],
+}
+LANGUAGES = {
+    ".py":"python",".pyi":"python",
+    ".js":"javascript",".jsx":"javascript",".mjs":"javascript",".cjs":"javascript",".ts":"javascript",".tsx":"javascript",
+    ".go":"go",".rs":"rust",
+    ".java":"java",".kt":"java",".cs":"java",".scala":"java",
+    ".c":"c",".h":"c",".cc":"c",".cpp":"c",".hpp":"c",".cxx":"c",
+    ".rb":"ruby",
+}
+_COMPILED = {language:[(kind,re.compile(pattern)) for kind,pattern in patterns] for language,patterns in REGEX_SYMBOLS.items()}
+
+@dataclass
+class Symbol:
+    name:str
+    qualname:str
+    kind:str
+    signature:str
+    doc:str
+    start_line:int
+    end_line:int
+
+def _first_lines(doc:str|None) -> str:
+    if not doc:
+        return ""
+    text = " ".join(line.strip() for line in doc.strip().split("\n\n")[0].splitlines())
+    return text[:DOC_CHARS]
+
+def parse_python(source:str) -> list[Symbol]:
+    '''
+    Classes, functions, methods and module constants with their signatures and spans
+    '''
+    tree = ast.parse(source)
+    symbols = []
+
+    def visit(body:list[ast.stmt],prefix:str):
+        for node in body:
+            if isinstance(node,(ast.FunctionDef,ast.AsyncFunctionDef,ast.ClassDef)):
+                qualname = f"{prefix}{node.name}"
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                if isinstance(node,ast.ClassDef):
+                    bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+                    signature = f"class {node.name}({bases})" if bases else f"class {node.name}"
+                    kind = "class"
+                else:
+                    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+                    prefix_kw = "async def" if isinstance(node,ast.AsyncFunctionDef) else "def"
+                    signature = f"{prefix_kw} {node.name}({ast.unparse(node.args)}){returns}"
+                    kind = "method" if prefix else "function"
+                symbols.append(Symbol(node.name,qualname,kind,signature,_first_lines(ast.get_docstring(node)),start,node.end_lineno or start))
+                visit(node.body,f"{qualname}.")
+            elif not prefix and isinstance(node,(ast.Assign,ast.AnnAssign)):
+                targets = node.targets if isinstance(node,ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target,ast.Name) and target.id.isupper():
+                        symbols.append(Symbol(target.id,target.id,"constant",ast.unparse(node).split("\n")[0][:DOC_CHARS],"",node.lineno,node.end_lineno or node.lineno))
+
+    visit(tree.body,"")
+    return symbols
+
+def parse_regex(source:str,language:str) -> list[Symbol]:
+    '''
+    Best effort symbols for languages without a parser here, a symbol ends where the next one starts
+    '''
+    patterns = _COMPILED[language]
+    lines = source.splitlines()
+    found = []
+    for number,line in enumerate(lines,start=1):
+        for kind,pattern in patterns:
+            match = pattern.match(line)
+            if match:
+                found.append((number,kind,match.group("name"),line.strip()))
+                break
+    symbols = []
+    for i,(number,kind,name,signature) in enumerate(found):
+        end = found[i + 1][0] - 1 if i + 1 < len(found) else len(lines)
+        symbols.append(Symbol(name,name,kind,signature[:DOC_CHARS],"",number,max(number,min(end,number + MAX_REGEX_SPAN))))
+    return symbols
+
+def parse_source(source:str,language:str) -> list[Symbol]:
+    if language == "python":
+        try:
+            return parse_python(source)
+        except (SyntaxError,ValueError):
+            pass
+    return parse_regex(source,language)
+
+def _parse_batch(root:str,items:list[tuple[str,str,str]]) -> tuple[list[tuple[str,str]],list[tuple]]:
+    '''
+    (hash, language) of every content of the batch and the symbol rows parsed from
+    them, runs in worker processes so it only takes picklable arguments
+    '''
+    languages,rows = [],[]
+    for digest,path,language in items:
+        languages.append((digest,language))
+        absolute = os.path.join(root,path)
+        try:
+            if os.stat(absolute).st_size > MAX_SOURCE_BYTES:
+                continue
+            with open(absolute,'rb') as f:
+                source = f.read().decode("utf-8",errors="replace")
+        except OSError:
+            continue
+        rows.extend((digest,s.name,s.qualname,s.kind,s.signature,s.doc,s.start_line,s.end_line) for s in parse_source(source,language))
+    return languages,rows
+
+def _escape_like(text:str) -> str:
+    return text.replace("\\","\\\\").replace("%","\\%").replace("_","\\_")
+
+class SymbolIndex:
+    '''
+    Symbols of every source file in the project, parsed once per content hash and
+    kept in .propercode/symbols.db so unchanged files are never parsed again.
+    New contents are parsed on a background thread, across processes when there
+    are cores to spare, and committed batch by batch so a cold index of a large
+    project answers lookups with what is parsed so far
+    '''
+    def __init__(self,files:FileIndex):
+        self.files = files
+        self.db_path = Path(files.root) / ".propercode" / "symbols.db"
+        self._pool = ConnectionPool(self.db_path,pool_size=2)
+        self._lock = threading.Lock()
+        self._builder:threading.Thread|None = None
+        self._checked_at:float|None = None
+        # contents the running build hasn't parsed yet
+        self.pending = 0
+        with self._pool.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS parsed (hash TEXT PRIMARY KEY, language TEXT NOT NULL)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS symbols (
+                hash TEXT NOT NULL,
+                name TEXT NOT NULL,
+                qualname TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                doc TEXT NOT NULL,
+                start_line INTEGER NOT NULL,
+                end_line INTEGER NOT NULL,
+                FOREIGN KEY (hash) REFERENCES parsed (hash) ON DELETE CASCADE
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_name ON symbols (name COLLATE NOCASE)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_hash ON symbols (hash)")
+
+    def close(self):
+        self._pool.close()
+
+    @property
+    def building(self) -> bool:
+        return self._builder is not None and self._builder.is_alive()
+
+    def _store(self,languages:list[tuple[str,str]],rows:list[tuple],stale:list[tuple[str]]|tuple=()):
+        with self._pool.transaction() as conn:
+            conn.executemany("DELETE FROM parsed WHERE hash = ?",stale)
+            conn.executemany("INSERT OR IGNORE INTO parsed (hash,language) VALUES (?,?)",languages)
+            conn.executemany("INSERT INTO symbols (hash,name,qualname,kind,signature,doc,start_line,end_line) VALUES (?,?,?,?,?,?,?,?)",rows)
+
+    def _parse(self,missing:list[tuple[str,str,str]]) -> Iterator[tuple[list[tuple[str,str]],list[tuple]]]:
+        batches = [missing[i:i + PARSE_BATCH] for i in range(0,len(missing),PARSE_BATCH)]
+        workers = min(os.cpu_count() or 1,len(batches))
+        if workers <= 1:
+            for batch in batches:
+                yield _parse_batch(self.files.root,batch)
+            return
+        # ast parsing holds the GIL, processes are what spreads it over cores
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(_parse_batch,repeat(self.files.root),batches)
+
+    def _build(self,missing:list[tuple[str,str,str]]):
+        try:
+            for languages,rows in self._parse(missing):
+                self._store(languages,rows)
+                self.pending -= len(languages)
+        finally:
+            self.pending = 0
+
+    def update(self):
+        '''
+        Starts parsing the source files whose content isn't indexed yet, waits up to
+        BUILD_WAIT_SECONDS for it and drops symbols of contents no file has anymore.
+        Walks and stats the whole project, so it runs at most once per REFRESH_SECONDS
+        '''
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < REFRESH_SECONDS:
+                return
+            self.files.refresh()
+            paths = [path for path in self.files.paths(tuple(LANGUAGES)) if not path.endswith(".min.js")]
+            hashes = self.files.hashes(paths)
+            by_hash:dict[str,list[str]] = {}
+            for path,digest in hashes.items():
+                by_hash.setdefault(digest,[]).append(path)
+
+            with self._pool.connection() as conn:
+                parsed = {row["hash"] for row in conn.execute("SELECT hash FROM parsed")}
+            stale = [(digest,) for digest in parsed if digest not in by_hash]
+            if stale:
+                self._store([],[],stale)
+            self._checked_at = time.monotonic()
+            # contents changed during a build are picked up by the first check after it
+            if self.building:
+                return
+            missing = [(digest,file_paths[0],LANGUAGES[Path(file_paths[0]).suffix]) for digest,file_paths in by_hash.items() if digest not in parsed]
+            if missing:
+                self.pending = len(missing)
+                self._builder = threading.Thread(target=self._build,args=(missing,),name="symbol-index",daemon=True)
+                self._builder.start()
+                self._builder.join(BUILD_WAIT_SECONDS)
+
+    def _paths(self,digests:set[str]) -> dict[str,list[str]]:
+        '''
+        Hash -> current paths of the given contents, only the files stored with
+        those hashes are stat'ed again, not the whole project
+        '''
+        stored = self.files.paths_by_hash(list(digests))
+        by_hash:dict[str,list[str]] = {}
+        for path,digest in self.files.hashes([path for paths in stored.values() for path in paths]).items():
+            if digest in digests:
+                by_hash.setdefault(digest,[]).append(path)
+        return by_hash
+
+    def find(self,name:str,kind:str|None=None,limit:int=20,path:str|None=None) -> list[tuple[str,Symbol]]:
+        '''
+        (path, symbol) pairs whose name or dotted qualname matches, exact matches first
+        then prefix matches. Name may be qualified like Class.method, path is relative
+        to the project and limits the search to one file
+        '''
+        self.update()
+        short = name.rsplit(".",1)[-1]
+        query_sql = "SELECT * FROM symbols WHERE (name = ? COLLATE NOCASE OR name LIKE ? ESCAPE '\\')"
+        query_params:list = [short,_escape_like(short) + "%"]
+        if kind:
+            query_sql += " AND kind = ?"
+            query_params.append(kind)
+        if path is not None:
+            digests = list(self.files.hashes([path]).values())
+            if not digests:
+                return []
+            query_sql += f" AND hash IN ({','.join('?' * len(digests))})"
+            query_params.extend(digests)
+        # ranked before the limit so a qualified name isn't cut off by hundreds of same named symbols
+        query_sql += """
+        ORDER BY (qualname = ? COLLATE NOCASE OR qualname LIKE ? ESCAPE '\\') DESC,
+                 name = ? COLLATE NOCASE DESC, length(name), qualname
+        LIMIT 500
+        """
+        query_params.extend([name,"%." + _escape_like(name),short])
+        with self._pool.connection() as conn:
+            rows = conn.execute(query_sql,query_params).fetchall()
+
+        by_hash = self._paths({row["hash"] for row in rows})
+        results = []
+        for row in rows:
+            symbol = Symbol(row["name"],row["qualname"],row["kind"],row["signature"],row["doc"],row["start_line"],row["end_line"])
+            for file_path in by_hash.get(row["hash"],()):
+                if path is None or file_path == path:
+                    results.append((file_path,symbol))
+        return results[:limit]
+
+    def locate(self,names:list[str]) -> dict[str,list[str]]:
+        '''
+        Paths of the files defining each exactly named symbol, in one query
+        '''
+        if not names:
+            return {}
+        self.update()
+        placeholders = ",".join("?" * len(names))
+        with self._pool.connection() as conn:
+            rows = conn.execute(f"SELECT DISTINCT name, hash FROM symbols WHERE name IN ({placeholders})",names).fetchall()
+        by_hash = self._paths({row["hash"] for row in rows})
+        located:dict[str,list[str]] = {}
+        for row in rows:
+            located.setdefault(row["name"],[]).extend(by_hash.get(row["hash"],()))
+        return located
+
+_symbol_indexes:dict[str,SymbolIndex] = {}
+_symbol_indexes_lock = threading.Lock()
+
+def default_symbol_index() -> SymbolIndex:
+    files = default_index()
+    with _symbol_indexes_lock:
+        if files.root not in _symbol_indexes:
+            _symbol_indexes[files.root] = SymbolIndex(files)
+        return _symbol_indexes[files.root]
+
+def _building_notice(index:SymbolIndex) -> str:
+    if not index.building:
+        return ""
+    return f"\n(the symbol index is still being built, {index.pending:,} files left, results may be incomplete)"
+
+@RECORDER.timed("tool")
+def find_symbol(name:str,kind:str|None=None,limit:int=20) -> str:
+    '''
+    Finds where functions, classes, methods and constants are defined in the project.
+    name may be partial or qualified like 'Class.method', kind narrows to 'class',
+    'function', 'method', 'constant' or 'type'. Returns locations, signatures and docstrings
+    '''
+    index = default_symbol_index()
+    try:
+        matches = index.find(name,kind,limit)
+    except Exception as e:
+        return f"Symbol search failed: {e}"
+    if not matches:
+        return f"No symbol matching '{name}' found" + _building_notice(index)
+    lines = []
+    for path,symbol in matches:
+        line = f"{path}:{symbol.start_line}-{symbol.end_line} {symbol.kind} {symbol.qualname}: {symbol.signature}"
+        if symbol.doc:
+            line += f"\n    {symbol.doc}"
+        lines.append(line)
+    return "\n".join(lines) + _building_notice(index)
+
+@RECORDER.timed("tool")
+def get_symbol_source(name:str,path:str|None=None) -> str:
+    '''
+    Returns the source code of one function, class or method without reading the whole
+    file. Pass path when find_symbol showed the name in several files
+    '''
+    index = default_symbol_index()
+    wanted = index.files.relative(path) if path else None
+    if path and wanted is None:
+        return f"{path} is outside the project"
+    try:
+        matches = index.find(name,limit=50,path=wanted)
+    except Exception as e:
+        return f"Symbol search failed: {e}"
+    if not matches:
+        return f"No symbol matching '{name}' found" + (f" in {path}" if path else "") + _building_notice(index)
+
+    found_path,symbol = matches[0]
+    source = _read(str(Path(default_index().root) / found_path),start_line=symbol.start_line,end_line=symbol.end_line)
+    header = f"# {found_path}:{symbol.start_line}-{symbol.end_line} {symbol.kind} {symbol.qualname}"
+    others = [f"{other_path}:{other.start_line} {other.qualname}" for other_path,other in matches[1:6]]
+    if others:
+        header += "\n# also defined at: " + ", ".join(others)
+    return f"{header}\n{source}"
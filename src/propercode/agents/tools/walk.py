@@ -0,0 +1,87 @@
+import os
+from typing import Iterator
+
+from pathspec import PathSpec
+
+class IgnoreRules:
+    '''
+    Compiled .gitignore matching for one repository root. Every directory's
+    .gitignore is compiled once on first use and applies to the paths below it,
+    the deepest file with a matching rule decides so negations work like git
+    '''
+    # the agent's own state is never part of the project
+    ALWAYS_IGNORED = [".git/",".propercode/"]
+
+    def __init__(self,root:str,extra_patterns:list[str]|None=None):
+        self.root = os.path.abspath(root)
+        self._always = PathSpec.from_lines("gitwildmatch",self.ALWAYS_IGNORED + (extra_patterns or []))
+        self._specs:dict[str,PathSpec|None] = {}
+
+    def _spec(self,rel_dir:str) -> PathSpec|None:
+        if rel_dir not in self._specs:
+            lines = []
+            sources = [os.path.join(self.root,rel_dir,".gitignore")]
+            if not rel_dir:
+                sources.append(os.path.join(self.root,".git","info","exclude"))
+            for source in sources:
+                try:
+                    with open(source,'r',encoding='utf-8') as f:
+                        lines.extend(f.read().splitlines())
+                except OSError:
+                    pass
+            self._specs[rel_dir] = PathSpec.from_lines("gitwildmatch",lines) if lines else None
+        return self._specs[rel_dir]
+
+    def ignored(self,rel_path:str,is_dir:bool=False) -> bool:
+        '''
+        Whether a '/' separated path relative to the root is ignored
+        '''
+        suffix = "/" if is_dir else ""
+        if self._always.match_file(rel_path + suffix):
+            return True
+        parts = rel_path.split("/")
+        for depth in range(len(parts) - 1,-1,-1):
+            spec = self._spec("/".join(parts[:depth]))
+            if spec is None:
+                continue
+            result = spec.check_file("/".join(parts[depth:]) + suffix)
+            if result.include is not None:
+                return result.include
+        return False
+
+def scan_dir(path:str,rel_path:str,rules:IgnoreRules) -> tuple[list[os.DirEntry],list[os.DirEntry]]:
+    '''
+    The directories and files directly inside path that aren't ignored, sorted by name.
+    Symlinked directories are listed as files so walks never leave the tree
+    '''
+    dirs,files = [],[]
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if rules.ignored(f"{rel_path}/{entry.name}" if rel_path else entry.name,is_dir):
+                    continue
+                (dirs if is_dir else files).append(entry)
+    except OSError:
+        pass
+    dirs.sort(key=lambda entry: entry.name)
+    files.sort(key=lambda entry: entry.name)
+    return dirs,files
+
+def walk_files(root:str,rules:IgnoreRules|None=None) -> Iterator[tuple[str,os.DirEntry]]:
+    '''
+    Yields (relative path, entry) of every file under root that isn't ignored, depth first
+    '''
+    root = os.path.abspath(root)
+    rules = rules or IgnoreRules(root)
+    stack = [(root,"")]
+    while stack:
+        path,rel_path = stack.pop()
+        dirs,files = scan_dir(path,rel_path,rules)
+        for entry in files:
+            yield (f"{rel_path}/{entry.name}" if rel_path else entry.name),entry
+        for entry in reversed(dirs):
+            stack.append((entry.path,f"{rel_path}/{entry.name}" if rel_path else entry.name))
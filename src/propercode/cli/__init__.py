@@ -6,6 +6,8 @@ from propercode.cli.core.config import ConfigManager
 from .commands.init import app as init_app
 from .commands.keys import app as keys_app
 from .commands.run import app as run_app
+from .commands.batch import app as batch_app
+from .commands.memory import app as memory_app
 
 from .commands.stats import app as stats_app
 
@@ -24,7 +26,9 @@ def main_callback(ctx:typer.Context,help="The specific model to use. Overrides c
 app.add_typer(init_app,name="init")
 app.add_typer(keys_app,name="keys")
 app.add_typer(run_app,name="run")
+app.add_typer(batch_app,name="batch")
 app.add_typer(stats_app,name="stats")
+app.add_typer(memory_app,name="memory")
 
 def main():
     '''
@@ -0,0 +1,147 @@
+import json
+import time
+import asyncio
+import statistics
+from pathlib import Path
+from typing import Optional
+import typer
+from rich import print
+from rich.table import Table
+from rich.console import Console
+
+from propercode.models.cli_config import CLISettings
+from propercode.agents.orchestrator import CodeOrchestrator
+from propercode.agents.memory.state import AgentState
+
+# options may follow the tasks file, groups stop parsing at their first argument by default
+app = typer.Typer(name="batch",help="Runs many coding tasks from a JSONL file concurrently",no_args_is_help=True,context_settings={"allow_interspersed_args":True})
+
+def load_tasks(path:Path,max_retries:int) -> list[dict]:
+    '''
+    Tasks of a JSONL file, one {"prompt": ..., "id": ..., "max_retries": ...} object
+    or a bare JSON string prompt per line. Blank lines are skipped
+    '''
+    tasks = []
+    with path.open('r',encoding='utf-8') as f:
+        for number,line in enumerate(f,start=1):
+            if not line.strip():
+                continue
+            try:
+                task = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise typer.BadParameter(f"line {number} of {path} is not valid JSON: {e}")
+            if isinstance(task,str):
+                task = {"prompt":task}
+            if not isinstance(task,dict) or "prompt" not in task:
+                raise typer.BadParameter(f"line {number} of {path} has no prompt")
+            if not isinstance(task["prompt"],str) or not task["prompt"].strip():
+                raise typer.BadParameter(f"line {number} of {path} has a prompt that is not a non-empty string: {task['prompt']!r}")
+            value = task.get("max_retries",max_retries)
+            # int() would turn true into 1 and truncate 2.7 to 2
+            if isinstance(value,bool) or (isinstance(value,float) and not value.is_integer()):
+                raise typer.BadParameter(f"line {number} of {path} has a max_retries that is not an integer: {value!r}")
+            try:
+                retries = int(value)
+            except (TypeError,ValueError):
+                raise typer.BadParameter(f"line {number} of {path} has a max_retries that is not an integer: {value!r}")
+            if retries < 1:
+                raise typer.BadParameter(f"line {number} of {path} has a max_retries of {retries}, it must be at least 1")
+            tasks.append({"id":task.get("id",number),"prompt":task["prompt"],"max_retries":retries})
+    return tasks
+
+async def run_batch(orch:CodeOrchestrator,tasks:list[dict],output:Path,concurrency:int) -> list[dict]:
+    '''
+    Runs the tasks through one orchestrator with at most concurrency in flight and
+    appends every result to output as soon as its task finishes
+    '''
+    queue:asyncio.Queue[dict] = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+    results = []
+
+    with output.open('a',encoding='utf-8') as out:
+        async def worker():
+            while True:
+                try:
+                    task = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                result = {"id":task["id"],"prompt":task["prompt"]}
+                try:
+                    final_output,state = await orch.run(AgentState(user_prompt=task["prompt"],max_retries=task["max_retries"]))
+                    result.update({
+                        "status":"ok" if not state.errors else "failed",
+                        "output":final_output,
+                        "errors":state.errors,
+                        "retries":state.retries,
+                        "session_id":str(state.session_id),
+                        "code":state.code_output.model_dump(mode="json") if state.code_output else None,
+                    })
+                except Exception as e:
+                    result.update({"status":"error","errors":[f"{type(e).__name__}: {e}"]})
+                result["seconds"] = round(time.perf_counter() - start,3)
+                out.write(json.dumps(result,ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(result)
+                print(f"[dim][{len(results)}/{len(tasks)}][/dim] task {result['id']} {result['status']} in {result['seconds']:.1f}s")
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency,len(tasks)))))
+    return results
+
+def _summary(results:list[dict],wall:float,concurrency:int) -> Table:
+    latencies = sorted(result["seconds"] for result in results)
+    statuses = {status:sum(1 for result in results if result["status"] == status) for status in ("ok","failed","error")}
+    table = Table(title=f"Batch of {len(results)} tasks, concurrency {concurrency}")
+    table.add_column("",style="cyan")
+    table.add_column("Value",justify="right",style="green")
+    table.add_row("Succeeded",f"{statuses['ok']:,}")
+    table.add_row("Failed",f"{statuses['failed']:,}")
+    table.add_row("Errors",f"{statuses['error']:,}")
+    table.add_row("Wall time",f"{wall:.1f}s")
+    table.add_row("Throughput",f"{len(results) / wall * 60:.1f} tasks/min" if wall else "-")
+    if latencies:
+        quantiles = statistics.quantiles(latencies,n=100,method="inclusive") if len(latencies) > 1 else [latencies[0]] * 99
+        table.add_row("Latency p50",f"{quantiles[49]:.1f}s")
+        table.add_row("Latency p90",f"{quantiles[89]:.1f}s")
+        table.add_row("Latency p99",f"{quantiles[98]:.1f}s")
+        table.add_row("Latency max",f"{latencies[-1]:.1f}s")
+        table.add_row("Mean retries",f"{statistics.mean(result.get('retries',0) for result in results):.2f}")
+    return table
+
+@app.callback(invoke_without_command=True)
+def batch(
+    ctx:typer.Context,
+    tasks_file:Path = typer.Argument(...,exists=True,dir_okay=False,help="JSONL file with one task per line, {\"prompt\": ...} or a JSON string"),
+    concurrency:int = typer.Option(4,"--concurrency","-c",min=1,help="Tasks run at the same time"),
+    output:Optional[Path] = typer.Option(None,"--output","-o",help="JSONL file results are appended to, defaults to <tasks>.results.jsonl"),
+    max_retries:int = typer.Option(2,"--max-retries",min=1,help="Evaluation retries of tasks that don't set their own"),
+):
+    '''
+    Runs every task of the file through one orchestrator, sharing its memory store,
+    agents and provider connections, and writes results as tasks complete
+    '''
+    settings : CLISettings = ctx.obj
+    tasks = load_tasks(tasks_file,max_retries)
+    if not tasks:
+        print(f"[yellow]No tasks in {tasks_file}[/yellow]")
+        raise typer.Exit()
+    output = output or tasks_file.with_suffix(".results.jsonl")
+
+    async def _async_batch() -> tuple[list[dict],float]:
+        print(f"[dim]Running {len(tasks)} tasks with concurrency {concurrency}, model: {settings.default_model}, results to {output}[/dim]\n")
+        # every running task can hold a pooled connection while it writes
+        orch = CodeOrchestrator(
+            model_name=settings.default_model or "minimax/minimax-m2:free",
+            memory_pool_size=max(settings.memory_pool_size,concurrency),
+            context_token_budget=settings.context_token_budget,
+        )
+        start = time.perf_counter()
+        try:
+            results = await run_batch(orch,tasks,output,concurrency)
+        finally:
+            await orch.aclose()
+        return results,time.perf_counter() - start
+
+    results,wall = asyncio.run(_async_batch())
+    Console().print(_summary(results,wall,concurrency))
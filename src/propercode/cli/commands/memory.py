@@ -0,0 +1,90 @@
+import typer
+from rich import print
+from rich.table import Table
+from rich.console import Console
+
+from propercode.agents.memory.store import MemoryStore
+from propercode.agents.memory.async_store import AsyncMemoryStore
+from propercode.agents.memory.manager import MemoryManager
+
+app = typer.Typer(name="memory",help="Inspect and maintain the agent's memory database",no_args_is_help=True)
+
+def _format_bytes(size:int) -> str:
+    for unit in ("B","KB","MB","GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+        size /= 1024
+    return f"{size} B"
+
+@app.command("maintain",help="Prune old memories, return free pages and refresh planner statistics")
+def maintain(
+    days: int = typer.Option(30,"--days","-d",help="Keep memories from the last N days"),
+    full: bool = typer.Option(False,"--full",help="Run a full VACUUM, also switches old databases to incremental vacuum"),
+):
+    '''
+    Runs a complete maintenance pass and reports how the database changed
+    '''
+    store = MemoryStore()
+    try:
+        manager = MemoryManager(store=AsyncMemoryStore(store))
+        report = manager.maintain(days_to_keep=days,full_vacuum=full,analyze=True)
+    finally:
+        store.close_conn()
+
+    table = Table(title="Memory database")
+    table.add_column("",style="cyan")
+    table.add_column("Before",justify="right")
+    table.add_column("After",justify="right",style="green")
+    before,after = report.before,report.after
+    table.add_row("File size",_format_bytes(before["file_bytes"]),_format_bytes(after["file_bytes"]))
+    table.add_row("WAL size",_format_bytes(before["wal_bytes"]),_format_bytes(after["wal_bytes"]))
+    table.add_row("Pages",f"{before['page_count']:,}",f"{after['page_count']:,}")
+    table.add_row("Free pages",f"{before['freelist_count']:,}",f"{after['freelist_count']:,}")
+    table.add_row("Fragmentation",f"{before['fragmentation']:.1%}",f"{after['fragmentation']:.1%}")
+    table.add_row("Conversations",f"{before['conversations']:,}",f"{after['conversations']:,}")
+    table.add_row("Memories",f"{before['memories']:,}",f"{after['memories']:,}")
+    Console().print(table)
+
+    print(f"Pruned [bold]{report.deleted_rows:,}[/bold] rows and merged [bold]{report.merged_memories:,}[/bold] duplicate memories in {report.prune_seconds * 1000:.1f} ms")
+    if report.counted_histories:
+        print(f"Counted tokens of [bold]{report.counted_histories:,}[/bold] older conversations")
+    if report.compacted_vectors:
+        print("Rebuilt the embedding matrix without the vectors of deleted memories")
+    print(f"Vacuum took {report.vacuum_seconds * 1000:.1f} ms, ANALYZE took {report.analyze_seconds * 1000:.1f} ms")
+    if not after["incremental_vacuum"]:
+        print("[dim]This database predates incremental vacuum, run with --full once to enable it[/dim]")
+
+@app.command("compress",help="Compress stored conversation histories in place")
+def compress(
+    train_dict: bool = typer.Option(False,"--train-dict",help="Train a zstd dictionary on recent histories first"),
+    recompress: bool = typer.Option(False,"--recompress",help="Also rewrite rows that are already compressed"),
+    dict_size: int = typer.Option(64 * 1024,"--dict-size",help="Size of the trained dictionary in bytes"),
+):
+    '''
+    Migrates histories to the compressed format and reports the bytes saved
+    '''
+    store = MemoryStore()
+    try:
+        file_before = store.db_stats()["file_bytes"]
+        if train_dict:
+            dict_id = store.train_history_dictionary(dict_size=dict_size)
+            print(f"Trained compression dictionary #{dict_id}")
+            recompress = True
+        result = store.compress_histories(recompress=recompress)
+        store.vacuum()
+        after = store.db_stats()
+    except RuntimeError as e:
+        print(f"[bold red]{e}[/bold red]")
+        raise typer.Exit(code=1)
+    finally:
+        store.close_conn()
+
+    if result["rows"] == 0:
+        print("[yellow]No histories needed compressing.[/yellow]")
+        return
+    ratio = result["before_bytes"] / result["after_bytes"] if result["after_bytes"] else 0.0
+    print(f"Rewrote [bold]{result['rows']:,}[/bold] histories")
+    print(f"History bytes: {_format_bytes(result['before_bytes'])} -> [green]{_format_bytes(result['after_bytes'])}[/green] ({ratio:.1f}x)")
+    print(f"Database file: {_format_bytes(file_before)} -> [green]{_format_bytes(after['file_bytes'])}[/green]")
+    if not after["incremental_vacuum"]:
+        print("[dim]Freed pages stay in the file until 'propercode memory maintain --full' is run[/dim]")
@@ -30,8 +30,14 @@ def run(ctx:typer.Context,prompt:str=typer.Argument(...,help="Provide the coding
         print(Panel(f"🚀 Starting agent run for prompt: '[bold]{prompt}[/bold]'", title="[bold green]Propercode[/bold green]", border_style="green"))
         print(f"[dim]Using provider: {settings.default_provider}, model: {settings.default_model}[/dim]\n")
 
-        orch = CodeOrchestrator(model_name=settings.default_model or "minimax/minimax-m2:free")
+        orch = CodeOrchestrator(model_name=settings.default_model or "minimax/minimax-m2:free",memory_pool_size=settings.memory_pool_size,context_token_budget=settings.context_token_budget)
         state = AgentState(user_prompt=prompt, max_retries=2)
+        try:
+            await _show_result(orch,state)
+        finally:
+            await orch.aclose()
+
+    async def _show_result(orch:CodeOrchestrator,state:AgentState):
         output, final_state = await orch.run(state)
 
         print("Output:", output)
@@ -1,16 +1,22 @@
-# this entire code is written by propercode agent and this code is under testing !!!
-
 """
 Stats command for displaying LLM token usage statistics.
 
-This module implements a Typer command group that analyzes the memory store
-to estimate and display token usage statistics from conversations.
+This module implements a Typer command group that reads the daily usage
+rollup of the current project's memory store. The rollup is updated in the
+same transaction that saves a conversation or records a node run, so every
+report is a query over days rather than over stored conversations. It holds
+BPE token counts of the stored conversations and the exact usage reported by
+the model provider.
 """
 
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-import sqlite3
+from typing import Optional, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from enum import Enum
 from pathlib import Path
+import csv
+import json
+import sqlite3
 
 import typer
 from rich.console import Console
@@ -19,280 +25,310 @@ from rich.panel import Panel
 from rich.text import Text
 from rich import box
 
-app = typer.Typer(help="Display LLM token usage statistics (note: it's in testing and it's completly implemented by propercode itself)")
+from propercode.agents.memory.store import MemoryStore, CHARS_PER_TOKEN
+from propercode.agents.memory.latency import percentiles
+from propercode.agents.tokenizer import count_tokens
+
+app = typer.Typer(help="Display LLM token usage statistics")
 console = Console()
 
 
 class TokenEstimator:
     """Estimate token usage from conversation content."""
-    
+
     # Industry standard approximation: 1 token ≈ 4 characters
-    # This can be refined based on actual usage patterns
-    CHAR_TO_TOKEN_RATIO = 4
-    
+    # Only used for rows saved before BPE token counts were recorded
+    CHAR_TO_TOKEN_RATIO = CHARS_PER_TOKEN
+
     @staticmethod
     def estimate_tokens_from_text(text: str) -> int:
-        """Estimate tokens from text content."""
+        """Estimate tokens from text content with the offline BPE tokenizer."""
         if not text:
             return 0
-        return max(1, len(text) // TokenEstimator.CHAR_TO_TOKEN_RATIO)
-    
+        return count_tokens([text])[0]
+
     @staticmethod
-    def estimate_tokens_from_conversation(conversation_data: Dict[str, Any]) -> int:
-        """Estimate tokens from a conversation record."""
-        total_tokens = 0
-        
-        # Estimate from user messages
-        if 'user_message' in conversation_data and conversation_data['user_message']:
-            total_tokens += TokenEstimator.estimate_tokens_from_text(
-                str(conversation_data['user_message'])
-            )
-        
-        # Estimate from assistant responses
-        if 'assistant_response' in conversation_data and conversation_data['assistant_response']:
-            total_tokens += TokenEstimator.estimate_tokens_from_text(
-                str(conversation_data['assistant_response'])
-            )
-        
-        # Estimate from metadata
-        if 'metadata' in conversation_data and conversation_data['metadata']:
-            total_tokens += TokenEstimator.estimate_tokens_from_text(
-                str(conversation_data['metadata'])
-            )
-        
-        return total_tokens
+    def count_tokens(texts: list[str]) -> list[int]:
+        """Estimate tokens for a batch of texts, repeated texts are served from a cache."""
+        return count_tokens(texts)
 
 
 def get_memory_db_path() -> Path:
-    """Get the path to the memory database."""
-    home_dir = Path.home()
-    return home_dir / ".propercode" / "memory.db"
-
-
-def analyze_conversations() -> Dict[str, Any]:
-    """Analyze all conversations in the memory store."""
-    db_path = get_memory_db_path()
-    
-    if not db_path.exists():
-        return {
-            "total_conversations": 0,
-            "total_tokens": 0,
-            "total_characters": 0,
-            "conversations": []
-        }
-    
+    """Get the path to the memory database of the current project."""
+    return Path.cwd() / ".propercode" / "memory.db"
+
+
+@contextmanager
+def open_store() -> Iterator[Optional[MemoryStore]]:
+    """Open the project's memory store, yields None when nothing was recorded yet."""
+    if not get_memory_db_path().exists():
+        yield None
+        return
+    store = MemoryStore()
     try:
-        with sqlite3.connect(str(db_path)) as conn:
-            cursor = conn.cursor()
-            
-            # Get all conversations
-            cursor.execute("""
-                SELECT id, session_id, user_message, assistant_response, 
-                       created_at, updated_at, metadata
-                FROM conversations
-                ORDER BY created_at DESC
-            """)
-            
-            conversations = []
-            total_tokens = 0
-            total_characters = 0
-            
-            for row in cursor.fetchall():
-                conv_id, session_id, user_msg, assistant_resp, created_at, updated_at, metadata = row
-                
-                # Calculate token estimates
-                user_tokens = TokenEstimator.estimate_tokens_from_text(user_msg or "")
-                assistant_tokens = TokenEstimator.estimate_tokens_from_text(assistant_resp or "")
-                metadata_tokens = TokenEstimator.estimate_tokens_from_text(metadata or "")
-                
-                conv_tokens = user_tokens + assistant_tokens + metadata_tokens
-                conv_characters = len(user_msg or "") + len(assistant_resp or "") + len(metadata or "")
-                
-                conversation = {
-                    "id": conv_id,
-                    "session_id": session_id,
-                    "user_message": user_msg,
-                    "assistant_response": assistant_resp,
-                    "user_tokens": user_tokens,
-                    "assistant_tokens": assistant_tokens,
-                    "metadata_tokens": metadata_tokens,
-                    "total_tokens": conv_tokens,
-                    "total_characters": conv_characters,
-                    "created_at": created_at,
-                    "updated_at": updated_at,
-                    "metadata": metadata
-                }
-                
-                conversations.append(conversation)
-                total_tokens += conv_tokens
-                total_characters += conv_characters
-            
-            return {
-                "total_conversations": len(conversations),
-                "total_tokens": total_tokens,
-                "total_characters": total_characters,
-                "conversations": conversations
-            }
-    
-    except Exception as e:
-        console.print(f"[red]Error analyzing conversations: {e}[/red]")
-        return {
-            "total_conversations": 0,
-            "total_tokens": 0,
-            "total_characters": 0,
-            "conversations": []
-        }
-
-
-def analyze_by_session(conversations: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    """Group conversations by session and calculate statistics."""
-    session_stats = {}
-    
-    for conv in conversations:
-        session_id = conv.get("session_id", "default")
-        
-        if session_id not in session_stats:
-            session_stats[session_id] = {
-                "session_id": session_id,
-                "conversation_count": 0,
-                "total_tokens": 0,
-                "total_characters": 0,
-                "user_tokens": 0,
-                "assistant_tokens": 0,
-                "metadata_tokens": 0
-            }
-        
-        session = session_stats[session_id]
-        session["conversation_count"] += 1
-        session["total_tokens"] += conv["total_tokens"]
-        session["total_characters"] += conv["total_characters"]
-        session["user_tokens"] += conv["user_tokens"]
-        session["assistant_tokens"] += conv["assistant_tokens"]
-        session["metadata_tokens"] += conv["metadata_tokens"]
-    
-    return session_stats
-
-
-def get_recent_conversations(conversations: List[Dict[str, Any]], days: int = 7) -> List[Dict[str, Any]]:
-    """Get conversations from the last N days."""
-    cutoff_date = datetime.now() - timedelta(days=days)
-    
-    recent = []
-    for conv in conversations:
-        if conv.get("created_at"):
-            try:
-                # Assuming created_at is in ISO format or timestamp
-                if isinstance(conv["created_at"], str):
-                    conv_date = datetime.fromisoformat(conv["created_at"].replace('Z', '+00:00'))
-                else:
-                    conv_date = datetime.fromtimestamp(conv["created_at"])
-                
-                if conv_date >= cutoff_date:
-                    recent.append(conv)
-            except (ValueError, TypeError):
-                # If we can't parse the date, include it
-                recent.append(conv)
-    
-    return recent
+        yield store
+    finally:
+        store.close_conn()
+
+
+def _no_data():
+    console.print("[yellow]No conversations found in memory store.[/yellow]")
+    console.print("[dim]Start a conversation with 'propercode run' to generate statistics.[/dim]")
+
+
+def _short(session_id: str, width: int) -> str:
+    return session_id[:width] + "..." if len(session_id) > width else session_id
+
+
+def query_totals(conn: sqlite3.Connection, since: Optional[str] = None) -> sqlite3.Row:
+    """Sum the daily rollup, optionally from a relative date modifier such as '-7 days'."""
+    where = "WHERE day >= date('now', ?)" if since else ""
+    return conn.execute(
+        f"""
+        SELECT COALESCE(SUM(conversations), 0) AS conversations,
+               COALESCE(SUM(characters), 0) AS characters,
+               COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+               COALESCE(SUM(history_tokens), 0) AS history_tokens,
+               COALESCE(SUM(runs), 0) AS runs,
+               COALESCE(SUM(requests), 0) AS requests,
+               COALESCE(SUM(input_tokens), 0) AS input_tokens,
+               COALESCE(SUM(output_tokens), 0) AS output_tokens,
+               COALESCE(SUM(wall_ms), 0) AS wall_ms
+        FROM usage_daily {where}
+        """,
+        (since,) if since else (),
+    ).fetchone()
 
 
 @app.command("overall")
 def overall_stats():
     """Display overall token usage statistics."""
     console.print("[bold blue]📊 LLM Token Usage Statistics[/bold blue]\n")
-    
-    data = analyze_conversations()
-    
-    if data["total_conversations"] == 0:
-        console.print("[yellow]No conversations found in memory store.[/yellow]")
-        console.print("[dim]Start a conversation with 'propercode run' to generate statistics.[/dim]")
-        return
-    
-    # Create summary panel
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+        with store.connection() as conn:
+            totals = query_totals(conn)
+            models = conn.execute(
+                """
+                SELECT model_name, SUM(conversations) AS conversations,
+                       SUM(prompt_tokens + history_tokens) AS tokens,
+                       SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens
+                FROM usage_daily
+                GROUP BY model_name
+                HAVING SUM(conversations) > 0 OR SUM(runs) > 0
+                ORDER BY tokens DESC
+                """
+            ).fetchall()
+
+    if totals["conversations"] == 0:
+        return _no_data()
+
+    total_tokens = totals["prompt_tokens"] + totals["history_tokens"]
     summary_text = Text()
-    summary_text.append(f"Total Conversations: ", style="bold")
-    summary_text.append(f"{data['total_conversations']:,}\n", style="green")
-    summary_text.append(f"Total Token Estimate: ", style="bold")
-    summary_text.append(f"{data['total_tokens']:,}\n", style="green")
-    summary_text.append(f"Total Characters: ", style="bold")
-    summary_text.append(f"{data['total_characters']:,}\n", style="dim")
-    summary_text.append(f"Average Tokens per Conversation: ", style="bold")
-    avg_tokens = data['total_tokens'] // data['total_conversations'] if data['total_conversations'] > 0 else 0
-    summary_text.append(f"{avg_tokens:,}\n", style="cyan")
-    
+    summary_text.append("Total Conversations: ", style="bold")
+    summary_text.append(f"{totals['conversations']:,}\n", style="green")
+    summary_text.append("Total Token Estimate: ", style="bold")
+    summary_text.append(f"{total_tokens:,}\n", style="green")
+    summary_text.append("Total Characters: ", style="bold")
+    summary_text.append(f"{totals['characters']:,}\n", style="dim")
+    summary_text.append("Average Tokens per Conversation: ", style="bold")
+    summary_text.append(f"{total_tokens // totals['conversations']:,}\n", style="cyan")
+
     console.print(Panel(summary_text, title="Summary", box=box.ROUNDED))
-    
-    # Create detailed table
+
+    if totals["runs"]:
+        measured_text = Text()
+        measured_text.append("Input Tokens: ", style="bold")
+        measured_text.append(f"{totals['input_tokens']:,}\n", style="green")
+        measured_text.append("Output Tokens: ", style="bold")
+        measured_text.append(f"{totals['output_tokens']:,}\n", style="green")
+        measured_text.append("Model Requests: ", style="bold")
+        measured_text.append(f"{totals['requests']:,}\n", style="cyan")
+        measured_text.append("Agent Wall Time: ", style="bold")
+        measured_text.append(f"{totals['wall_ms'] / 1000:,.1f}s\n", style="dim")
+        console.print(Panel(measured_text, title="Measured Usage (reported by the provider)", box=box.ROUNDED))
+
     table = Table(title="Token Usage Breakdown")
     table.add_column("Component", style="cyan", no_wrap=True)
     table.add_column("Tokens", style="green", justify="right")
     table.add_column("Percentage", style="yellow", justify="right")
-    
-    # Calculate breakdown from conversations
-    user_total = sum(conv["user_tokens"] for conv in data["conversations"])
-    assistant_total = sum(conv["assistant_tokens"] for conv in data["conversations"])
-    metadata_total = sum(conv["metadata_tokens"] for conv in data["conversations"])
-    
-    if data["total_tokens"] > 0:
-        user_pct = (user_total / data["total_tokens"]) * 100
-        assistant_pct = (assistant_total / data["total_tokens"]) * 100
-        metadata_pct = (metadata_total / data["total_tokens"]) * 100
-    else:
-        user_pct = assistant_pct = metadata_pct = 0
-    
-    table.add_row("User Messages", f"{user_total:,}", f"{user_pct:.1f}%")
-    table.add_row("Assistant Responses", f"{assistant_total:,}", f"{assistant_pct:.1f}%")
-    table.add_row("Metadata", f"{metadata_total:,}", f"{metadata_pct:.1f}%")
-    
+    for label, tokens in (("User Prompts", totals["prompt_tokens"]), ("Agent History", totals["history_tokens"])):
+        pct = (tokens / total_tokens) * 100 if total_tokens else 0
+        table.add_row(label, f"{tokens:,}", f"{pct:.1f}%")
+
     console.print("\n")
     console.print(table)
 
+    if len(models) > 1 or (models and models[0]["model_name"]):
+        by_model = Table(title="Usage by Model")
+        by_model.add_column("Model", style="cyan")
+        by_model.add_column("Conversations", style="green", justify="right")
+        by_model.add_column("Tokens", style="yellow", justify="right")
+        by_model.add_column("Input Tokens", style="blue", justify="right")
+        by_model.add_column("Output Tokens", style="magenta", justify="right")
+        for row in models:
+            by_model.add_row(
+                row["model_name"] or "unknown",
+                f"{row['conversations']:,}",
+                f"{row['tokens']:,}",
+                f"{row['input_tokens']:,}",
+                f"{row['output_tokens']:,}",
+            )
+        console.print(by_model)
+
+
+@app.command("nodes")
+def node_stats(
+    days: Optional[int] = typer.Option(None, "--days", "-d", help="Only include the last N days"),
+):
+    """Display measured token usage and latency per node and model."""
+    console.print("[bold blue]🧩 Token Usage and Latency by Node[/bold blue]\n")
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+
+        table = Table(title="Measured Usage by Node")
+        table.add_column("Node", style="cyan")
+        table.add_column("Model", style="dim")
+        table.add_column("Runs", justify="right")
+        table.add_column("Retries", justify="right")
+        table.add_column("Requests", justify="right")
+        table.add_column("Input Tokens", style="blue", justify="right")
+        table.add_column("Output Tokens", style="magenta", justify="right")
+        table.add_column("Share", style="yellow", justify="right")
+        table.add_column("Avg Time", style="green", justify="right")
+        table.add_column("Total Time", justify="right")
+
+        where = "WHERE timestamp >= datetime('now', ?)" if days else ""
+        params = (f"-{days} days",) if days else ()
+        with store.connection() as conn:
+            grand_total = conn.execute(
+                f"SELECT COALESCE(SUM(input_tokens + output_tokens), 0) FROM node_usage {where}", params
+            ).fetchone()[0]
+            for row in conn.execute(
+                f"""
+                SELECT node, COALESCE(model_name, '-') AS model_name,
+                       COUNT(*) AS runs, SUM(retry > 0) AS retries, SUM(requests) AS requests,
+                       SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+                       AVG(wall_ms) AS avg_ms, SUM(wall_ms) AS total_ms
+                FROM node_usage {where}
+                GROUP BY node, model_name
+                ORDER BY SUM(input_tokens + output_tokens) DESC
+                """,
+                params,
+            ):
+                tokens = row["input_tokens"] + row["output_tokens"]
+                share = (tokens / grand_total) * 100 if grand_total else 0
+                table.add_row(
+                    row["node"],
+                    row["model_name"],
+                    f"{row['runs']:,}",
+                    f"{row['retries']:,}",
+                    f"{row['requests']:,}",
+                    f"{row['input_tokens']:,}",
+                    f"{row['output_tokens']:,}",
+                    f"{share:.1f}%",
+                    f"{row['avg_ms'] / 1000:,.2f}s",
+                    f"{row['total_ms'] / 1000:,.1f}s",
+                )
+
+    if table.row_count == 0:
+        console.print("[yellow]No measured usage recorded yet.[/yellow]")
+        return
+    console.print(table)
+
+
+def _format_ms(ms: float) -> str:
+    return f"{ms / 1000:,.2f}s" if ms >= 1000 else f"{ms:,.1f}ms"
+
+
+@app.command("latency")
+def latency_stats(
+    days: Optional[int] = typer.Option(None, "--days", "-d", help="Only include the last N days"),
+):
+    """Display p50/p90/p99 latency of every node and tool, per model."""
+    console.print("[bold blue]⏱️  Latency Percentiles[/bold blue]\n")
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+        histograms = store.latency_histograms(days)
+
+    if not histograms:
+        console.print("[yellow]No latencies recorded yet.[/yellow]")
+        return
+
+    table = Table(title="Latency by Node and Tool")
+    table.add_column("Kind", style="dim")
+    table.add_column("Name", style="cyan")
+    table.add_column("Model", style="dim")
+    table.add_column("Calls", justify="right")
+    table.add_column("p50", style="green", justify="right")
+    table.add_column("p90", style="yellow", justify="right")
+    table.add_column("p99", style="red", justify="right")
+    # the middle of the slowest bucket, not the exact slowest call
+    table.add_column("~Max", justify="right")
+    # nodes first, then the slowest p90 within each kind
+    rows = []
+    for (kind, name, model_name), buckets in histograms.items():
+        p50, p90, p99, top = percentiles(buckets, [0.5, 0.9, 0.99, 1.0])
+        rows.append((kind != "node", -p90, kind, name, model_name, sum(buckets.values()), p50, p90, p99, top))
+    for _, _, kind, name, model_name, calls, p50, p90, p99, top in sorted(rows):
+        table.add_row(kind, name, model_name or "-", f"{calls:,}", _format_ms(p50), _format_ms(p90), _format_ms(p99), _format_ms(top))
+    console.print(table)
+    console.print("[dim]Percentiles and ~Max come from log buckets and are accurate to within ~9%.[/dim]")
+
 
 @app.command("by-session")
-def session_stats():
+def session_stats(
+    limit: int = typer.Option(50, "--limit", "-n", help="Number of sessions to show"),
+):
     """Display token usage statistics by session."""
     console.print("[bold blue]🔗 Session-based Token Usage[/bold blue]\n")
-    
-    data = analyze_conversations()
-    
-    if data["total_conversations"] == 0:
-        console.print("[yellow]No conversations found in memory store.[/yellow]")
-        return
-    
-    session_stats = analyze_by_session(data["conversations"])
-    
-    if not session_stats:
-        console.print("[yellow]No session data available.[/yellow]")
-        return
-    
-    # Create table
-    table = Table(title="Token Usage by Session")
-    table.add_column("Session ID", style="cyan")
-    table.add_column("Conversations", style="green", justify="right")
-    table.add_column("Total Tokens", style="yellow", justify="right")
-    table.add_column("User Tokens", style="blue", justify="right")
-    table.add_column("Assistant Tokens", style="magenta", justify="right")
-    table.add_column("Avg Tokens/Conv", style="dim", justify="right")
-    
-    # Sort sessions by total tokens (descending)
-    sorted_sessions = sorted(
-        session_stats.values(), 
-        key=lambda x: x["total_tokens"], 
-        reverse=True
-    )
-    
-    for session in sorted_sessions:
-        avg_tokens = session["total_tokens"] // session["conversation_count"] if session["conversation_count"] > 0 else 0
-        
-        table.add_row(
-            session["session_id"][:20] + "..." if len(session["session_id"]) > 20 else session["session_id"],
-            f"{session['conversation_count']:,}",
-            f"{session['total_tokens']:,}",
-            f"{session['user_tokens']:,}",
-            f"{session['assistant_tokens']:,}",
-            f"{avg_tokens:,}"
-        )
-    
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+
+        table = Table(title="Token Usage by Session")
+        table.add_column("Session ID", style="cyan")
+        table.add_column("Conversations", style="green", justify="right")
+        table.add_column("Total Tokens", style="yellow", justify="right")
+        table.add_column("Prompt Tokens", style="blue", justify="right")
+        table.add_column("History Tokens", style="magenta", justify="right")
+        table.add_column("Avg Tokens/Conv", style="dim", justify="right")
+
+        with store.connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT session_id,
+                       SUM(conversations) AS conversations,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(history_tokens) AS history_tokens
+                FROM usage_daily
+                GROUP BY session_id
+                HAVING SUM(conversations) > 0
+                ORDER BY prompt_tokens + history_tokens DESC
+                LIMIT ?
+                """,
+                (limit,),
+            )
+            for row in cursor:
+                total_tokens = row["prompt_tokens"] + row["history_tokens"]
+                table.add_row(
+                    _short(row["session_id"], 20),
+                    f"{row['conversations']:,}",
+                    f"{total_tokens:,}",
+                    f"{row['prompt_tokens']:,}",
+                    f"{row['history_tokens']:,}",
+                    f"{total_tokens // row['conversations']:,}",
+                )
+
+    if table.row_count == 0:
+        return _no_data()
     console.print(table)
 
 
@@ -301,73 +337,210 @@ def recent_stats(
     days: Optional[int] = typer.Option(7, "--days", "-d", help="Number of days to look back")
 ):
     """Display recent token usage statistics."""
+    days = max(days or 0, 1)
+    since = f"-{days} days"
     console.print(f"[bold blue]📅 Recent Token Usage (Last {days} Days)[/bold blue]\n")
-    
-    data = analyze_conversations()
-    
-    if data["total_conversations"] == 0:
-        console.print("[yellow]No conversations found in memory store.[/yellow]")
-        return
-    
-    recent_conversations = get_recent_conversations(data["conversations"], days or 0)
-    
-    if not recent_conversations:
-        console.print(f"[yellow]No conversations found in the last {days} days.[/yellow]")
-        return
-    
-    # Calculate recent statistics
-    recent_total_tokens = sum(conv["total_tokens"] for conv in recent_conversations)
-    recent_user_tokens = sum(conv["user_tokens"] for conv in recent_conversations)
-    recent_assistant_tokens = sum(conv["assistant_tokens"] for conv in recent_conversations)
-    recent_characters = sum(conv["total_characters"] for conv in recent_conversations)
-    
-    # Create summary
-    summary_text = Text()
-    summary_text.append(f"Recent Conversations: ", style="bold")
-    summary_text.append(f"{len(recent_conversations):,}\n", style="green")
-    summary_text.append(f"Recent Token Estimate: ", style="bold")
-    summary_text.append(f"{recent_total_tokens:,}\n", style="green")
-    summary_text.append(f"Recent Characters: ", style="bold")
-    summary_text.append(f"{recent_characters:,}\n", style="dim")
-    summary_text.append(f"Daily Average: ", style="bold")
-    if days is not None:
-        daily_avg = recent_total_tokens // days if days > 0 else 0
-        summary_text.append(f"{daily_avg:,} tokens/day\n", style="cyan")
-    
-    console.print(Panel(summary_text, title="Recent Activity Summary", box=box.ROUNDED))
-    
-    # Show top recent conversations
-    if recent_conversations:
-        console.print("\n[bold]Top Recent Conversations by Token Usage:[/bold]")
-        
-        table = Table()
-        table.add_column("Session", style="cyan")
-        table.add_column("Tokens", style="green", justify="right")
-        table.add_column("User", style="blue", justify="right")
-        table.add_column("Assistant", style="magenta", justify="right")
-        table.add_column("Date", style="dim")
-        
-        # Sort by token usage (descending) and take top 10
-        top_conversations = sorted(
-            recent_conversations, 
-            key=lambda x: x["total_tokens"], 
-            reverse=True
-        )[:10]
-        
-        for conv in top_conversations:
-            session_short = conv["session_id"][:15] + "..." if len(conv["session_id"]) > 15 else conv["session_id"]
-            date_str = conv.get("created_at", "Unknown")[:10] if conv.get("created_at") else "Unknown"
-            
-            table.add_row(
-                session_short,
-                f"{conv['total_tokens']:,}",
-                f"{conv['user_tokens']:,}",
-                f"{conv['assistant_tokens']:,}",
-                date_str
-            )
-        
-        console.print(table)
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+        with store.connection() as conn:
+            # usage_daily is keyed by day first, so the filters below are range scans of its primary key
+            totals = query_totals(conn, since)
+            if totals["conversations"] == 0:
+                console.print(f"[yellow]No conversations found in the last {days} days.[/yellow]")
+                return
+
+            total_tokens = totals["prompt_tokens"] + totals["history_tokens"]
+            summary_text = Text()
+            summary_text.append("Recent Conversations: ", style="bold")
+            summary_text.append(f"{totals['conversations']:,}\n", style="green")
+            summary_text.append("Recent Token Estimate: ", style="bold")
+            summary_text.append(f"{total_tokens:,}\n", style="green")
+            summary_text.append("Recent Characters: ", style="bold")
+            summary_text.append(f"{totals['characters']:,}\n", style="dim")
+            summary_text.append("Daily Average: ", style="bold")
+            summary_text.append(f"{total_tokens // days:,} tokens/day\n", style="cyan")
+            console.print(Panel(summary_text, title="Recent Activity Summary", box=box.ROUNDED))
+
+            daily = Table(title="Daily Usage")
+            daily.add_column("Date", style="dim")
+            daily.add_column("Conversations", style="green", justify="right")
+            daily.add_column("Tokens", style="yellow", justify="right")
+            for row in conn.execute(
+                """
+                SELECT day, SUM(conversations) AS conversations,
+                       SUM(prompt_tokens + history_tokens) AS tokens
+                FROM usage_daily
+                WHERE day >= date('now', ?)
+                GROUP BY day
+                HAVING SUM(conversations) > 0
+                ORDER BY day DESC
+                """,
+                (since,),
+            ):
+                daily.add_row(row["day"], f"{row['conversations']:,}", f"{row['tokens']:,}")
+            console.print(daily)
+
+            console.print("\n[bold]Top Recent Conversations by Token Usage:[/bold]")
+            table = Table()
+            table.add_column("Session", style="cyan")
+            table.add_column("Tokens", style="green", justify="right")
+            table.add_column("Prompt", style="blue", justify="right")
+            table.add_column("History", style="magenta", justify="right")
+            table.add_column("Date", style="dim")
+            for row in conn.execute(
+                """
+                SELECT session_id, MIN(day) AS day,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(history_tokens) AS history_tokens
+                FROM usage_daily
+                WHERE day >= date('now', ?)
+                GROUP BY session_id
+                HAVING SUM(conversations) > 0
+                ORDER BY prompt_tokens + history_tokens DESC
+                LIMIT 10
+                """,
+                (since,),
+            ):
+                table.add_row(
+                    _short(row["session_id"], 15),
+                    f"{row['prompt_tokens'] + row['history_tokens']:,}",
+                    f"{row['prompt_tokens']:,}",
+                    f"{row['history_tokens']:,}",
+                    row["day"],
+                )
+            console.print(table)
+
+
+@app.command("rebuild")
+def rebuild_rollup():
+    """Recompute the daily usage rollup from the stored conversations and node runs."""
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+        rows = store.rebuild_usage_daily()
+    console.print(f"[green]Rebuilt the daily usage rollup with {rows:,} rows.[/green]")
+    console.print("[dim]Totals of days that were already pruned from the store are no longer included.[/dim]")
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    jsonl = "jsonl"
+    parquet = "parquet"
+
+
+class _CsvWriter:
+    def __init__(self, path: Path, columns: list[tuple[str, str]]):
+        self.file = path.open("w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: list[tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonlWriter:
+    def __init__(self, path: Path, columns: list[tuple[str, str]]):
+        self.file = path.open("w", encoding="utf-8")
+        self.names = [name for name, _ in columns]
+
+    def write(self, rows: list[tuple]):
+        self.file.writelines(json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """Writes each batch as its own row group against a fixed schema."""
+
+    def __init__(self, path: Path, columns: list[tuple[str, str]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"text": pa.string(), "int": pa.int64(), "real": pa.float64()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows: list[tuple]):
+        arrays = [self.pa.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_batch(self.pa.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {ExportFormat.csv: _CsvWriter, ExportFormat.jsonl: _JsonlWriter, ExportFormat.parquet: _ParquetWriter}
+
+
+@app.command("export")
+def export_data(
+    format: ExportFormat = typer.Option(ExportFormat.jsonl, "--format", "-f", help="Output file format"),
+    output: Path = typer.Option(Path("propercode-export"), "--output", "-o", help="Directory to write one file per table into"),
+    tables: Optional[list[str]] = typer.Option(None, "--table", "-t", help="Table to export, repeatable (default: all)"),
+    since: Optional[datetime] = typer.Option(None, "--since", formats=["%Y-%m-%d"], help="First day to include"),
+    until: Optional[datetime] = typer.Option(None, "--until", formats=["%Y-%m-%d"], help="Last day to include"),
+    session: Optional[str] = typer.Option(None, "--session", "-s", help="Only export this session"),
+    batch_size: int = typer.Option(5000, "--batch-size", help="Rows fetched and written at a time"),
+):
+    """Stream memory and usage data to CSV, JSONL or Parquet files."""
+    selected = tables or list(MemoryStore.EXPORT_TABLES)
+    unknown = [table for table in selected if table not in MemoryStore.EXPORT_TABLES]
+    if unknown:
+        console.print(f"[red]Unknown table(s): {', '.join(unknown)}. Choose from {', '.join(MemoryStore.EXPORT_TABLES)}.[/red]")
+        raise typer.Exit(code=1)
+    skipped = []
+    if session:
+        # aggregate tables aren't kept per session, a named one is an error and the rest are left out
+        without_sessions = [table for table in selected if not MemoryStore.has_sessions(table)]
+        if tables and without_sessions:
+            console.print(f"[red]--session can't filter {', '.join(without_sessions)}, these tables aren't kept per session.[/red]")
+            raise typer.Exit(code=1)
+        skipped = without_sessions
+        selected = [table for table in selected if table not in without_sessions]
+    if format is ExportFormat.parquet:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            console.print("[red]Parquet export needs pyarrow, install the 'export' extra.[/red]")
+            raise typer.Exit(code=1)
+
+    with open_store() as store:
+        if store is None:
+            return _no_data()
+        output.mkdir(parents=True, exist_ok=True)
+
+        summary = Table(title="Exported Tables")
+        summary.add_column("Table", style="cyan")
+        summary.add_column("Rows", style="green", justify="right")
+        summary.add_column("File", style="dim")
+        for table in selected:
+            path = output / f"{table}.{format.value}"
+            writer = WRITERS[format](path, MemoryStore.EXPORT_TABLES[table][1])
+            rows = 0
+            try:
+                for batch in store.export_rows(
+                    table,
+                    since=since.date().isoformat() if since else None,
+                    until=until.date().isoformat() if until else None,
+                    session_id=session,
+                    batch_size=batch_size,
+                ):
+                    writer.write(batch)
+                    rows += len(batch)
+            finally:
+                writer.close()
+            summary.add_row(table, f"{rows:,}", str(path))
+
+    console.print(summary)
+    if skipped:
+        console.print(f"[dim]Skipped {', '.join(skipped)}, not kept per session so --session can't filter them.[/dim]")
 
 
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    app()
@@ -1,4 +1,4 @@
-from typing import Optional,Dict,Any
+from typing import Optional,Dict,Any,Literal
 from pydantic import BaseModel,Field
 
 class SearchMemoryToolInput(BaseModel):
@@ -8,6 +8,7 @@ class SearchMemoryToolInput(BaseModel):
     query:str = Field(...,description="The text query to search for in the memory content")
     limit:int = Field(default=3,description="The max number of memories to return")
     memory_type:Optional[str] = Field(default="sumary",description="Filter by memory like 'summary' or 'fact'")
+    mode:Literal["lexical","semantic","hybrid"] = Field(default="hybrid",description="Full-text ranking, embedding similarity or both fused together")
 
 class WriteMemoryToolInput(BaseModel):
     '''
@@ -16,4 +17,19 @@ class WriteMemoryToolInput(BaseModel):
     session_id: str = Field(...,description="The unique ID of the current session")
     content: str = Field(...,description="The information or content to be store")
     memory_type:str = Field(default="summary",description="The type of memory being stored, e.g., 'summary' or 'fact'")
-    metadata: Optional[Dict[str,Any]] = Field(default=None,description="Optional JSON metadata")
\ No newline at end of file
+    metadata: Optional[Dict[str,Any]] = Field(default=None,description="Optional JSON metadata")
+
+class MaintenanceReport(BaseModel):
+    '''
+    Outcome of one pruning and maintenance pass over the memory database
+    '''
+    deleted_rows: int = Field(default=0,description="Rows removed by pruning, cascaded rows excluded")
+    merged_memories: int = Field(default=0,description="Near-duplicate memories folded into an earlier copy")
+    counted_histories: int = Field(default=0,description="Older conversations whose token counts were filled in")
+    compacted_vectors: bool = Field(default=False,description="Whether stale rows were dropped from the embedding matrix")
+    prune_seconds: float = Field(default=0.0,description="Wall time spent pruning and consolidating")
+    vacuum_seconds: float = Field(default=0.0,description="Wall time spent returning free pages")
+    analyzed: bool = Field(default=False,description="Whether planner statistics were refreshed")
+    analyze_seconds: float = Field(default=0.0,description="Wall time spent on ANALYZE")
+    before: Dict[str,Any] = Field(default_factory=dict,description="Database stats before maintenance")
+    after: Dict[str,Any] = Field(default_factory=dict,description="Database stats after maintenance")
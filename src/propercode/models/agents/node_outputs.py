@@ -8,6 +8,7 @@ class ContextNodeOutput(BaseModel):
     '''
     thought: str = Field(...,description="A detailed explanation of which files were chosen to be read and why they are relevant to the user's request.")
     context: str = Field(...,description="The final, consolidated context string, including the file tree and the content of any files that were read.")
+    files: List[str] = Field(default_factory=list,description="Paths of the project files relevant to the request, most relevant first. Their most relevant parts are added to the context for the later steps.")
 
 class PlanNodeOutput(BaseModel):
     '''
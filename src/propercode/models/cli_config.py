@@ -8,3 +8,5 @@ class CLISettings(BaseModel):
     default_provider: Optional[str] = Field(default="openrouter",description="Default LLM provider like OpenAI etc")
     default_model: Optional[str] = Field(default="minimax/minimax-m2:free",description="the default LLM model to use")
     verbose: bool = Field(default=False,description="Enable verbose logging for debugging purpose")
+    memory_pool_size: int = Field(default=4,ge=1,description="Max number of pooled connections to the memory database")
+    context_token_budget: int = Field(default=6000,ge=256,description="Tokens of project context packed into the plan, code and evaluation prompts")